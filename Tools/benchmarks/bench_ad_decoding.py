@@ -0,0 +1,136 @@
+# مقارنة سرعة تحويل نتائج LDAP: كائنات Entry في ldap3 مقابل التحويل الخام المباشر
+"""
+Compares rows/sec of the two ways of turning an AD search result into listing records:
+
+  entry  - the previous path: conn.entries (ldap3 Entry objects) read through
+           entry.X.value with str() per attribute and FILETIME converted by hand
+  raw    - the current path: the raw_attributes of the response decoded with the
+           precomputed converters of COMPUTER_DECODER / USER_DECODER
+
+Both paths decode the same response of an ldap3 MOCK_SYNC search against an
+offline AD schema, so no domain controller is needed. DNS resolution of computer
+names is not part of either measurement.
+
+Usage (from the repository root):
+    python -m Tools.benchmarks.bench_ad_decoding [rows]
+"""
+import sys
+import time
+import uuid
+import random
+from datetime import datetime, timezone, timedelta
+
+from ldap3 import Server, Connection, MOCK_SYNC, OFFLINE_AD_2012_R2
+
+from Tools.routes.activedirectory import (
+    COMPUTER_DECODER, USER_DECODER, COMPUTER_ATTRIBUTES, USER_ATTRIBUTES,
+    COMPUTER_FILTER, USER_FILTER, format_datetime,
+)
+
+BASE_DN = "DC=bench,DC=local"
+ADMIN_DN = f"CN=admin,{BASE_DN}"
+
+
+def _filetime(days_ago):
+    moment = datetime.now(timezone.utc) - timedelta(days=days_ago)
+    return int((moment - datetime(1601, 1, 1, tzinfo=timezone.utc)).total_seconds() * 10_000_000)
+
+
+def build_directory(rows):
+    server = Server("bench-dc", get_info=OFFLINE_AD_2012_R2)
+    conn = Connection(server, user=ADMIN_DN, password="bench", client_strategy=MOCK_SYNC)
+    conn.strategy.add_entry(ADMIN_DN, {"userPassword": "bench", "sn": "admin"})
+    for i in range(rows):
+        dn = f"CN=PC{i:05d},OU=Workstations,{BASE_DN}"
+        conn.strategy.add_entry(dn, {
+            "objectClass": ["top", "person", "organizationalPerson", "user", "computer"],
+            "objectCategory": "computer", "name": f"PC{i:05d}", "distinguishedName": dn,
+            "dNSHostName": f"pc{i:05d}.bench.local", "operatingSystem": "Windows 11 Enterprise",
+            "lastLogonTimestamp": _filetime(random.randint(0, 365)), "whenCreated": "20230105093000.0Z",
+            "userAccountControl": random.choice([4096, 4098]), "objectGUID": uuid.uuid4().bytes_le,
+        })
+        dn = f"CN=User {i:05d},OU=Staff,{BASE_DN}"
+        conn.strategy.add_entry(dn, {
+            "objectClass": ["top", "person", "organizationalPerson", "user"],
+            "objectCategory": "person", "sAMAccountName": f"user{i:05d}", "displayName": f"User {i:05d}",
+            "userPrincipalName": f"user{i:05d}@bench.local", "distinguishedName": dn,
+            "lastLogonTimestamp": _filetime(random.randint(0, 365)), "whenCreated": "20230105093000.0Z",
+            "userAccountControl": random.choice([512, 514]), "objectGUID": uuid.uuid4().bytes_le,
+        })
+    conn.bind()
+    return conn
+
+
+def _entry_last_logon(value):
+    # The conversion the Entry-based listing did for lastLogonTimestamp
+    if isinstance(value, datetime):
+        return format_datetime(value)
+    if isinstance(value, (int, float)) and int(value) > 0:
+        return format_datetime(datetime(1601, 1, 1, tzinfo=timezone.utc) + timedelta(microseconds=int(value) / 10))
+    return "Never"
+
+
+def entry_computers(conn):
+    conn._entries = []
+    return [{
+        "name": str(entry.name.value),
+        "dns_hostname": str(entry.dNSHostName.value) if entry.dNSHostName.value else "",
+        "os": str(entry.operatingSystem.value) if entry.operatingSystem.value else "",
+        "enabled": not ((entry.userAccountControl.value or 0) & 2),
+        "last_logon": _entry_last_logon(entry.lastLogonTimestamp.value),
+        "created": format_datetime(entry.whenCreated.value),
+        "dn": str(entry.distinguishedName.value),
+    } for entry in conn.entries]
+
+
+def entry_users(conn):
+    conn._entries = []
+    return [{
+        "username": str(entry.sAMAccountName.value),
+        "display_name": str(entry.displayName.value) if entry.displayName.value else "",
+        "email": str(entry.userPrincipalName.value) if entry.userPrincipalName.value else "",
+        "enabled": not ((entry.userAccountControl.value or 0) & 2),
+        "last_logon": _entry_last_logon(entry.lastLogonTimestamp.value),
+        "created": format_datetime(entry.whenCreated.value),
+        "dn": str(entry.distinguishedName.value),
+    } for entry in conn.entries]
+
+
+def raw_records(conn, decoder):
+    decode = decoder.decode
+    return [decode(item["raw_attributes"]) for item in conn.response if item.get("type") == "searchResEntry"]
+
+
+def measure(label, func, rows, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    print(f"  {label:<8} {rows / best:>12,.0f} rows/sec  ({best * 1000:.1f} ms)")
+    return rows / best
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 30000
+    print(f"Building a mock directory with {rows} computers and {rows} users...")
+    conn = build_directory(rows)
+
+    for kind, search_filter, attributes, entry_path, decoder in (
+        ("computers", COMPUTER_FILTER, COMPUTER_ATTRIBUTES, entry_computers, COMPUTER_DECODER),
+        ("users", USER_FILTER, USER_ATTRIBUTES, entry_users, USER_DECODER),
+    ):
+        conn.search(BASE_DN, search_filter, attributes=attributes)
+        found = len(conn.response)
+        # Same values from both paths, apart from the missing keys the raw path adds
+        sample_entry, sample_raw = entry_path(conn)[0], raw_records(conn, decoder)[0]
+        assert all(sample_raw[key] == value for key, value in sample_entry.items()), (sample_entry, sample_raw)
+
+        print(f"{kind} ({found} rows):")
+        entry_rate = measure("entry", lambda: entry_path(conn), found)
+        raw_rate = measure("raw", lambda: raw_records(conn, decoder), found)
+        print(f"  speedup  {raw_rate / entry_rate:>12.1f}x")
+
+
+if __name__ == "__main__":
+    main()
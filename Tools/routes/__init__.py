@@ -7,6 +7,9 @@ from .auth import auth_bp
 from .activedirectory import ad_bp
 from .logs import logs_bp
 from .settings import settings_bp
+from .ipam import ipam_bp
+from .search import search_bp
+from .agent import agent_bp
 import os
 
 def create_app():
@@ -19,6 +22,9 @@ def create_app():
     app.register_blueprint(ad_bp)
     app.register_blueprint(logs_bp)
     app.register_blueprint(settings_bp)
+    app.register_blueprint(ipam_bp)
+    app.register_blueprint(search_bp)
+    app.register_blueprint(agent_bp)
 
     @app.route("/")
     def index():
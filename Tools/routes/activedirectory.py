@@ -1,8 +1,21 @@
 # دوال التعامل مع Active Directory باستخدام ldap3
-from flask import Blueprint, request, jsonify, session
-from datetime import datetime, timezone
+from flask import Blueprint, request, jsonify, session, Response, stream_with_context
+from datetime import datetime
 from Tools.utils.logger import logger
+from Tools.utils.ipam import ipam_store
+from Tools.utils.ldap_pool import ldap_pool, paged_search
+from Tools.utils.dc_locator import dc_locator
+from Tools.utils.ad_replica import ad_replicas
+from Tools.utils.ad_query import parse_list_query, compile_ldap_query, apply_list_query, project_record
+from Tools.utils.ou_tree import OuCounts, build_ou_tree
+from Tools.utils.search_index import search_index
+from Tools.utils.admin_check import sid_to_str
+from Tools.utils.ldap_decode import RecordDecoder, decode_str, decode_enabled, filetime_epoch, filetime_display, generalized_time_display
+import ipaddress
+import threading
+import json
 import socket
+import time
 
 # We will use ldap3 which is cross-platform
 # We will attempt the import within the routes themselves to ensure
@@ -33,7 +46,8 @@ def format_datetime(dt_obj):
 
 def get_ldap_connection():
     """
-    Establishes and binds an LDAP connection using credentials from the session.
+    Returns a bound LDAP connection from the per-user pool using credentials from the session.
+    Callers must hand it back with release_ldap_connection() when they are done.
     Returns (Connection object, error_dict, http_status_code).
     """
     ldap3_ok, ldap3_error = check_ldap3_availability()
@@ -44,125 +58,426 @@ def get_ldap_connection():
         logger.warning("get_ldap_connection failed: Authentication required.")
         return None, {'ok': False, 'error': 'Authentication required. Please log in first.', 'error_code': 'AUTH_REQUIRED'}, 401
 
-    from ldap3 import Server, Connection, ALL, SIMPLE, Tls, AUTO_BIND_TLS_BEFORE_BIND
-    import ssl
-
     user_principal_name = session.get("email")
     password = session.get("password")
     domain = session.get("domain")
     
-    logger.info(f"Attempting LDAP connection to domain '{domain}' with user '{user_principal_name}'.")
-    
-    # Let ldap3 discover the server from the domain
-    try:
-        server = Server(domain, get_info=ALL, use_ssl=True)
-        conn = Connection(server, user=user_principal_name, password=password, authentication=SIMPLE, auto_bind=True)
-        if conn.bound:
-            logger.info(f"LDAP connection with SSL successful to {server.host}.")
-            return conn, None, 200
-        else:
-             logger.warning(f"LDAP connection with SSL to {server.host} failed. Trying without SSL.")
-    except Exception as e:
-        logger.warning(f"LDAP connection with SSL failed: {e}. Trying without SSL.")
+    logger.info(f"Acquiring LDAP connection to domain '{domain}' for user '{user_principal_name}'.")
 
-    # Fallback to non-SSL
-    try:
-        server = Server(domain, get_info=ALL)
-        conn = Connection(server, user=user_principal_name, password=password, authentication=SIMPLE, auto_bind=True)
-        if conn.bound:
-            logger.info(f"LDAP connection without SSL successful to {server.host}.")
-            return conn, None, 200
-    except Exception as e:
-        last_error = str(e)
-        logger.error(f"LDAP bind failed for domain '{domain}'. Last error: {last_error}")
-        return None, {
-            'ok': False,
-            'error': 'LDAP Connection Failed',
-            'message': f"Could not bind to the domain '{domain}'. Please check credentials and domain controller connectivity.",
-            'details': f"Last encountered error: {last_error or 'No specific error message was captured.'}",
-            'error_code': 'LDAP_BIND_FAILED'
-        }, 401
-    
-    # If both failed
-    logger.error(f"All LDAP connection attempts failed for domain '{domain}'.")
-    return None, { 'ok': False, 'error': 'LDAP Connection Failed', 'message': f"Could not bind to '{domain}' with or without SSL.", 'error_code': 'LDAP_BIND_FAILED' }, 401
+    # Pooled connections are reused across requests; a new bind only happens when none is idle
+    conn, last_error = ldap_pool.acquire(domain, user_principal_name, password)
+    if conn:
+        return conn, None, 200
 
+    logger.error(f"LDAP bind failed for domain '{domain}'. Last error: {last_error}")
+    return None, {
+        'ok': False,
+        'error': 'LDAP Connection Failed',
+        'message': f"Could not bind to the domain '{domain}'. Please check credentials and domain controller connectivity.",
+        'details': f"Last encountered error: {last_error or 'No specific error message was captured.'}",
+        'error_code': 'LDAP_BIND_FAILED'
+    }, 401
 
-def _get_ad_computers_data():
+
+def release_ldap_connection(conn):
+    """Returns a connection obtained from get_ldap_connection() to the pool."""
+    ldap_pool.release(conn)
+
+
+COMPUTER_FILTER = "(objectCategory=computer)"
+USER_FILTER = "(&(objectCategory=person)(objectClass=user))"
+GROUP_FILTER = "(objectCategory=group)"
+OU_FILTER = "(objectCategory=organizationalUnit)"
+
+# The ACCOUNTDISABLE flag in userAccountControl
+ACCOUNT_DISABLE = 0x0002
+
+
+def _attr_value(attributes, name):
+    """Returns a single attribute value from a search result entry, or None if it is empty."""
+    value = attributes.get(name)
+    if isinstance(value, list):
+        return value[0] if value else None
+    return value
+
+
+def _attr_str(attributes, name):
+    value = _attr_value(attributes, name)
+    return str(value) if value else ""
+
+
+def _get_base_dn(conn):
+    return conn.server.info.other.get('defaultNamingContext')[0]
+
+
+# Precomputed converters from raw attribute values to listing fields; decoding the raw
+# response directly is much cheaper than building ldap3 Entry objects or letting ldap3
+# format every value (see Tools/benchmarks/bench_ad_decoding.py).
+COMPUTER_DECODER = RecordDecoder([
+    ("name", "name", decode_str, ""),
+    ("dns_hostname", "dNSHostName", decode_str, ""),
+    ("os", "operatingSystem", decode_str, ""),
+    ("enabled", "userAccountControl", decode_enabled, True),
+    ("last_logon", "lastLogonTimestamp", filetime_display, "Never"),
+    ("last_logon_ts", "lastLogonTimestamp", filetime_epoch, None),
+    ("created", "whenCreated", generalized_time_display, "Never"),
+    ("dn", "distinguishedName", decode_str, ""),
+])
+USER_DECODER = RecordDecoder([
+    ("username", "sAMAccountName", decode_str, ""),
+    ("display_name", "displayName", decode_str, ""),
+    ("email", "userPrincipalName", decode_str, ""),
+    ("enabled", "userAccountControl", decode_enabled, True),
+    ("last_logon", "lastLogonTimestamp", filetime_display, "Never"),
+    ("last_logon_ts", "lastLogonTimestamp", filetime_epoch, None),
+    ("created", "whenCreated", generalized_time_display, "Never"),
+    ("dn", "distinguishedName", decode_str, ""),
+])
+GROUP_DECODER = RecordDecoder([
+    ("name", "sAMAccountName", decode_str, ""),
+    ("description", "description", decode_str, ""),
+    ("created", "whenCreated", generalized_time_display, "Never"),
+    ("dn", "distinguishedName", decode_str, ""),
+])
+OU_DECODER = RecordDecoder([
+    ("name", "ou", decode_str, ""),
+    ("path", "distinguishedName", decode_str, ""),
+    ("created", "whenCreated", generalized_time_display, "Never"),
+])
+
+COMPUTER_ATTRIBUTES = COMPUTER_DECODER.attributes
+USER_ATTRIBUTES = USER_DECODER.attributes
+GROUP_ATTRIBUTES = GROUP_DECODER.attributes
+OU_ATTRIBUTES = OU_DECODER.attributes
+
+
+def _computer_record(entry, user_domain):
+    record = COMPUTER_DECODER.decode(entry["raw_attributes"])
+    hostname = record["dns_hostname"]
+    # Try to resolve hostname to IP, but don't fail if it's not possible
+    if hostname:
+        try:
+            record["dns_hostname"] = socket.gethostbyname(hostname)
+        except socket.gaierror:
+            # Keep the hostname for display if resolution fails
+            logger.warning(f"Could not resolve hostname '{hostname}' to an IP address.")
+    # The 'dns_hostname' field holds the IP if resolved, or the hostname if not.
+    # The UI expects ipAddress in this field.
+    record["domain"] = user_domain
+    return record
+
+
+def _user_record(entry, user_domain):
+    record = USER_DECODER.decode(entry["raw_attributes"])
+    record["domain"] = user_domain
+    return record
+
+
+def _group_record(entry):
+    return GROUP_DECODER.decode(entry["raw_attributes"])
+
+
+def _ou_record(entry):
+    return OU_DECODER.decode(entry["raw_attributes"])
+
+
+def _paged_kind_search(conn, label, base_filter, attributes, query=None):
+    """Paged search for one object kind, with the listing query's filters pushed into LDAP."""
+    search_filter, search_base = compile_ldap_query(base_filter, _get_base_dn(conn), query)
+    logger.info(f"Paged search of AD {label} with base DN '{search_base}' and filter '{search_filter}'.")
+    return paged_search(conn, search_base, search_filter, attributes)
+
+
+def _iter_ad_computers(conn, user_domain, query=None):
+    for entry in _paged_kind_search(conn, "computers", COMPUTER_FILTER, COMPUTER_ATTRIBUTES, query):
+        yield _computer_record(entry, user_domain)
+
+
+def _iter_ad_users(conn, user_domain, query=None):
+    for entry in _paged_kind_search(conn, "users", USER_FILTER, USER_ATTRIBUTES, query):
+        yield _user_record(entry, user_domain)
+
+
+def _iter_ad_groups(conn, user_domain=None, query=None):
+    for entry in _paged_kind_search(conn, "groups", GROUP_FILTER, GROUP_ATTRIBUTES, query):
+        yield _group_record(entry)
+
+
+def _iter_ad_ous(conn, user_domain=None, query=None):
+    for entry in _paged_kind_search(conn, "OUs", OU_FILTER, OU_ATTRIBUTES, query):
+        yield _ou_record(entry)
+
+
+def _collect_ad_objects(kind, result_key, iterate, query=None):
     """
-    Internal function that fetches all computer objects from Active Directory
-    and returns a Python dictionary. It does not return a Flask response.
+    Runs one of the _iter_ad_* generators to completion on a pooled connection and
+    returns a Python dictionary (not a Flask response). An optional listing query
+    is filtered by LDAP, then sorted, paged and projected here.
     """
-    logger.info("Fetching computer data from Active Directory.")
     conn, error, status = get_ldap_connection()
     if error:
         return error
 
     try:
-        base_dn = conn.server.info.other.get('defaultNamingContext')[0]
-        user_domain = session.get("domain", "Unknown")
-        
-        search_filter = "(objectCategory=computer)"
-        attributes = ["name", "dNSHostName", "operatingSystem", "lastLogonTimestamp", "whenCreated", "distinguishedName"]
-        
-        logger.info(f"Searching AD with base DN '{base_dn}' and filter '{search_filter}'.")
-        conn.search(search_base=base_dn,
-                    search_filter=search_filter,
-                    attributes=attributes)
-        
-        computers_list = []
-        for entry in conn.entries:
-            last_logon_timestamp = entry.lastLogonTimestamp.value
-            last_logon_dt = None
-
-            # Correctly handle lastLogonTimestamp which can be a datetime object or a numeric value
-            if isinstance(last_logon_timestamp, datetime):
-                last_logon_dt = last_logon_timestamp
-            elif isinstance(last_logon_timestamp, (int, float)) and int(last_logon_timestamp) > 0:
-                try:
-                    # Value is in 100-nanosecond intervals since Jan 1, 1601
-                    last_logon_dt = datetime(1601, 1, 1, tzinfo=timezone.utc) + datetime.timedelta(microseconds=int(last_logon_timestamp) / 10)
-                except Exception:
-                    last_logon_dt = None # Reset on error
-            
-            hostname = str(entry.dNSHostName.value) if entry.dNSHostName.value else ""
-            ip_address = ""
-            # Try to resolve hostname to IP, but don't fail if it's not possible
-            if hostname:
-                try:
-                    ip_address = socket.gethostbyname(hostname)
-                except socket.gaierror:
-                    logger.warning(f"Could not resolve hostname '{hostname}' to an IP address.")
-                    ip_address = hostname # fallback to hostname for display if resolution fails
-            
-            # The 'dns_hostname' field will now hold the IP if resolved, or the hostname if not.
-            # The UI expects ipAddress in this field.
-            computers_list.append({
-                "name": str(entry.name.value) if entry.name.value else "",
-                "dns_hostname": ip_address,
-                "os": str(entry.operatingSystem.value) if entry.operatingSystem.value else "",
-                "last_logon": format_datetime(last_logon_dt),
-                "created": format_datetime(entry.whenCreated.value),
-                "domain": user_domain,
-                "dn": str(entry.distinguishedName.value) if entry.distinguishedName.value else ""
-            })
-        
-        logger.info(f"Found {len(computers_list)} computer objects in AD.")
-        return {"ok": True, "computers": computers_list}
+        records = list(iterate(conn, session.get("domain", "Unknown"), query))
+        logger.info(f"Found {len(records)} {kind} objects in AD.")
+        if query is None:
+            return {"ok": True, result_key: records}
+        records, paging = apply_list_query(records, query, filtered=True)
+        return {"ok": True, result_key: records, "paging": paging}
 
     except Exception as e:
-        logger.error(f"Unexpected error during AD computer query: {e}", exc_info=True)
+        logger.error(f"Unexpected error during AD {kind} query: {e}", exc_info=True)
         return {
             "ok": False, 
             "error": "Unexpected LDAP Query Error",
-            "message": "An unexpected error occurred during the Active Directory computer query.",
+            "message": f"An unexpected error occurred during the Active Directory {kind} query.",
             "error_code": "AD_QUERY_UNEXPECTED_ERROR",
             "details": str(e)
         }
     finally:
-        if conn:
-            conn.unbind()
-            logger.info("LDAP connection unbound.")
+        release_ldap_connection(conn)
+
+
+def _requested_stream_format(data):
+    """Returns 'ndjson', 'json' or None depending on the request body / Accept header."""
+    stream = (data or {}).get("stream")
+    if stream in ("ndjson", "json"):
+        return stream
+    if stream is True:
+        return "json"
+    if "application/x-ndjson" in request.headers.get("Accept", ""):
+        return "ndjson"
+    return None
+
+
+def _stream_ad_objects(kind, result_key, iterate, stream_format, query=None):
+    """
+    Streams AD objects straight from the paged search to the client, either as one
+    JSON document ({"<result_key>": [...], "ok": true}) or as NDJSON lines followed by
+    a {"ok": true, "done": true, "count": n} trailer. Filters and fields of the listing
+    query apply; sorting and paging do not, records arrive in directory order. The pooled connection is
+    released when the stream ends or the client disconnects.
+    """
+    conn, error, status = get_ldap_connection()
+    if error:
+        return jsonify(error), status
+    user_domain = session.get("domain", "Unknown")
+
+    def generate():
+        count = 0
+        try:
+            if stream_format == "json":
+                yield '{"%s": [' % result_key
+            for record in iterate(conn, user_domain, query):
+                record = project_record(record, query)
+                if stream_format == "json":
+                    yield ("," if count else "") + json.dumps(record)
+                else:
+                    yield json.dumps(record) + "\n"
+                count += 1
+            logger.info(f"Streamed {count} {kind} objects from AD.")
+            if stream_format == "json":
+                yield '], "ok": true, "count": %d}' % count
+            else:
+                yield json.dumps({"ok": True, "done": True, "count": count}) + "\n"
+        except Exception as e:
+            logger.error(f"Unexpected error while streaming AD {kind} objects: {e}", exc_info=True)
+            failure = {"ok": False, "error": "Unexpected LDAP Query Error", "error_code": "AD_QUERY_UNEXPECTED_ERROR", "details": str(e), "count": count}
+            if stream_format == "json":
+                yield '], ' + json.dumps(failure)[1:]
+            else:
+                yield json.dumps(failure) + "\n"
+        finally:
+            release_ldap_connection(conn)
+
+    mimetype = "application/json" if stream_format == "json" else "application/x-ndjson"
+    return Response(stream_with_context(generate()), mimetype=mimetype)
+
+
+# What the background AD replica keeps in memory, keyed like the listing responses
+AD_REPLICA_KINDS = {
+    "computers": {"filter": COMPUTER_FILTER, "attributes": COMPUTER_ATTRIBUTES,
+                  "build": _computer_record},
+    "users": {"filter": USER_FILTER, "attributes": USER_ATTRIBUTES,
+              "build": _user_record},
+    "groups": {"filter": GROUP_FILTER, "attributes": GROUP_ATTRIBUTES,
+               "build": lambda entry, domain: _group_record(entry)},
+    "ous": {"filter": OU_FILTER, "attributes": OU_ATTRIBUTES,
+            "build": lambda entry, domain: _ou_record(entry)},
+}
+ad_replicas.configure(AD_REPLICA_KINDS)
+
+# Search document type and searchable fields per replica kind
+SEARCH_DOCUMENTS = {
+    "computers": ("computer", "name", "os", ("name", "dns_hostname")),
+    "users": ("user", "display_name", "email", ("username", "display_name", "email")),
+    "groups": ("group", "name", "description", ("name",)),
+    "ous": ("ou", "name", "path", ("name",)),
+}
+
+
+def _index_replica_change(kind, guid, record):
+    """Keeps the global search index in step with the AD replica."""
+    doc_type, title_field, subtitle_field, term_fields = SEARCH_DOCUMENTS[kind]
+    if record is None:
+        search_index.remove(doc_type, guid)
+        return
+    search_index.upsert({
+        "type": doc_type,
+        "id": guid,
+        "title": record.get(title_field) or record.get("username") or record.get("name"),
+        "subtitle": record.get(subtitle_field),
+        "terms": [record.get(field) for field in term_fields],
+        "data": record,
+    })
+
+
+ad_replicas.add_listener(_index_replica_change)
+
+
+def get_session_replica():
+    """
+    Registers the session's credentials with the AD replica of its domain (starting
+    the background sync on first use) and returns the replica, or None when not logged in.
+    The replica may not be ready yet; callers fall back to a live query in that case.
+    """
+    if 'email' not in session or 'password' not in session or 'domain' not in session:
+        return None
+    return ad_replicas.register(session['domain'], session['email'], session['password'])
+
+
+def request_replica_sync():
+    """Asks the replica of the session's domain to pick up a change we just wrote."""
+    ad_replicas.request_sync(session.get('domain'))
+
+
+def _replica_listing(replica, result_key, since, query):
+    """Builds a listing response from the replica, optionally as a delta since a version."""
+    try:
+        since = int(since) if since is not None else None
+    except (TypeError, ValueError):
+        since = None
+    snapshot = replica.snapshot(result_key, since)
+    records, paging = apply_list_query(snapshot["records"], query)
+    return {
+        "ok": True,
+        result_key: records,
+        "paging": paging,
+        "deleted": snapshot["deleted"],
+        "delta": snapshot["delta"],
+        "version": snapshot["version"],
+        "source": "replica",
+        "stale": replica.is_stale(ad_replicas.sync_interval()),
+        "synced_at": format_datetime(datetime.fromtimestamp(replica.synced_at)) if replica.synced_at else "Never",
+        "sync_error": replica.last_error,
+    }
+
+
+def _list_ad_objects(kind, result_key, iterate):
+    """
+    Shared body of the listing endpoints. Requests are answered from the AD replica
+    once it has synced, with "since": <version> returning only the changes after it.
+    "live": true, or a "stream" request, goes straight to the domain controller.
+    Options may come from the JSON body or the query string:
+      filter: {"enabled", "os", "ou", "stale_since", "name"} (or the same keys at top level),
+      sort: "name,-last_logon", fields: "name,os", page + page_size or cursor.
+    """
+    data = {**request.args.to_dict(), **(request.get_json(silent=True) or {})}
+    try:
+        query = parse_list_query(data, result_key)
+    except ValueError as e:
+        return jsonify({"ok": False, "error": "Invalid query", "message": str(e), "error_code": "INVALID_QUERY"}), 400
+
+    stream_format = _requested_stream_format(data)
+    if stream_format:
+        return _stream_ad_objects(kind, result_key, iterate, stream_format, query)
+
+    replica = get_session_replica()
+    live = str(data.get("live", "")).lower() in ("1", "true", "yes")
+    if replica is not None and replica.ready and not live:
+        return jsonify(_replica_listing(replica, result_key, data.get("since"), query)), 200
+
+    result = _collect_ad_objects(kind, result_key, iterate, query)
+    status_code = 401 if result.get("error_code") == 'AUTH_REQUIRED' else 500 if not result.get("ok") else 200
+    return jsonify(result), status_code
+
+
+def _get_ad_computers_data():
+    """
+    Internal function that fetches all computer objects from Active Directory
+    and returns a Python dictionary. It does not return a Flask response.
+    """
+    logger.info("Fetching computer data from Active Directory.")
+    return _collect_ad_objects("computer", "computers", _iter_ad_computers)
+
+
+# The AD computer list is cached briefly so that repeated discovery scans
+# can tag hosts without querying the domain controller every time.
+AD_COMPUTER_INDEX_TTL_SECONDS = 120
+_ad_computer_index_cache = {}
+_ad_computer_index_lock = threading.Lock()
+
+
+def _build_ad_computer_index(computers):
+    """Indexes AD computers by resolved IP and by lower-cased name / DNS name."""
+    by_ip = {}
+    by_name = {}
+    for computer in computers:
+        address = computer.get("dns_hostname") or ""
+        try:
+            ipaddress.ip_address(address)
+            by_ip[address] = computer
+        except ValueError:
+            # Resolution failed and the field holds the DNS host name instead
+            if address:
+                by_name[address.lower()] = computer
+        if computer.get("name"):
+            by_name[computer["name"].lower()] = computer
+    return {"by_ip": by_ip, "by_name": by_name}
+
+
+def get_ad_computer_index(force_refresh=False):
+    """
+    Returns (index, error_dict) for the current session's domain.
+    Once the AD replica has synced, the index is rebuilt whenever the replica's
+    version changes; until then it comes from _get_ad_computers_data() at most
+    every AD_COMPUTER_INDEX_TTL_SECONDS.
+    """
+    domain = (session.get("domain") or "").lower()
+    replica = get_session_replica()
+    replica_version = replica.version if replica is not None and replica.ready else None
+    with _ad_computer_index_lock:
+        cached = _ad_computer_index_cache.get(domain)
+        if cached and not force_refresh:
+            if replica_version is not None and cached.get("version") == replica_version:
+                return cached["index"], None
+            if replica_version is None and time.time() - cached["loaded_at"] < AD_COMPUTER_INDEX_TTL_SECONDS:
+                return cached["index"], None
+
+    if replica_version is not None and not force_refresh:
+        computers = replica.records("computers")
+    else:
+        result = _get_ad_computers_data()
+        if not result.get("ok"):
+            return None, result
+        computers = result["computers"]
+
+    index = _build_ad_computer_index(computers)
+    ipam_store.record_ad_computers(computers)
+    with _ad_computer_index_lock:
+        _ad_computer_index_cache[domain] = {"index": index, "loaded_at": time.time(), "version": replica_version}
+    logger.info(f"AD computer index rebuilt for '{domain}': {len(index['by_ip'])} IPs, {len(index['by_name'])} names.")
+    return index, None
+
+
+def match_ad_computer(index, ip, hostname=None):
+    """Finds the AD computer for a discovered host by IP, then by FQDN or short host name."""
+    computer = index["by_ip"].get(ip)
+    if computer or not hostname or hostname in ("Unknown", "Error"):
+        return computer
+    hostname = hostname.lower().rstrip(".")
+    return index["by_name"].get(hostname) or index["by_name"].get(hostname.split(".")[0])
 
 
 @ad_bp.route('/api/ad/get-computers', methods=['POST'])
@@ -170,11 +485,11 @@ def get_ad_computers():
     """
     API endpoint to fetch all computer objects from Active Directory using ldap3.
     This wraps the internal data-fetching function with a JSON response.
+    Served from the AD replica when it is ready ("since" for deltas, "live": true to bypass it).
+    Send "stream": "json" or "ndjson" to stream results live as they are paged in.
     """
     logger.info("Received request for /api/ad/get-computers.")
-    result = _get_ad_computers_data()
-    status_code = 401 if result.get("error_code") == 'AUTH_REQUIRED' else 500 if not result.get("ok") else 200
-    return jsonify(result), status_code
+    return _list_ad_objects("computer", "computers", _iter_ad_computers)
 
 def _get_ad_users_data():
     """
@@ -182,67 +497,18 @@ def _get_ad_users_data():
     and returns a Python dictionary.
     """
     logger.info("Fetching user data from Active Directory.")
-    conn, error, status = get_ldap_connection()
-    if error:
-        return error
-
-    try:
-        base_dn = conn.server.info.other.get('defaultNamingContext')[0]
-        user_domain = session.get("domain", "Unknown")
-        
-        search_filter = "(&(objectCategory=person)(objectClass=user))"
-        attributes = ["sAMAccountName", "displayName", "userPrincipalName", "whenCreated", "userAccountControl", "distinguishedName"]
-        
-        logger.info(f"Searching AD with base DN '{base_dn}' and filter '{search_filter}'.")
-        conn.search(search_base=base_dn,
-                    search_filter=search_filter,
-                    attributes=attributes)
-        
-        users_list = []
-        # The ACCOUNTDISABLE flag in userAccountControl
-        ACCOUNT_DISABLE = 0x0002
-
-        for entry in conn.entries:
-            uac = entry.userAccountControl.value if entry.userAccountControl.value else 0
-            is_enabled = not (uac & ACCOUNT_DISABLE)
-            
-            users_list.append({
-                "username": str(entry.sAMAccountName.value) if entry.sAMAccountName.value else "",
-                "display_name": str(entry.displayName.value) if entry.displayName.value else "",
-                "email": str(entry.userPrincipalName.value) if entry.userPrincipalName.value else "",
-                "enabled": is_enabled,
-                "created": format_datetime(entry.whenCreated.value),
-                "domain": user_domain,
-                "dn": str(entry.distinguishedName.value) if entry.distinguishedName.value else ""
-            })
-        
-        logger.info(f"Found {len(users_list)} user objects in AD.")
-        return {"ok": True, "users": users_list}
-
-    except Exception as e:
-        logger.error(f"Unexpected error during AD user query: {e}", exc_info=True)
-        return {
-            "ok": False, 
-            "error": "Unexpected LDAP Query Error",
-            "message": "An unexpected error occurred during the Active Directory user query.",
-            "error_code": "AD_QUERY_UNEXPECTED_ERROR",
-            "details": str(e)
-        }
-    finally:
-        if conn:
-            conn.unbind()
-            logger.info("LDAP connection unbound after user query.")
+    return _collect_ad_objects("user", "users", _iter_ad_users)
 
 
 @ad_bp.route('/api/ad/get-users', methods=['POST'])
 def get_ad_users():
     """
     API endpoint to fetch all user objects from Active Directory.
+    Served from the AD replica when it is ready ("since" for deltas, "live": true to bypass it).
+    Send "stream": "json" or "ndjson" to stream results live as they are paged in.
     """
     logger.info("Received request for /api/ad/get-users.")
-    result = _get_ad_users_data()
-    status_code = 401 if result.get("error_code") == 'AUTH_REQUIRED' else 500 if not result.get("ok") else 200
-    return jsonify(result), status_code
+    return _list_ad_objects("user", "users", _iter_ad_users)
 
 
 @ad_bp.route('/api/ad/set-user-password', methods=['POST'])
@@ -287,6 +553,7 @@ def set_user_password():
 
         if success:
             logger.info(f'Successfully changed password for user "{target_username}".')
+            request_replica_sync()
             return jsonify({'ok': True, 'message': f'Password for user "{target_username}" has been changed successfully.'})
         else:
             result_text = conn.result.get('description', '').lower()
@@ -319,9 +586,7 @@ def set_user_password():
             "details": str(e)
         }), 500
     finally:
-        if conn:
-            conn.unbind()
-            logger.info("LDAP connection unbound after password operation.")
+        release_ldap_connection(conn)
 
 @ad_bp.route('/api/ad/set-user-status', methods=['POST'])
 def set_user_status():
@@ -376,6 +641,7 @@ def set_user_status():
         if success:
             message = f"Successfully {action}d account for user '{target_username}'."
             logger.info(message)
+            request_replica_sync()
             return jsonify({'ok': True, 'message': message})
         else:
             logger.error(f"Failed to {action} user '{target_username}': {conn.result.get('message')}")
@@ -397,97 +663,127 @@ def set_user_status():
             "details": str(e)
         }), 500
     finally:
-        if conn:
-            conn.unbind()
-            logger.info("LDAP connection unbound after user status operation.")
+        release_ldap_connection(conn)
 
 @ad_bp.route('/api/ad/get-groups', methods=['POST'])
 def get_ad_groups():
     """
     API endpoint to fetch all group objects from Active Directory.
+    Served from the AD replica when it is ready ("since" for deltas, "live": true to bypass it).
+    Send "stream": "json" or "ndjson" to stream results live as they are paged in.
     """
     logger.info("Received request for /api/ad/get-groups.")
-    conn, error, status = get_ldap_connection()
-    if error:
-        return jsonify(error), status
+    return _list_ad_objects("group", "groups", _iter_ad_groups)
 
-    try:
-        base_dn = conn.server.info.other.get('defaultNamingContext')[0]
-        
-        search_filter = "(objectCategory=group)"
-        attributes = ["sAMAccountName", "description", "whenCreated", "member"]
-        
-        logger.info(f"Searching AD for groups with base DN '{base_dn}'.")
-        conn.search(search_base=base_dn, search_filter=search_filter, attributes=attributes)
-        
-        groups_list = []
-        for entry in conn.entries:
-            groups_list.append({
-                "name": str(entry.sAMAccountName.value) if entry.sAMAccountName.value else "",
-                "description": str(entry.description.value) if entry.description.value else "",
-                "created": format_datetime(entry.whenCreated.value),
-            })
-        
-        logger.info(f"Found {len(groups_list)} group objects in AD.")
-        return jsonify({"ok": True, "groups": groups_list}), 200
+# Values of the 'member' attribute are returned in ranges of at most MaxValRange (1500 by default)
+MEMBER_RANGE_STEP = 1500
+# Member DNs resolved per (|(distinguishedName=...)...) search
+MEMBER_RESOLVE_BATCH = 200
+MEMBER_ATTRIBUTES = ["sAMAccountName", "userPrincipalName", "objectClass", "distinguishedName"]
+# LDAP_MATCHING_RULE_IN_CHAIN: walks nested group membership on the DC in one search
+MATCHING_RULE_IN_CHAIN = "1.2.840.113556.1.4.1941"
+
+
+def _iter_member_dns(conn, group_dn):
+    """
+    Yields the member DNs of a group using ranged retrieval (member;range=a-b),
+    so groups larger than MaxValRange are returned completely.
+    """
+    from ldap3 import BASE
+    start = 0
+    while True:
+        conn.search(search_base=group_dn, search_filter="(objectClass=*)", search_scope=BASE,
+                    attributes=[f"member;range={start}-*"])
+        if not conn.response:
+            return
+        raw_attributes = conn.response[0].get("raw_attributes", {})
+        # Small groups answer with a plain 'member' attribute, large ones with 'member;range=<start>-<end>'
+        range_key = next((key for key in raw_attributes if key.lower().startswith("member;range=")), None)
+        key = range_key or next((key for key in raw_attributes if key.lower() == "member"), None)
+        values = raw_attributes.get(key, []) if key else []
+        for value in values:
+            yield value.decode("utf-8") if isinstance(value, (bytes, bytearray)) else str(value)
+        if range_key is None or range_key.endswith("-*") or not values:
+            return
+        start = int(range_key.rsplit("-", 1)[1]) + 1
+
+
+def _member_record(entry):
+    attributes = entry["attributes"]
+    object_classes = [str(value).lower() for value in attributes.get("objectClass") or []]
+    if "computer" in object_classes:
+        member_type = "computer"
+    elif "group" in object_classes:
+        member_type = "group"
+    elif "user" in object_classes:
+        member_type = "user"
+    else:
+        member_type = object_classes[-1] if object_classes else "unknown"
+    return {
+        "username": _attr_str(attributes, "sAMAccountName"),
+        "email": _attr_str(attributes, "userPrincipalName"),
+        "type": member_type,
+        "dn": entry.get("dn") or _attr_str(attributes, "distinguishedName"),
+    }
+
+
+def _resolve_member_dns(conn, base_dn, member_dns):
+    """Resolves member DNs to member records with batched OR-filter searches."""
+    from ldap3.utils.conv import escape_filter_chars
+    members = []
+    for i in range(0, len(member_dns), MEMBER_RESOLVE_BATCH):
+        batch = member_dns[i:i + MEMBER_RESOLVE_BATCH]
+        search_filter = "(|" + "".join(f"(distinguishedName={escape_filter_chars(dn)})" for dn in batch) + ")"
+        members.extend(_member_record(entry) for entry in paged_search(conn, base_dn, search_filter, MEMBER_ATTRIBUTES))
+    return members
+
+
+def _transitive_members(conn, base_dn, group_dn):
+    """Returns every direct and nested member of a group with one in-chain search."""
+    from ldap3.utils.conv import escape_filter_chars
+    search_filter = f"(memberOf:{MATCHING_RULE_IN_CHAIN}:={escape_filter_chars(group_dn)})"
+    return [_member_record(entry) for entry in paged_search(conn, base_dn, search_filter, MEMBER_ATTRIBUTES)]
 
-    except Exception as e:
-        logger.error(f"Unexpected error during AD group query: {e}", exc_info=True)
-        return jsonify({
-            "ok": False, 
-            "error": "Unexpected LDAP Query Error",
-            "message": "An unexpected error occurred during the Active Directory group query.",
-            "error_code": "AD_QUERY_UNEXPECTED_ERROR",
-            "details": str(e)
-        }), 500
-    finally:
-        if conn:
-            conn.unbind()
 
 @ad_bp.route('/api/ad/get-group-members', methods=['POST'])
 def get_group_members():
     """
     API endpoint to fetch members of a specific group.
+    Direct members are read with ranged retrieval and resolved in batches;
+    send "transitive": true to include members of nested groups.
     """
     data = request.get_json() or {}
     group_name = data.get('group_name')
+    transitive = bool(data.get('transitive'))
     if not group_name:
         return jsonify({'ok': False, 'error': 'Group name is required.'}), 400
 
-    logger.info(f"Received request for members of group '{group_name}'.")
+    logger.info(f"Received request for {'transitive' if transitive else 'direct'} members of group '{group_name}'.")
     conn, error, status = get_ldap_connection()
     if error:
         return jsonify(error), status
 
     try:
+        from ldap3.utils.conv import escape_filter_chars
         base_dn = conn.server.info.other.get('defaultNamingContext')[0]
-        search_filter = f"(&(objectCategory=group)(sAMAccountName={group_name}))"
+        search_filter = f"(&(objectCategory=group)(sAMAccountName={escape_filter_chars(group_name)}))"
         
         logger.info(f"Searching for group '{group_name}' to get members.")
-        conn.search(search_base=base_dn, search_filter=search_filter, attributes=['member'])
+        conn.search(search_base=base_dn, search_filter=search_filter, attributes=['distinguishedName'])
 
         if not conn.entries:
             logger.warning(f"Group '{group_name}' not found.")
             return jsonify({'ok': False, 'error': 'Group not found'}), 404
 
-        group_entry = conn.entries[0]
-        member_dns = group_entry.member.values
-
-        members = []
-        if member_dns:
-            # We need to resolve each member DN to a sAMAccountName
-            for member_dn in member_dns:
-                # The search scope is the member's DN itself
-                conn.search(search_base=member_dn, search_filter='(objectClass=*)', search_scope='BASE', attributes=['sAMAccountName', 'userPrincipalName'])
-                if conn.entries:
-                    member_entry = conn.entries[0]
-                    members.append({
-                        "username": str(member_entry.sAMAccountName.value),
-                        "email": str(member_entry.userPrincipalName.value) if member_entry.userPrincipalName.value else ""
-                    })
+        group_dn = conn.entries[0].entry_dn
+
+        if transitive:
+            members = _transitive_members(conn, base_dn, group_dn)
+        else:
+            members = _resolve_member_dns(conn, base_dn, list(_iter_member_dns(conn, group_dn)))
         
         logger.info(f"Found {len(members)} members in group '{group_name}'.")
-        return jsonify({"ok": True, "members": members}), 200
+        return jsonify({"ok": True, "members": members, "transitive": transitive}), 200
 
     except Exception as e:
         logger.error(f"Unexpected error during AD group member query: {e}", exc_info=True)
@@ -499,8 +795,7 @@ def get_group_members():
             "details": str(e)
         }), 500
     finally:
-        if conn:
-            conn.unbind()
+        release_ldap_connection(conn)
 
 @ad_bp.route('/api/ad/modify-group-member', methods=['POST'])
 def modify_group_member():
@@ -549,6 +844,7 @@ def modify_group_member():
             action_past_tense = 'added' if action == 'add' else 'removed'
             message = f"Successfully {action_past_tense} user '{username}' {'to' if action == 'add' else 'from'} group '{group_name}'."
             logger.info(message)
+            request_replica_sync()
             return jsonify({'ok': True, 'message': message})
         else:
             logger.error(f"Failed to {action} member for group '{group_name}': {conn.result.get('message')}")
@@ -570,48 +866,362 @@ def modify_group_member():
             "details": str(e)
         }), 500
     finally:
-        if conn:
-            conn.unbind()
+        release_ldap_connection(conn)
+
+# Limits for the bulk write endpoints
+BULK_MAX_OPERATIONS = 1000
+# Pooled connections used in parallel by one bulk request
+BULK_MAX_WORKERS = 4
+# sAMAccountNames resolved per (|(sAMAccountName=...)...) search
+BULK_RESOLVE_BATCH = 200
+# LDAP result code of adding a member that is already there
+LDAP_ENTRY_ALREADY_EXISTS = 68
+# AD refuses removing a non-member with this code, but also e.g. removing a user from its primary group
+LDAP_UNWILLING_TO_PERFORM = 53
+
+
+def _resolve_accounts(conn, base_dn, category_filter, names, attributes=()):
+    """Resolves sAMAccountNames with batched OR-filter searches. Returns {lower_name: entry}."""
+    from ldap3.utils.conv import escape_filter_chars
+    names = list(dict.fromkeys(name.lower() for name in names if name))
+    found = {}
+    for i in range(0, len(names), BULK_RESOLVE_BATCH):
+        batch = names[i:i + BULK_RESOLVE_BATCH]
+        search_filter = f"(&{category_filter}(|" + "".join(f"(sAMAccountName={escape_filter_chars(name)})" for name in batch) + "))"
+        for entry in paged_search(conn, base_dn, search_filter, ["sAMAccountName", *attributes]):
+            found[_attr_str(entry["attributes"], "sAMAccountName").lower()] = entry
+    return found
+
+
+def _membership(user_entry, group_entry):
+    """
+    Returns (listed, primary) for a user and a group resolved by _resolve_accounts:
+    whether the group is in the user's memberOf and whether it is the user's primary group.
+    """
+    raw_user, raw_group = user_entry["raw_attributes"], group_entry["raw_attributes"]
+    group_dn = group_entry["dn"].lower()
+    listed = any(value.decode("utf-8", "replace").lower() == group_dn for value in raw_user.get("memberOf") or ())
+    primary = False
+    if raw_user.get("primaryGroupID") and raw_group.get("objectSid"):
+        primary = sid_to_str(raw_group["objectSid"][0]).endswith(f"-{int(raw_user['primaryGroupID'][0])}")
+    return listed, primary
+
+
+def _bulk_item_error(index, error, error_code, details=None):
+    result = {"index": index, "ok": False, "error": error, "error_code": error_code}
+    if details:
+        result["details"] = details
+    return result
+
+
+def _run_bulk_jobs(label, jobs):
+    """
+    Runs jobs [(index, job(conn) -> result dict)] on up to BULK_MAX_WORKERS pooled
+    connections of the session user. Each worker binds once (or reuses an idle
+    connection) and applies its share of the modifications over it.
+    """
+    domain, user, password = session['domain'], session['email'], session['password']
+    pending = list(reversed(jobs))
+    pending_lock = threading.Lock()
+    results = {}
+
+    def worker():
+        conn, error = ldap_pool.acquire(domain, user, password)
+        if error:
+            logger.warning(f"Bulk {label}: a worker could not bind: {error}")
+            return
+        try:
+            while True:
+                with pending_lock:
+                    if not pending:
+                        return
+                    index, job = pending.pop()
+                try:
+                    results[index] = job(conn)
+                except Exception as e:
+                    logger.error(f"Bulk {label}: item {index} failed: {e}", exc_info=True)
+                    results[index] = _bulk_item_error(index, "Unexpected Error", "UNEXPECTED_ERROR", str(e))
+        finally:
+            release_ldap_connection(conn)
+
+    workers = [threading.Thread(target=worker, name=f"ad_bulk_{i}", daemon=True) for i in range(min(BULK_MAX_WORKERS, len(jobs)))]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+
+    # Jobs left over because no worker could bind
+    for index, _ in pending:
+        results[index] = _bulk_item_error(index, "LDAP Connection Failed", "LDAP_BIND_FAILED")
+    return results
+
+
+def _bulk_response(label, operations, results):
+    ordered = [results[index] for index in range(len(operations))]
+    succeeded = sum(1 for result in ordered if result.get("ok"))
+    logger.info(f"Bulk {label}: {succeeded} of {len(ordered)} operations succeeded.")
+    if succeeded:
+        request_replica_sync()
+    return jsonify({
+        "ok": True,
+        "results": ordered,
+        "summary": {"total": len(ordered), "succeeded": succeeded, "failed": len(ordered) - succeeded},
+    }), 200
+
+
+def _bulk_prepare(label, required_keys, validate):
+    """
+    Common request handling for the bulk endpoints. Returns (operations, results, conn, base_dn, error_response);
+    results already holds the per-item errors of invalid operations.
+    """
+    data = request.get_json() or {}
+    operations = data.get('operations')
+    if not isinstance(operations, list) or not operations:
+        return None, None, None, None, (jsonify({'ok': False, 'error': 'A non-empty list of operations is required.'}), 400)
+    if len(operations) > BULK_MAX_OPERATIONS:
+        return None, None, None, None, (jsonify({'ok': False, 'error': f'At most {BULK_MAX_OPERATIONS} operations are allowed per request.'}), 400)
+
+    logger.info(f"Received bulk {label} request with {len(operations)} operations.")
+    results = {}
+    for index, operation in enumerate(operations):
+        if not isinstance(operation, dict) or not all(isinstance(operation.get(key), str) and operation.get(key) for key in required_keys) or not validate(operation):
+            results[index] = _bulk_item_error(index, f"Invalid operation. Required: {', '.join(required_keys)}.", "INVALID_OPERATION")
+
+    conn, error, status = get_ldap_connection()
+    if error:
+        return None, None, None, None, (jsonify(error), status)
+    return operations, results, conn, _get_base_dn(conn), None
+
+
+@ad_bp.route('/api/ad/bulk/set-user-status', methods=['POST'])
+def bulk_set_user_status():
+    """
+    Enables or disables many accounts in one request.
+    Body: {"operations": [{"username": ..., "action": "enable" | "disable"}, ...]}
+    """
+    operations, results, conn, base_dn, error_response = _bulk_prepare(
+        "user status", ("username", "action"), lambda op: op.get("action") in ("enable", "disable"))
+    if error_response:
+        return error_response
+
+    try:
+        users = _resolve_accounts(conn, base_dn, USER_FILTER, [op["username"] for i, op in enumerate(operations) if i not in results],
+                                  ["userAccountControl"])
+    except Exception as e:
+        logger.error(f"Bulk user status: resolving users failed: {e}", exc_info=True)
+        return jsonify({"ok": False, "error": "Unexpected LDAP Query Error", "error_code": "AD_QUERY_UNEXPECTED_ERROR", "details": str(e)}), 500
+    finally:
+        release_ldap_connection(conn)
+
+    def make_job(index, username, action, entry):
+        def job(conn):
+            current_uac = _attr_value(entry["attributes"], "userAccountControl") or 0
+            new_uac = current_uac | ACCOUNT_DISABLE if action == "disable" else current_uac & ~ACCOUNT_DISABLE
+            if new_uac == current_uac:
+                return {"index": index, "ok": True, "message": f"User '{username}' is already {action}d."}
+            if conn.modify(entry["dn"], {'userAccountControl': [('MODIFY_REPLACE', [new_uac])]}):
+                return {"index": index, "ok": True, "message": f"Successfully {action}d account for user '{username}'."}
+            return _bulk_item_error(index, f"Failed to {action} the account.", "AD_GENERIC_ERROR", conn.result.get('message'))
+        return job
+
+    jobs = []
+    for index, operation in enumerate(operations):
+        if index in results:
+            continue
+        entry = users.get(operation["username"].lower())
+        if entry is None:
+            results[index] = _bulk_item_error(index, f'User "{operation["username"]}" not found in Active Directory.', "USER_NOT_FOUND")
+        else:
+            jobs.append((index, make_job(index, operation["username"], operation["action"], entry)))
+
+    results.update(_run_bulk_jobs("user status", jobs))
+    return _bulk_response("user status", operations, results)
+
+
+@ad_bp.route('/api/ad/bulk/set-user-password', methods=['POST'])
+def bulk_set_user_password():
+    """
+    Sets the passwords of many accounts in one request.
+    Body: {"operations": [{"username": ..., "new_password": ...}, ...]}
+    """
+    operations, results, conn, base_dn, error_response = _bulk_prepare(
+        "user password", ("username", "new_password"), lambda op: True)
+    if error_response:
+        return error_response
+
+    try:
+        users = _resolve_accounts(conn, base_dn, USER_FILTER, [op["username"] for i, op in enumerate(operations) if i not in results])
+    except Exception as e:
+        logger.error(f"Bulk user password: resolving users failed: {e}", exc_info=True)
+        return jsonify({"ok": False, "error": "Unexpected LDAP Query Error", "error_code": "AD_QUERY_UNEXPECTED_ERROR", "details": str(e)}), 500
+    finally:
+        release_ldap_connection(conn)
+
+    def make_job(index, username, new_password, user_dn):
+        def job(conn):
+            password_value = f'"{new_password}"'.encode('utf-16-le')
+            if conn.modify(user_dn, {'unicodePwd': [('MODIFY_REPLACE', [password_value])]}):
+                return {"index": index, "ok": True, "message": f'Password for user "{username}" has been changed successfully.'}
+            result_text = conn.result.get('description', '').lower()
+            if 'constraint violation' in result_text or 'complexity' in result_text or 'history' in result_text:
+                return _bulk_item_error(index, "Failed to set password due to domain policy.", "AD_INVALID_PASSWORD_POLICY", conn.result.get('message'))
+            return _bulk_item_error(index, "Active Directory Error", "AD_GENERIC_ERROR", conn.result.get('message'))
+        return job
+
+    jobs = []
+    for index, operation in enumerate(operations):
+        if index in results:
+            continue
+        entry = users.get(operation["username"].lower())
+        if entry is None:
+            results[index] = _bulk_item_error(index, f'User "{operation["username"]}" not found in Active Directory.', "USER_NOT_FOUND")
+        else:
+            jobs.append((index, make_job(index, operation["username"], operation["new_password"], entry["dn"])))
+
+    results.update(_run_bulk_jobs("user password", jobs))
+    return _bulk_response("user password", operations, results)
+
+
+@ad_bp.route('/api/ad/bulk/modify-group-members', methods=['POST'])
+def bulk_modify_group_members():
+    """
+    Adds or removes many users to/from groups in one request.
+    Body: {"operations": [{"group_name": ..., "username": ..., "action": "add" | "remove"}, ...]}
+    Adding an existing member or removing a non-member counts as success.
+    """
+    from ldap3 import MODIFY_ADD, MODIFY_DELETE
+    operations, results, conn, base_dn, error_response = _bulk_prepare(
+        "group membership", ("group_name", "username", "action"), lambda op: op.get("action") in ("add", "remove"))
+    if error_response:
+        return error_response
+
+    valid = [op for i, op in enumerate(operations) if i not in results]
+    try:
+        groups = _resolve_accounts(conn, base_dn, GROUP_FILTER, [op["group_name"] for op in valid], ["objectSid"])
+        users = _resolve_accounts(conn, base_dn, USER_FILTER, [op["username"] for op in valid], ["memberOf", "primaryGroupID"])
+    except Exception as e:
+        logger.error(f"Bulk group membership: resolving names failed: {e}", exc_info=True)
+        return jsonify({"ok": False, "error": "Unexpected LDAP Query Error", "error_code": "AD_QUERY_UNEXPECTED_ERROR", "details": str(e)}), 500
+    finally:
+        release_ldap_connection(conn)
+
+    def make_job(index, operation, group, user):
+        def job(conn):
+            action = operation["action"]
+            direction = 'to' if action == 'add' else 'from'
+            if conn.modify(group["dn"], {'member': [(MODIFY_ADD if action == 'add' else MODIFY_DELETE, [user["dn"]])]}):
+                action_past_tense = 'added' if action == 'add' else 'removed'
+                return {"index": index, "ok": True, "message": f"Successfully {action_past_tense} user '{operation['username']}' {direction} group '{operation['group_name']}'."}
+            result_code = conn.result.get('result')
+            if action == 'add' and result_code == LDAP_ENTRY_ALREADY_EXISTS:
+                return {"index": index, "ok": True, "message": f"User '{operation['username']}' is already a member of group '{operation['group_name']}'."}
+            if action == 'remove' and result_code == LDAP_UNWILLING_TO_PERFORM:
+                # Only a confirmed non-member is a no-op; anything else AD refused is a real failure
+                listed, primary = _membership(user, group)
+                if primary:
+                    return _bulk_item_error(index, f"Group '{operation['group_name']}' is the primary group of user '{operation['username']}' and cannot be removed.",
+                                            "AD_PRIMARY_GROUP", conn.result.get('message'))
+                if not listed:
+                    return {"index": index, "ok": True, "message": f"User '{operation['username']}' is not a member of group '{operation['group_name']}'."}
+            return _bulk_item_error(index, f"Failed to {action} the member.", "AD_GENERIC_ERROR", conn.result.get('message'))
+        return job
+
+    jobs = []
+    for index, operation in enumerate(operations):
+        if index in results:
+            continue
+        group = groups.get(operation["group_name"].lower())
+        user = users.get(operation["username"].lower())
+        if group is None:
+            results[index] = _bulk_item_error(index, f'Group "{operation["group_name"]}" not found.', "GROUP_NOT_FOUND")
+        elif user is None:
+            results[index] = _bulk_item_error(index, f'User "{operation["username"]}" not found.', "USER_NOT_FOUND")
+        else:
+            jobs.append((index, make_job(index, operation, group, user)))
+
+    results.update(_run_bulk_jobs("group membership", jobs))
+    return _bulk_response("group membership", operations, results)
 
 @ad_bp.route('/api/ad/get-ous', methods=['POST'])
 def get_ad_ous():
     """
     API endpoint to fetch all Organizational Units (OUs) from Active Directory.
+    Served from the AD replica when it is ready ("since" for deltas, "live": true to bypass it).
+    Send "stream": "json" or "ndjson" to stream results live as they are paged in.
     """
     logger.info("Received request for /api/ad/get-ous.")
+    return _list_ad_objects("OU", "ous", _iter_ad_ous)
+
+@ad_bp.route('/api/ad/domain-controllers', methods=['POST'])
+def get_domain_controllers():
+    """
+    Returns the domain controllers found via SRV records in the order AD calls use them.
+    Send "refresh": true to probe them again right away.
+    """
+    if 'domain' not in session:
+        return jsonify({'ok': False, 'error': 'Authentication required. Please log in.', 'error_code': 'AUTH_REQUIRED'}), 401
+    data = request.get_json(silent=True) or {}
+    try:
+        dcs = dc_locator.get_ranking(session['domain'], force_refresh=bool(data.get('refresh')))
+        return jsonify({"ok": True, "domain_controllers": dcs}), 200
+    except Exception as e:
+        logger.error(f"Domain controller discovery failed: {e}", exc_info=True)
+        return jsonify({
+            "ok": False,
+            "error": "Domain Controller Discovery Error",
+            "message": "An unexpected error occurred while locating domain controllers.",
+            "error_code": "DC_DISCOVERY_FAILED",
+            "details": str(e)
+        }), 500
+
+
+def _live_ou_tree(conn, root=None):
+    """Builds the OU tree straight from the DC: OUs plus the DNs of all computers and users."""
+    base_dn = _get_base_dn(conn)
+    ous = list(_iter_ad_ous(conn))
+    counts = OuCounts()
+    for kind, search_filter in (("computers", COMPUTER_FILTER), ("users", USER_FILTER)):
+        for entry in paged_search(conn, base_dn, search_filter, ["distinguishedName"]):
+            counts.add(kind, entry["dn"])
+    return build_ou_tree(base_dn, ous, counts, root)
+
+
+@ad_bp.route('/api/ad/get-ou-tree', methods=['POST'])
+def get_ad_ou_tree():
+    """
+    Returns the OU hierarchy with direct and subtree counts of computers and users per node.
+    Served from the AD replica, where the counts follow every synced change; until it
+    is ready (or with "live": true) the tree is built from a live query.
+    Send "path": <OU DN> to get only that subtree.
+    """
+    data = request.get_json(silent=True) or {}
+    root = data.get('path')
+    logger.info(f"Received request for /api/ad/get-ou-tree (root: {root or 'domain'}).")
+
+    replica = get_session_replica()
+    if replica is not None and replica.ready and not data.get('live'):
+        tree = replica.ou_tree(root)
+        if tree is None:
+            return jsonify({'ok': False, 'error': f'OU "{root}" not found.', 'error_code': 'OU_NOT_FOUND'}), 404
+        return jsonify({"ok": True, "tree": tree, "source": "replica", "version": replica.version,
+                        "stale": replica.is_stale(ad_replicas.sync_interval())}), 200
+
     conn, error, status = get_ldap_connection()
     if error:
         return jsonify(error), status
-
     try:
-        base_dn = conn.server.info.other.get('defaultNamingContext')[0]
-        
-        search_filter = "(objectCategory=organizationalUnit)"
-        attributes = ["ou", "distinguishedName", "whenCreated"]
-        
-        logger.info(f"Searching AD for OUs with base DN '{base_dn}'.")
-        conn.search(search_base=base_dn, search_filter=search_filter, attributes=attributes)
-        
-        ou_list = []
-        for entry in conn.entries:
-            ou_list.append({
-                "name": str(entry.ou.value) if entry.ou.value else "",
-                "path": str(entry.distinguishedName.value) if entry.distinguishedName.value else "",
-                "created": format_datetime(entry.whenCreated.value),
-            })
-        
-        logger.info(f"Found {len(ou_list)} OU objects in AD.")
-        return jsonify({"ok": True, "ous": ou_list}), 200
-
+        tree = _live_ou_tree(conn, root)
+        if tree is None:
+            return jsonify({'ok': False, 'error': f'OU "{root}" not found.', 'error_code': 'OU_NOT_FOUND'}), 404
+        return jsonify({"ok": True, "tree": tree, "source": "live"}), 200
     except Exception as e:
-        logger.error(f"Unexpected error during AD OU query: {e}", exc_info=True)
+        logger.error(f"Unexpected error while building the OU tree: {e}", exc_info=True)
         return jsonify({
-            "ok": False, 
+            "ok": False,
             "error": "Unexpected LDAP Query Error",
-            "message": "An unexpected error occurred during the Active Directory OU query.",
+            "message": "An unexpected error occurred while building the OU tree.",
             "error_code": "AD_QUERY_UNEXPECTED_ERROR",
             "details": str(e)
         }), 500
     finally:
-        if conn:
-            conn.unbind()
+        release_ldap_connection(conn)
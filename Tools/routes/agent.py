@@ -0,0 +1,40 @@
+# استقبال بيانات الأداء التي ترسلها Atlas Agent مباشرة إلى الخادم (مصادقة برمز لكل جهاز)
+import sqlite3
+from flask import Blueprint, request, jsonify
+from Tools.utils.logger import logger
+from Tools.utils.agent_collector import agent_collector
+
+# Agents authenticate with their own token instead of a user session
+agent_bp = Blueprint('agent', __name__, url_prefix='/api/agent')
+
+
+@agent_bp.route('/ingest', methods=['POST'])
+def api_ingest():
+    """
+    Accepts a batch of samples from one agent.
+    Header: Authorization: Bearer <agent token>
+    Body: {"name": "<COMPUTERNAME>", "samples": [{"timestamp", "cpuUsage", "usedMemoryGB", ...}, ...]}
+    """
+    data = request.get_json(silent=True) or {}
+    name = data.get("name")
+    samples = data.get("samples")
+    auth_header = request.headers.get("Authorization", "")
+    token = auth_header[len("Bearer "):].strip() if auth_header.startswith("Bearer ") else ""
+
+    if not name or not agent_collector.verify_token(name, token):
+        logger.warning(f"Rejected agent push for '{name}' from {request.remote_addr}: invalid token.")
+        return jsonify({"ok": False, "error": "Invalid agent token.", "error_code": "INVALID_AGENT_TOKEN"}), 401
+
+    if isinstance(samples, dict):
+        samples = [samples]
+    if not isinstance(samples, list) or not samples:
+        return jsonify({"ok": False, "error": "samples must be a non-empty list.", "error_code": "INVALID_SAMPLES"}), 400
+
+    try:
+        accepted = agent_collector.record_push(name, samples)
+    except sqlite3.Error as e:
+        # The agent keeps the batch and sends it again with the next one
+        logger.error(f"Could not store the agent push from '{name}': {e}")
+        return jsonify({"ok": False, "error": "Metrics storage is unavailable.", "error_code": "METRICS_UNAVAILABLE"}), 503
+    logger.info(f"Agent push from '{name}': {accepted}/{len(samples)} samples accepted.")
+    return jsonify({"ok": True, "accepted": accepted})
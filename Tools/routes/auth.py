@@ -1,8 +1,11 @@
 # مصادقة المستخدم أو التحقق من الأدمن
 from flask import Blueprint, request, jsonify, session
-import subprocess
 import re
 import os
+from Tools.utils.ldap_pool import ldap_pool
+from Tools.utils.ad_replica import ad_replicas
+from Tools.utils.admin_check import admin_cache
+from Tools.utils.agent_collector import agent_collector
 
 # We will check for pywin32 availability right when we need it.
 # This makes the error messages more accurate.
@@ -43,7 +46,7 @@ def check_is_domain_admin_with_cred(username, password, domain="."):
         )
         
         # 2. Check if the user is a member of the "Domain Admins" group.
-        is_admin, error_msg = check_is_domain_admin_group_member(f"{domain}\\{username}")
+        is_admin, error_msg = check_is_domain_admin_group_member(username, password, domain)
         
         hUser.Close()
 
@@ -63,36 +66,12 @@ def check_is_domain_admin_with_cred(username, password, domain="."):
     except Exception as e:
         return False, f"An unexpected error occurred: {str(e)}"
 
-def check_is_domain_admin_group_member(full_username):
-    """Checks if a user is a member of the Domain Admins group using 'net group'."""
-    try:
-        user_to_check = full_username.split('\\')[-1]
-
-        cmd = f'net group "Domain Admins" /domain'
-        proc = subprocess.run(cmd, capture_output=True, text=True, shell=True, timeout=30, creationflags=subprocess.CREATE_NO_WINDOW)
-
-        if proc.returncode != 0:
-            cmd = f'net localgroup "Administrators"'
-            proc = subprocess.run(cmd, capture_output=True, text=True, shell=True, timeout=30, creationflags=subprocess.CREATE_NO_WINDOW)
-            if proc.returncode != 0:
-                 return False, f"فشل الاستعلام عن مجموعة المدراء المحليين أو على النطاق: {proc.stderr or proc.stdout}"
-
-        output_lines = proc.stdout.strip().splitlines()
-        user_section_started = False
-        user_list = []
-        for line in output_lines:
-            if "-------------------------------------------------------------------------------" in line:
-                user_section_started = True
-                continue
-            if user_section_started:
-                user_list.extend(filter(None, line.strip().split('  ')))
-        
-        return any(user_to_check.lower() == admin.lower() for admin in user_list), None
-
-    except subprocess.TimeoutExpired:
-        return False, "انتهت مهلة أمر التحقق من صلاحيات المدير."
-    except Exception as e:
-        return False, f"حدث خطأ غير متوقع: {str(e)}"
+def check_is_domain_admin_group_member(username, password, domain):
+    """
+    Checks if a user is a member of the Domain Admins group through an LDAP tokenGroups
+    lookup (nested groups included). Answers are cached per user and refreshed in the background.
+    """
+    return admin_cache.is_domain_admin(domain, f"{username}@{domain}", password)
 
 
 @auth_bp.route('/api/login', methods=['POST'])
@@ -132,5 +111,9 @@ def api_check_session():
 
 @auth_bp.route('/api/logout', methods=['POST'])
 def api_logout():
+    if session.get('domain') and session.get('email'):
+        ldap_pool.invalidate_user(session['domain'], session['email'])
+        ad_replicas.forget_credentials(session['domain'], session['email'])
+        agent_collector.forget_credentials(session['email'])
     session.clear()
     return jsonify({"ok": True})
@@ -0,0 +1,68 @@
+# واجهات IPAM: نسبة استخدام الشبكات الفرعية، النطاقات الحرة، وتعارض العناوين
+from flask import Blueprint, request, jsonify, session
+from Tools.utils.logger import logger
+from Tools.utils.ipam import ipam_store
+from Tools.utils.network_env import get_interfaces
+
+ipam_bp = Blueprint('ipam', __name__, url_prefix='/api/ipam')
+
+
+@ipam_bp.before_request
+def require_login():
+    if 'user' not in session or 'email' not in session:
+        logger.warning(f"Unauthorized access attempt to {request.endpoint}")
+        return jsonify({'ok': False, 'error': 'Authentication required. Please log in.'}), 401
+
+
+def _register_local_subnets():
+    """Makes sure every directly attached subnet has a bitmap, even before it is scanned."""
+    for iface in get_interfaces():
+        if not iface["is_loopback"] and not iface["is_link_local"]:
+            ipam_store.ensure_subnet(iface["cidr"])
+
+
+@ipam_bp.route('/subnets', methods=['GET', 'POST'])
+def api_ipam_subnets():
+    """
+    Returns utilization for every known subnet, built from discovery scans and AD computer records.
+    """
+    try:
+        _register_local_subnets()
+        return jsonify({'ok': True, 'subnets': ipam_store.subnet_summaries()})
+    except Exception as e:
+        logger.error(f"Failed to build IPAM subnet summary: {e}", exc_info=True)
+        return jsonify({'ok': False, 'error': f"Failed to build subnet summary: {str(e)}"}), 500
+
+
+@ipam_bp.route('/subnet', methods=['POST'])
+def api_ipam_subnet_detail():
+    """
+    Returns utilization and free address ranges for a single subnet.
+    """
+    data = request.get_json() or {}
+    cidr = data.get('cidr')
+    if not cidr:
+        return jsonify({'ok': False, 'error': 'CIDR is required.'}), 400
+
+    try:
+        max_ranges = int(data.get('max_ranges', 256))
+        detail = ipam_store.subnet_detail(cidr, max_ranges=max_ranges)
+    except ValueError as e:
+        return jsonify({'ok': False, 'error': f"Invalid request: {str(e)}"}), 400
+
+    if detail is None:
+        return jsonify({'ok': False, 'error': f'Subnet {cidr} is not known. Scan it or attach an interface to it first.'}), 404
+    return jsonify({'ok': True, 'subnet': detail})
+
+
+@ipam_bp.route('/conflicts', methods=['GET', 'POST'])
+def api_ipam_conflicts():
+    """
+    Returns duplicate-IP and MAC-flapping reports.
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        window_seconds = int(data.get('window_seconds') or request.args.get('window_seconds', 3600))
+    except (TypeError, ValueError):
+        return jsonify({'ok': False, 'error': 'window_seconds must be a number.'}), 400
+    return jsonify({'ok': True, **ipam_store.conflicts(window_seconds=window_seconds)})
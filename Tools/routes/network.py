@@ -9,20 +9,25 @@ import re
 import subprocess
 import time
 import json
-from flask import Blueprint, request, jsonify, session
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import sqlite3
+from flask import Blueprint, request, jsonify, session, Response, stream_with_context
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
 from Tools.utils.helpers import is_valid_ip, get_tools_path, run_ps_command, parse_psinfo_output, get_hostname_from_ip, get_mac_address, run_winrm_command
-from .activedirectory import _get_ad_computers_data
+from .activedirectory import get_ad_computer_index, match_ad_computer
 from Tools.utils.logger import logger
-import datetime
-from datetime import timezone
 from Tools.snmp_listener import get_current_traps
 from Tools.utils.settings_manager import get_setting
+from Tools.utils.network_env import get_interfaces, plan_scan
+from Tools.utils.scanners import arp_sweep, iter_syn_scan
+from Tools.utils.netbios import query_node_status
+from Tools.utils.fingerprint import fingerprint_hosts
+from Tools.utils.ipam import ipam_store
+from Tools.utils.search_index import search_index
+from Tools.utils.metrics_db import metrics_store
+from Tools.utils.agent_collector import agent_collector, read_agent_data
 
 network_bp = Blueprint('network', __name__)
 
-LOGS_DIR = os.path.join(os.path.dirname(__file__), '..', 'monitoring_logs')
-
 
 @network_bp.before_request
 def require_login():
@@ -32,99 +37,27 @@ def require_login():
             logger.warning(f"Unauthorized access attempt to {request.endpoint}")
             return jsonify({'ok': False, 'error': 'يجب تسجيل الدخول أولاً'}), 401
 
-def get_source_ip_for_cidr(cidr_str):
-    """Finds a local IP address that belongs to the given CIDR network."""
-    try:
-        target_network = ipaddress.ip_network(cidr_str, strict=False)
-        hostname = socket.gethostname()
-        addr_info = socket.getaddrinfo(hostname, None)
-        
-        for item in addr_info:
-            # item[4][0] is the IP address
-            if item[0] == socket.AF_INET: # Check for IPv4
-                ip_addr_str = item[4][0]
-                ip_addr = ipaddress.ip_address(ip_addr_str)
-                if ip_addr in target_network:
-                    logger.info(f"Found source IP {ip_addr_str} for CIDR {cidr_str}.")
-                    return ip_addr_str
-    except Exception as e:
-        logger.warning(f"Could not find source IP for CIDR {cidr_str}: {e}")
-        return None
-    logger.warning(f"No matching local IP found for CIDR {cidr_str}.")
-    return None
-
-def get_router_mac_address():
-    """
-    Attempts to find the default gateway's MAC address by parsing `route print`
-    and then using `arp -a`. This is a more robust method for masscan.
-    """
-    logger.info("Attempting to find router MAC address.")
-    try:
-        # Get the default gateway IP
-        route_proc = subprocess.run(
-            ["route", "print", "0.0.0.0"],
-            capture_output=True, text=True, timeout=10, creationflags=subprocess.CREATE_NO_WINDOW
-        )
-        if route_proc.returncode != 0:
-            logger.warning(f"Command 'route print' failed with return code {route_proc.returncode}.")
-            return None
-
-        gateway_ip = None
-        for line in route_proc.stdout.splitlines():
-            if line.strip().startswith("0.0.0.0"):
-                parts = line.strip().split()
-                if len(parts) >= 3 and is_valid_ip(parts[2]):
-                    gateway_ip = parts[2]
-                    logger.info(f"Found default gateway IP: {gateway_ip}")
-                    break
-        
-        if not gateway_ip:
-            logger.warning("Could not determine default gateway IP from 'route print' output.")
-            return None
-
-        # Now that we have the gateway IP, get its MAC from the ARP table
-        mac = get_mac_address(gateway_ip)
-        if mac:
-            logger.info(f"Found MAC address for gateway {gateway_ip}: {mac}")
-        else:
-            logger.warning(f"Could not find MAC address for gateway {gateway_ip} in ARP table.")
-        return mac
-
-    except Exception as e:
-        logger.error(f"Error getting router MAC address: {e}", exc_info=True)
-        return None
-
-
 @network_bp.route('/api/network-interfaces', methods=['POST'])
 def api_network_interfaces():
     logger.info("Received request for /api/network-interfaces.")
     interfaces_list = []
     try:
-        hostname = socket.gethostname()
-        all_addrs = socket.getaddrinfo(hostname, None)
-        
-        ipv4_addrs = [addr[4][0] for addr in all_addrs if addr[0] == socket.AF_INET]
-
-        for ip_addr in ipv4_addrs:
-            if ip_addr.startswith('127.'):
-                continue
-            
-            try:
-                # Assume a /24 network for simplicity
-                iface = ipaddress.ip_interface(f"{ip_addr}/24") 
-                net = iface.network
-                cidr = str(net)
-                
-                if not any(d['cidr'] == cidr for d in interfaces_list):
-                    interfaces_list.append({
-                        "id": f"iface_{net.network_address}",
-                        "name": f"Network ({cidr})",
-                        "ip": ip_addr,
-                        "netmask": str(net.netmask),
-                        "cidr": cidr
-                    })
-            except ValueError:
+        for iface in get_interfaces():
+            if iface["is_loopback"] or iface["is_link_local"]:
                 continue
+
+            cidr = iface["cidr"]
+            if not any(d['cidr'] == cidr for d in interfaces_list):
+                interfaces_list.append({
+                    "id": f"iface_{cidr.split('/')[0]}",
+                    "name": f"{iface['name']} ({cidr})",
+                    "ip": iface["ip"],
+                    "netmask": iface["netmask"],
+                    "cidr": cidr,
+                    "prefixlen": iface["prefixlen"],
+                    "mac": iface["mac"],
+                    "gateway": iface["gateway"],
+                })
         
         logger.info(f"Found {len(interfaces_list)} network interfaces.")
         return jsonify({"ok": True, "interfaces": interfaces_list})
@@ -142,15 +75,16 @@ def run_masscan(target_range, source_ip=None, router_mac=None):
 
     output_file = os.path.join(os.path.dirname(masscan_path), f"masscan_scan_{os.getpid()}.json")
     
-    command = [masscan_path, target_range, "-p445", "--rate", "1000", "--wait", "0", "--output-format", "json", "--output-file", output_file]
+    scan_rate = get_setting('scan_rate_pps')
+    command = [masscan_path, target_range, "-p445", "--rate", str(scan_rate), "--wait", "0", "--output-format", "json", "--output-file", output_file]
 
     if router_mac:
-        command.extend(["--router-mac", router_mac])
+        command.extend(["--router-mac", router_mac.replace(':', '-')])
         logger.info(f"Running masscan with router MAC: {router_mac}")
-    elif source_ip:
+    if source_ip:
         command.extend(["--source-ip", source_ip])
         logger.info(f"Running masscan with source IP: {source_ip}")
-    else:
+    if not router_mac and not source_ip:
         logger.warning("Running masscan without a specified router MAC or source IP. This may fail.")
 
     proc = subprocess.run(command, capture_output=True, text=True, timeout=180, creationflags=subprocess.CREATE_NO_WINDOW)
@@ -210,40 +144,163 @@ def run_masscan(target_range, source_ip=None, router_mac=None):
     return found_hosts
 
 
-def get_device_info(ip):
-    """Gets hostname and MAC for a single IP."""
+def get_device_info(ip, mac=None):
+    """Gets hostname and MAC for a single IP. The ARP table lookup is skipped when the MAC is already known."""
     try:
         hostname = get_hostname_from_ip(ip)
-        mac = get_mac_address(ip)
+        if not mac:
+            mac = get_mac_address(ip)
         return {"ip": ip, "hostname": hostname or "Unknown", "mac": mac or "N/A"}
     except Exception:
-        return {"ip": ip, "hostname": "Error", "mac": "Error"}
+        return {"ip": ip, "hostname": "Error", "mac": mac or "Error"}
+
+
+def apply_fingerprint(host, fingerprint):
+    """Stores a fingerprint result in a device record, using SMB/NTLM names when nothing better is known."""
+    if not fingerprint:
+        return
+    host["fingerprint"] = fingerprint
+    host["device_type"] = fingerprint["device_type"]
+    host["os"] = fingerprint["os"]
+    smb = fingerprint["services"].get("445") or {}
+    if smb.get("netbios_computer") and host.get("hostname") in ("Unknown", "Error", None):
+        host["hostname"] = smb.get("dns_computer") or smb["netbios_computer"]
+    if smb.get("netbios_domain") and not host.get("workgroup"):
+        host["workgroup"] = smb["netbios_domain"]
+
+
+DISCOVERY_METHODS = ("auto", "arp", "masscan", "syn")
+# Discovered devices that no scan has seen for this long are dropped from the search index
+DISCOVERED_DEVICE_TTL_SECONDS = 7 * 24 * 3600
+
+
+def discover_hosts(plan, method="auto"):
+    """
+    Runs the discovery backend that fits the scan plan.
+    'auto' uses an ARP sweep for directly attached subnets (falling back if the sweep
+    cannot run), masscan for routed subnets, and the built-in SYN scanner wherever
+    masscan.exe is not present.
+    Returns (backend_name, iterable of {"ip": ..., "mac": ... or None}); ARP sweep hosts also
+    carry "macs", every MAC that answered for the IP. For the SYN
+    scanner the iterable is a generator that yields hosts while the scan is running.
+    """
+    iface_name = plan["interface"]["name"] if plan["interface"] else None
+
+    use_arp = method == "arp" or (method == "auto" and plan["is_local"])
+    if use_arp:
+        try:
+            return "arp", arp_sweep(plan["cidr"], iface=iface_name, source_ip=plan["source_ip"])
+        except RuntimeError as e:
+            if method == "arp":
+                raise
+            logger.warning(f"ARP sweep unavailable for {plan['cidr']}, falling back: {e.args[-1] if e.args else e}")
+
+    use_syn = method == "syn" or (method == "auto" and not os.path.exists(get_tools_path("masscan.exe")))
+    if use_syn:
+        scan_rate = get_setting('scan_rate_pps')
+        try:
+            found_ips = iter_syn_scan(plan["cidr"], plan["source_ip"], plan["router_mac"], iface=iface_name, rate=scan_rate)
+            return "syn", ({"ip": ip, "mac": None} for ip in found_ips)
+        except RuntimeError as e:
+            if method == "syn":
+                raise
+            # Without scapy and without masscan.exe, run_masscan reports MASSCAN_NOT_FOUND below
+            logger.warning(f"SYN scan unavailable for {plan['cidr']}: {e.args[-1] if e.args else e}")
+
+    online_ips = run_masscan(plan["cidr"], plan["source_ip"], plan["router_mac"])
+    return "masscan", [{"ip": ip, "mac": None} for ip in online_ips]
+
+
+def _scan_failed_response(backend, error):
+    """Error response of an ARP sweep or SYN scan that could not start or failed while running."""
+    backend_label = "ARP Sweep" if backend == "arp" else "SYN Scan"
+    logger.error(f"{backend_label} failed: {error.args[-1] if error.args else str(error)}")
+    return jsonify({"ok": False, "error": f"{backend_label} Failed", "message": error.args[0] if error.args else "The scan could not be started.", "error_code": f"{backend.upper()}_SCAN_FAILED", "details": error.args[-1] if error.args else str(error)}), 500
+
+
+def index_discovered_device(host):
+    """Adds a discovered host to the global search index, keyed by IP."""
+    names = [host.get("hostname"), host.get("netbios_name"), host.get("ad_name")]
+    names = [name for name in names if name and name not in ("Unknown", "Error")]
+    search_index.upsert({
+        "type": "device",
+        "id": host["ip"],
+        "title": names[0] if names else host["ip"],
+        "subtitle": " ".join(part for part in (host["ip"], host.get("device_type"), host.get("mac")) if part and part not in ("N/A", "Error")),
+        "terms": [host["ip"], host.get("mac")] + names,
+        "data": host,
+    })
+
+
+def prune_discovered_devices(cidr, seen_ips):
+    """
+    Drops indexed devices of a rescanned subnet that did not answer this time, and
+    devices of any subnet that no scan has seen for DISCOVERED_DEVICE_TTL_SECONDS.
+    """
+    network = ipaddress.ip_network(cidr, strict=False)
+    expired_before = time.time() - DISCOVERED_DEVICE_TTL_SECONDS
+    removed = 0
+    for ip, indexed_at in search_index.documents("device"):
+        try:
+            gone = ip not in seen_ips and ipaddress.ip_address(ip) in network
+        except ValueError:
+            gone = False
+        if gone or indexed_at < expired_before:
+            search_index.remove("device", ip)
+            removed += 1
+    if removed:
+        logger.info(f"Removed {removed} discovered devices that are gone from the search index.")
 
 
 @network_bp.route('/api/discover-devices', methods=['POST'])
 def api_discover_devices():
     """
-    Performs a fast network discovery using Masscan.
-    The backend now filters out known domain devices before returning results.
+    Performs a fast network discovery.
+    Directly attached subnets are swept with ARP (IP + MAC in one pass); routed subnets use Masscan.
+    Each host is tagged as domain-joined or unmanaged against the AD computer inventory;
+    pass "unmanaged_only": true to drop the domain-joined ones from the response.
+    Unless "fingerprint": false is sent, hosts are also fingerprinted (device type, OS, services).
     """
     data = request.get_json() or {}
     scan_cidr = data.get("cidr")
-    logger.info(f"Received request for /api/discover-devices with CIDR {scan_cidr}.")
+    method = data.get("method", "auto")
+    unmanaged_only = bool(data.get("unmanaged_only", False))
+    run_fingerprint = bool(data.get("fingerprint", True))
+    logger.info(f"Received request for /api/discover-devices with CIDR {scan_cidr} (method: {method}).")
 
     if not scan_cidr:
         logger.warning("Discover devices request failed: Missing CIDR.")
         return jsonify({"ok": False, "error": "CIDR is required for scanning."}), 400
 
+    if method not in DISCOVERY_METHODS:
+        return jsonify({"ok": False, "error": f"Invalid discovery method. Use one of: {', '.join(DISCOVERY_METHODS)}."}), 400
+
     try:
-        # Step 1: Run the network scan
-        source_ip = get_source_ip_for_cidr(scan_cidr)
-        router_mac = get_router_mac_address()
-        online_ips = run_masscan(scan_cidr, source_ip, router_mac)
+        # Step 1: Run the network scan using the interface and gateway that actually serve this CIDR
+        plan = plan_scan(scan_cidr)
+        logger.info(f"Scan plan for {scan_cidr}: source IP {plan['source_ip']}, router MAC {plan['router_mac']}, local: {plan['is_local']}.")
+        try:
+            backend, found_hosts = discover_hosts(plan, method)
+        except RuntimeError as e:
+            if method not in ("arp", "syn"):
+                raise
+            return _scan_failed_response(method, e)
         
-        # Step 2: Get info for discovered IPs
+        # Step 2: Get info for discovered IPs as they arrive (MACs from the ARP sweep are reused as-is)
         online_hosts_info = []
+        # Every MAC that answered for an IP in this scan, so same-scan IP conflicts reach IPAM
+        scan_macs = {}
         with ThreadPoolExecutor(max_workers=50) as executor:
-            future_to_ip = {executor.submit(get_device_info, ip): ip for ip in online_ips}
+            future_to_ip = {}
+            try:
+                for host in found_hosts:
+                    scan_macs[host["ip"]] = host.get("macs") or []
+                    future_to_ip[executor.submit(get_device_info, host["ip"], host["mac"])] = host["ip"]
+            except RuntimeError as e:
+                # The SYN scanner reports probes that could not be sent once sending is over
+                if backend != "syn":
+                    raise
+                return _scan_failed_response(backend, e)
             for future in as_completed(future_to_ip):
                 try:
                     result = future.result()
@@ -253,9 +310,63 @@ def api_discover_devices():
                 except Exception as e:
                     logger.warning(f"Error processing device info future: {e}")
 
-        logger.info(f"Discovered {len(online_hosts_info)} devices on the network.")
+        logger.info(f"Discovered {len(online_hosts_info)} devices on the network using {backend}.")
+
+        # Step 2b: One batched NetBIOS node-status round fills in names, workgroups and MACs
+        # for hosts without PTR records (and for routed hosts that have no ARP entry).
+        netbios_info = query_node_status([host["ip"] for host in online_hosts_info])
+        for host in online_hosts_info:
+            nb = netbios_info.get(host["ip"])
+            host["netbios_name"] = nb["netbios_name"] if nb else None
+            host["workgroup"] = nb["workgroup"] if nb else None
+            if nb and nb["netbios_name"] and host["hostname"] in ("Unknown", "Error"):
+                host["hostname"] = nb["netbios_name"]
+            if nb and nb["mac"] and host["mac"] in ("N/A", "Error"):
+                host["mac"] = nb["mac"]
+
+        # Step 2c: Fingerprint services concurrently to tell PCs from printers, switches, cameras, ...
+        if run_fingerprint and online_hosts_info:
+            fingerprints = fingerprint_hosts([host["ip"] for host in online_hosts_info], ports=get_setting('fingerprint_ports'))
+            for host in online_hosts_info:
+                apply_fingerprint(host, fingerprints.get(host["ip"]))
+
+        ipam_store.record_scan(plan["cidr"], [
+            (host["ip"], mac)
+            for host in online_hosts_info
+            for mac in [host["mac"]] + [other for other in scan_macs.get(host["ip"], []) if other != host["mac"]]
+        ])
+
+        # Step 3: Tag hosts against the AD computer inventory (O(1) lookups on a cached index)
+        ad_index, ad_error = get_ad_computer_index()
+        if ad_error:
+            logger.warning(f"Could not load AD computers to tag discovered hosts: {ad_error.get('message') or ad_error.get('error')}")
+        else:
+            for host in online_hosts_info:
+                computer = match_ad_computer(ad_index, host["ip"], host["hostname"])
+                host["domain_joined"] = computer is not None
+                host["ad_name"] = computer["name"] if computer else None
+                host["ad_dn"] = computer["dn"] if computer else None
+
+        for host in online_hosts_info:
+            index_discovered_device(host)
+        prune_discovered_devices(plan["cidr"], {host["ip"] for host in online_hosts_info})
+
+        domain_joined_count = sum(1 for host in online_hosts_info if host.get("domain_joined"))
+        unmanaged_count = len(online_hosts_info) - domain_joined_count
+        if unmanaged_only and not ad_error:
+            online_hosts_info = [host for host in online_hosts_info if not host["domain_joined"]]
+
         sorted_hosts = sorted(online_hosts_info, key=lambda x: ipaddress.ip_address(x['ip']))
-        return jsonify({"ok": True, "devices": sorted_hosts})
+        return jsonify({
+            "ok": True,
+            "devices": sorted_hosts,
+            "method": backend,
+            "summary": {
+                "domain_joined": domain_joined_count if not ad_error else None,
+                "unmanaged": unmanaged_count if not ad_error else None,
+            },
+            "ad_error": ad_error.get("error") if ad_error else None,
+        })
 
     except FileNotFoundError as e:
         logger.error("Masscan not found: " + str(e))
@@ -268,6 +379,32 @@ def api_discover_devices():
         return jsonify({"ok": False, "error": "Unexpected Scan Error", "message": "An unexpected error occurred during the scan.", "error_code": "UNEXPECTED_ERROR", "details": str(e)}), 500
 
 
+@network_bp.route('/api/network/fingerprint', methods=['POST'])
+def api_fingerprint():
+    """
+    Fingerprints a list of already discovered IPs (open ports, banners, SMB OS hints, device type).
+    Accepts an optional "ports" list; defaults to the 'fingerprint_ports' setting.
+    """
+    data = request.get_json() or {}
+    ips = [ip for ip in data.get("ips", []) if is_valid_ip(ip)]
+    if not ips:
+        return jsonify({"ok": False, "error": "A list of valid IP addresses is required."}), 400
+
+    try:
+        ports = [int(port) for port in data.get("ports") or get_setting('fingerprint_ports')]
+        if not all(1 <= port <= 65535 for port in ports):
+            raise ValueError()
+    except (TypeError, ValueError):
+        return jsonify({"ok": False, "error": "Ports must be a list of TCP port numbers (1-65535)."}), 400
+
+    try:
+        results = fingerprint_hosts(ips, ports=ports)
+        return jsonify({"ok": True, "fingerprints": results})
+    except Exception as e:
+        logger.error(f"Unexpected fingerprinting error: {e}", exc_info=True)
+        return jsonify({"ok": False, "error": "Unexpected Fingerprint Error", "message": "An unexpected error occurred while fingerprinting hosts.", "error_code": "UNEXPECTED_ERROR", "details": str(e)}), 500
+
+
 def check_host_status_ping(ip):
     """Checks if a host is online by sending a single ping. Returns True if online, False otherwise."""
     try:
@@ -516,56 +653,31 @@ def get_historical_data():
 
     logger.info(f"Received request for historical data for device: {device_name}")
 
-    log_file = os.path.join(LOGS_DIR, f"{device_name}.json")
-
-    if not os.path.exists(log_file):
-        logger.info(f"No history file found for {device_name}.")
-        return jsonify({"ok": True, "history": []}), 200
-    
     try:
-        with open(log_file, 'r', encoding='utf-8') as f:
-            history = json.load(f)
-        
-        # Filter out old entries on read
-        log_retention_hours = get_setting('log_retention_hours')
-        retention_delta = datetime.timedelta(hours=log_retention_hours)
-        now_utc = datetime.datetime.now(timezone.utc)
-
-        def parse_iso_with_timezone(ts_str):
-            # Handles both 'Z' and '+00:00' suffixes for UTC
-            dt_obj = datetime.datetime.fromisoformat(ts_str.replace('Z', '+00:00'))
-            # Ensure the object is timezone-aware for comparison
-            if dt_obj.tzinfo is None:
-                return dt_obj.replace(tzinfo=timezone.utc)
-            return dt_obj
-
-        valid_history = [
-            entry for entry in history
-            if "timestamp" in entry and (now_utc - parse_iso_with_timezone(entry["timestamp"])) < retention_delta
-        ]
-        
-        # If filtering resulted in changes, rewrite the file to keep it clean.
-        if len(valid_history) < len(history):
-            logger.info(f"Pruning old log entries for {device_name}. Before: {len(history)}, After: {len(valid_history)}")
-            try:
-                with open(log_file, 'w', encoding='utf-8') as f_write:
-                    json.dump(valid_history, f_write)
-            except IOError as e_write:
-                logger.error(f"Failed to write pruned history file for {device_name}: {e_write}")
-
-
-        logger.info(f"Successfully loaded and filtered {len(valid_history)} data points for {device_name}.")
-        return jsonify({"ok": True, "history": valid_history}), 200
-    except (IOError, json.JSONDecodeError) as e:
-        logger.error(f"Failed to read or parse history file for {device_name}: {e}")
+        # Window defaults to the whole retention period; "hours" or "start"/"end" (epoch seconds) narrow it.
+        # "points" picks the resolution and "limit" keeps only the newest points at that resolution.
+        now = time.time()
+        retention_start = now - get_setting('log_retention_hours') * 3600
+        if data.get("hours"):
+            start_ts = now - float(data["hours"]) * 3600
+        else:
+            start_ts = float(data.get("start") or retention_start)
+        end_ts = float(data.get("end") or now)
+        history, resolution = metrics_store.history(device_name, max(start_ts, retention_start), end_ts,
+                                                    target_points=data.get("points"), limit=data.get("limit"))
+        logger.info(f"Successfully loaded {len(history)} data points for {device_name} (resolution: {resolution or 'raw'}).")
+        return jsonify({"ok": True, "history": history, "resolution": resolution}), 200
+    except (sqlite3.Error, TypeError, ValueError) as e:
+        logger.error(f"Failed to read history for {device_name}: {e}")
         return jsonify({"ok": False, "error": f"Failed to read history log: {str(e)}"}), 500
 
 
 @network_bp.route('/api/network/fetch-live-data', methods=['POST'])
 def fetch_live_data():
     """
-    Fetches the latest performance data directly from the agent file on a remote device.
-    This acts as a proxy to the internal psinfo function.
+    Returns the latest performance data of a device. Agent devices are polled in the
+    background, so this is normally a cache read; the agent file is only read
+    directly for devices the collector has no fresh sample of, or with "refresh": true.
     """
     data = request.get_json() or {}
     device_ip = data.get("ip")
@@ -579,13 +691,131 @@ def fetch_live_data():
     except IndexError:
         logger.warning(f"Could not parse device name from DN: {device_id}")
         return jsonify({"ok": False, "error": "Invalid Device ID format."}), 400
-    
+
+    if not data.get("refresh"):
+        live_data, fetched_at = agent_collector.get_live(device_name)
+        if live_data is not None:
+            return jsonify({"ok": True, "liveData": live_data, "cached": True, "fetchedAt": fetched_at})
+
     from Tools.routes.pstools import api_psinfo_internal
     
     # Directly call the internal function, passing the explicit IP and name.
     # This bypasses any further JSON parsing and ensures the correct target is used.
     return api_psinfo_internal(ip=device_ip, name=device_name)
-        
+
+
+# Batch live data: WinRM reads running at once, and the default / largest shared deadline
+BATCH_LIVE_MAX_WORKERS = 16
+BATCH_LIVE_DEFAULT_TIMEOUT = 20
+BATCH_LIVE_MAX_TIMEOUT = 120
+BATCH_LIVE_MAX_DEVICES = 1000
+
+
+@network_bp.route('/api/network/fetch-live-data/batch', methods=['POST'])
+def fetch_live_data_batch():
+    """
+    Live data of many devices in one request: {"devices": [{"id": DN, "ip": ip}, ...],
+    "timeout": seconds, "refresh": bool}. Streams one NDJSON line per device as soon as
+    its data is available - cached samples first, then agent reads as they complete,
+    at most BATCH_LIVE_MAX_WORKERS at a time. Devices not done when the shared deadline
+    passes are reported as timed out, and a {"done": true} trailer ends the stream.
+    """
+    data = request.get_json() or {}
+    devices = data.get("devices")
+    if not isinstance(devices, list) or not devices:
+        return jsonify({"ok": False, "error": "devices must be a non-empty list of {id, ip}."}), 400
+    if len(devices) > BATCH_LIVE_MAX_DEVICES:
+        return jsonify({"ok": False, "error": f"At most {BATCH_LIVE_MAX_DEVICES} devices per request."}), 400
+    try:
+        timeout = min(float(data.get("timeout") or BATCH_LIVE_DEFAULT_TIMEOUT), BATCH_LIVE_MAX_TIMEOUT)
+    except (TypeError, ValueError):
+        return jsonify({"ok": False, "error": "timeout must be a number of seconds."}), 400
+
+    from Tools.routes.pstools import get_auth_from_session
+    user, domain, pwd, winrm_user = get_auth_from_session()
+    if not all([user, domain, pwd]):
+        return jsonify({"ok": False, "error": "Authentication required to fetch agent data."}), 401
+
+    deadline = time.monotonic() + timeout
+    refresh = bool(data.get("refresh"))
+    agent_collector.set_credentials(winrm_user, pwd)
+
+    def read_device(device_ip, device_name):
+        result, _ = read_agent_data(device_ip, device_name, winrm_user, pwd)
+        if result.get("ok"):
+            agent_collector.record_live(device_name, device_ip, result["liveData"])
+        return result
+
+    def generate():
+        counts = {"succeeded": 0, "failed": 0, "timed_out": 0}
+
+        def line(device_id, device_ip, result):
+            counts["succeeded" if result.get("ok") else "failed"] += 1
+            return json.dumps({"id": device_id, "ip": device_ip, **result}) + "\n"
+
+        executor = ThreadPoolExecutor(max_workers=BATCH_LIVE_MAX_WORKERS, thread_name_prefix="live_batch")
+        futures = {}
+        try:
+            for device in devices:
+                device_id = device.get("id") if isinstance(device, dict) else None
+                device_ip = device.get("ip") if isinstance(device, dict) else None
+                try:
+                    device_name = device_id.split(',')[0].split('=')[1]
+                except (AttributeError, IndexError):
+                    yield line(device_id, device_ip, {"ok": False, "error": "Invalid Device ID format."})
+                    continue
+                if not device_ip:
+                    yield line(device_id, device_ip, {"ok": False, "error": "IP address is required."})
+                    continue
+                if not refresh:
+                    live_data, fetched_at = agent_collector.get_live(device_name)
+                    if live_data is not None:
+                        yield line(device_id, device_ip, {"ok": True, "liveData": live_data, "cached": True, "fetchedAt": fetched_at})
+                        continue
+                futures[executor.submit(read_device, device_ip, device_name)] = (device_id, device_ip)
+
+            pending = set(futures)
+            try:
+                for future in as_completed(futures, timeout=max(0, deadline - time.monotonic())):
+                    pending.discard(future)
+                    device_id, device_ip = futures[future]
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        logger.error(f"Batch live data for {device_ip} failed: {e}", exc_info=True)
+                        result = {"ok": False, "error": "An unexpected error occurred."}
+                    yield line(device_id, device_ip, result)
+            except FuturesTimeoutError:
+                for future in pending:
+                    device_id, device_ip = futures[future]
+                    counts["timed_out"] += 1
+                    yield json.dumps({"id": device_id, "ip": device_ip, "ok": False, "error": "Timed out waiting for the agent.",
+                                      "error_code": "LIVE_DATA_TIMEOUT"}) + "\n"
+            logger.info(f"Batch live data: {len(devices)} devices, {counts['succeeded']} ok, {counts['failed']} failed, {counts['timed_out']} timed out.")
+            yield json.dumps({"ok": True, "done": True, "count": len(devices), **counts}) + "\n"
+        finally:
+            # Reads still running past the deadline finish in the background; queued ones are dropped
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+
+@network_bp.route('/api/network/agent-collector', methods=['GET'])
+def get_agent_collector_status():
+    """Devices polled by the background agent collector and the result of their last poll."""
+    return jsonify({"ok": True, **agent_collector.status()})
+
+
+@network_bp.route('/api/network/agent-collector/remove', methods=['POST'])
+def remove_agent_device():
+    data = request.get_json() or {}
+    name = data.get("name")
+    if not name:
+        return jsonify({"ok": False, "error": "Device name is required."}), 400
+    if not agent_collector.remove_device(name):
+        return jsonify({"ok": False, "error": f"Device '{name}' is not polled by the agent collector."}), 404
+    return jsonify({"ok": True, "message": f"Device '{name}' is no longer polled."})
+
 @network_bp.route('/api/network/get-snmp-traps', methods=['GET'])
 def get_snmp_traps_data():
     """
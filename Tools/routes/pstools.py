@@ -4,18 +4,17 @@ import re
 import subprocess
 import json
 import base64
+from urllib.parse import urlparse
 from flask import Blueprint, request, jsonify, current_app, session
 from Tools.utils.helpers import is_valid_ip, get_tools_path, run_ps_command, parse_pslist_output, parse_psfile_output, parse_psservice_output, parse_psloglist_output, parse_psinfo_output, parse_query_user_output, run_winrm_command
 from Tools.utils.logger import logger
-import datetime
 import json
 from .activedirectory import get_ldap_connection
+from Tools.utils.agent_collector import agent_collector, read_agent_data
 from Tools.utils.settings_manager import get_setting
 
 pstools_bp = Blueprint('pstools', __name__, url_prefix='/api/pstools')
 
-LOGS_DIR = os.path.join(os.path.dirname(__file__), '..', 'monitoring_logs')
-
 
 def json_result(rc, out, err, structured_data=None, extra_data={}):
     # Ensure stdout is serializable
@@ -221,73 +220,12 @@ def api_psinfo_internal(ip=None, name=None):
         logger.error(f"Authentication missing in session for internal call to '{name}' on IP '{ip}'.")
         return jsonify({"ok": False, "error": "Authentication required to fetch agent data."}), 401
     
-    logger.info(f"Reading performance data for '{name}' from agent file on {ip}.")
-    
-    remote_file_path = f"C:\\Atlas\\{name}.json"
-    ps_command = f"Get-Content -Path '{remote_file_path}' -Raw"
-
-    # Use a longer timeout to ensure the agent has time to collect data
-    rc, out, err = run_winrm_command(ip, winrm_user, pwd, ps_command, timeout=30)
-    
-    if rc != 0:
-        logger.warning(f"Failed to read agent file from {ip} for {name}. Error: {err}")
-        return jsonify({"ok": False, "error": "Could not read agent data file.", "details": err})
-
-    try:
-        perf_data = json.loads(out)
-        
-        # Save historical data for graphs (CPU and Memory only)
-        log_file = os.path.join(LOGS_DIR, f"{name}.json")
-        history = []
-        if os.path.exists(log_file):
-            try:
-                with open(log_file, 'r', encoding='utf-8') as f:
-                    history = json.load(f)
-            except (IOError, json.JSONDecodeError):
-                history = []
-        
-        current_timestamp_str = perf_data.get("timestamp")
-        if current_timestamp_str:
-            current_timestamp = datetime.datetime.fromisoformat(current_timestamp_str.replace('Z', '+00:00'))
-
-            if not history or datetime.datetime.fromisoformat(history[-1]["timestamp"].replace('Z', '+00:00')) != current_timestamp:
-                # Only log the data needed for graphs
-                history.append({
-                    "timestamp": perf_data.get("timestamp"),
-                    "cpuUsage": perf_data.get("cpuUsage"),
-                    "usedMemoryGB": perf_data.get("usedMemoryGB"),
-                })
-
-                # Prune old data based on retention setting
-                log_retention_hours = get_setting('log_retention_hours')
-                retention_delta = datetime.timedelta(hours=log_retention_hours)
-                now_utc = datetime.datetime.now(datetime.timezone.utc)
-                
-                def parse_iso_with_timezone(ts_str):
-                    dt = datetime.datetime.fromisoformat(ts_str.replace('Z', '+00:00'))
-                    return dt.replace(tzinfo=datetime.timezone.utc) if dt.tzinfo is None else dt
-
-                history = [
-                    entry for entry in history
-                    if "timestamp" in entry and (now_utc - parse_iso_with_timezone(entry["timestamp"])) < retention_delta
-                ]
-                
-                try:
-                    os.makedirs(LOGS_DIR, exist_ok=True)
-                    with open(log_file, 'w') as f:
-                        json.dump(history, f)
-                except IOError as e:
-                    logger.error(f"Failed to write history log for {name}: {e}")
-
-        # Return live data directly to the frontend (includes disk info)
-        return jsonify({"ok": True, "liveData": perf_data})
-
-    except (json.JSONDecodeError, KeyError) as e:
-        logger.error(f"Error decoding JSON from agent file for {name}: {e}. Raw data: {out}")
-        return jsonify({"ok": False, "error": "Failed to parse data file from agent.", "details": out}), 500
-    except Exception as e:
-        logger.error(f"Unexpected error processing agent data for {name}: {e}", exc_info=True)
-        return jsonify({"ok": False, "error": "An unexpected error occurred."}), 500
+    result, status = read_agent_data(ip, name, winrm_user, pwd)
+    if result.get("ok"):
+        # A successful read means the device runs the agent; keep collecting it in the background
+        agent_collector.record_live(name, ip, result["liveData"])
+        agent_collector.set_credentials(winrm_user, pwd)
+    return jsonify(result), status
 
 @pstools_bp.route('/psinfo', methods=['POST'])
 def api_psinfo():
@@ -702,6 +640,15 @@ def api_deploy_agent():
         logger.error(f"An unexpected error occurred while reading the agent script: {e}")
         return jsonify({"ok": False, "error": f"Server-side error reading the agent script: {e}"}), 500
     
+    # Agents push their samples to the server when it has an address they can reach
+    ingest_base = (get_setting('agent_ingest_url') or request.host_url).rstrip('/')
+    if urlparse(ingest_base).hostname in ("localhost", "127.0.0.1", "::1"):
+        logger.warning(f"Agent on {ip} will not push metrics: the server address '{ingest_base}' is local. Set agent_ingest_url in the settings.")
+    else:
+        token = agent_collector.issue_token(device_name, ip)
+        script_content = script_content.replace('__ATLAS_INGEST_URL__', f"{ingest_base}/api/agent/ingest")
+        script_content = script_content.replace('__ATLAS_AGENT_TOKEN__', token)
+
     encoded_script = base64.b64encode(script_content.encode('utf-16-le')).decode('ascii')
     
     cmd_args = ["powershell.exe", "-EncodedCommand", encoded_script]
@@ -712,6 +659,8 @@ def api_deploy_agent():
     
     if rc == 0:
         logger.info(f"Agent deployment script executed successfully on {ip}.")
+        agent_collector.add_device(device_name, ip)
+        agent_collector.set_credentials(f"{user}@{domain}" if '@' not in user else user, pwd)
         return jsonify({
             "ok": True,
             "message": f"Atlas Agent deployment finished on {ip}.",
@@ -753,7 +702,7 @@ def api_enable_snmp():
         return jsonify({"ok": False, "error": f"Server-side error reading the agent script: {e}"}), 500
     
     script_content = script_content_template.replace('$SERVER_IP_PLACEHOLDER$', server_ip)
-    
+
     encoded_script = base64.b64encode(script_content.encode('utf-16-le')).decode('ascii')
     
     cmd_args = ["powershell.exe", "-EncodedCommand", encoded_script]
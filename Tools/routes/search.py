@@ -0,0 +1,45 @@
+# واجهة البحث الفوري الموحد عن الأجهزة والمستخدمين والمجموعات
+import time
+from flask import Blueprint, request, jsonify, session
+from Tools.utils.logger import logger
+from Tools.utils.search_index import search_index
+from .activedirectory import get_session_replica
+
+search_bp = Blueprint('search', __name__, url_prefix='/api/search')
+
+
+@search_bp.before_request
+def require_login():
+    if 'user' not in session or 'email' not in session:
+        logger.warning(f"Unauthorized access attempt to {request.endpoint}")
+        return jsonify({'ok': False, 'error': 'Authentication required. Please log in.'}), 401
+
+
+@search_bp.route('', methods=['GET', 'POST'])
+def api_search():
+    """
+    Type-ahead search across AD users, computers, groups, OUs and discovered devices.
+    Parameters (query string or JSON): q, limit (default 20), types (e.g. "user,computer").
+    """
+    params = {**request.args.to_dict(), **(request.get_json(silent=True) or {})}
+    query = params.get('q') or ''
+    types = params.get('types') or None
+    if isinstance(types, str):
+        types = {t.strip() for t in types.split(',') if t.strip()}
+
+    # Make sure the AD replica feeding the index is syncing for this domain
+    get_session_replica()
+
+    try:
+        started = time.perf_counter()
+        results = search_index.search(query, limit=params.get('limit'), types=set(types) if types else None)
+        took_ms = round((time.perf_counter() - started) * 1000, 3)
+        return jsonify({'ok': True, 'query': query, 'results': results, 'took_ms': took_ms})
+    except (TypeError, ValueError):
+        return jsonify({'ok': False, 'error': 'limit must be a number.'}), 400
+
+
+@search_bp.route('/stats', methods=['GET'])
+def api_search_stats():
+    """Returns how many documents and tokens the search index holds."""
+    return jsonify({'ok': True, 'index': search_index.stats()})
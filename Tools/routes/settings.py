@@ -1,3 +1,4 @@
+import re
 from flask import Blueprint, jsonify, request, session
 from Tools.utils.logger import logger
 from Tools.utils.settings_manager import get_all_settings, save_settings, get_setting
@@ -46,6 +47,48 @@ def api_save_settings():
             except (ValueError, TypeError):
                 return jsonify({'ok': False, 'error': 'Invalid value for log_retention_hours. Must be a positive number.'}), 400
         
+        if 'scan_rate_pps' in data:
+            try:
+                scan_rate = int(data['scan_rate_pps'])
+                if not 1 <= scan_rate <= 100000:
+                    raise ValueError()
+                valid_settings['scan_rate_pps'] = scan_rate
+            except (ValueError, TypeError):
+                return jsonify({'ok': False, 'error': 'Invalid value for scan_rate_pps. Must be between 1 and 100000.'}), 400
+
+        if 'fingerprint_ports' in data:
+            try:
+                ports = sorted({int(port) for port in data['fingerprint_ports']})
+                if not ports or not all(1 <= port <= 65535 for port in ports):
+                    raise ValueError()
+                valid_settings['fingerprint_ports'] = ports
+            except (ValueError, TypeError):
+                return jsonify({'ok': False, 'error': 'Invalid value for fingerprint_ports. Must be a non-empty list of TCP ports (1-65535).'}), 400
+
+        if 'ad_sync_interval_seconds' in data:
+            try:
+                interval = int(data['ad_sync_interval_seconds'])
+                if not 30 <= interval <= 86400:
+                    raise ValueError()
+                valid_settings['ad_sync_interval_seconds'] = interval
+            except (ValueError, TypeError):
+                return jsonify({'ok': False, 'error': 'Invalid value for ad_sync_interval_seconds. Must be between 30 and 86400.'}), 400
+
+        if 'agent_poll_interval_seconds' in data:
+            try:
+                interval = int(data['agent_poll_interval_seconds'])
+                if not 15 <= interval <= 3600:
+                    raise ValueError()
+                valid_settings['agent_poll_interval_seconds'] = interval
+            except (ValueError, TypeError):
+                return jsonify({'ok': False, 'error': 'Invalid value for agent_poll_interval_seconds. Must be between 15 and 3600.'}), 400
+
+        if 'agent_ingest_url' in data:
+            ingest_url = str(data['agent_ingest_url'] or '').strip()
+            if ingest_url and not re.match(r'^https?://[^\s/]+(:\d+)?/?$', ingest_url):
+                return jsonify({'ok': False, 'error': 'Invalid value for agent_ingest_url. Must be empty or like http://server:5000.'}), 400
+            valid_settings['agent_ingest_url'] = ingest_url
+
         # Add more setting validations here as needed
 
         if not valid_settings:
@@ -4,6 +4,9 @@ $ErrorActionPreference = "Stop"
 $AgentPath = "C:\Atlas"
 $TaskName = "AtlasMonitorAgent" # Changed name to be more specific
 $ScriptPath = $MyInvocation.MyCommand.Path
+# Filled in by the Atlas server at deployment; left as placeholders the agent only writes the file
+$IngestUrl = '__ATLAS_INGEST_URL__'
+$AgentToken = '__ATLAS_AGENT_TOKEN__'
 
 function Collect-AtlasData {
     # Use CIM instance for a faster, non-blocking CPU read
@@ -30,7 +33,39 @@ function Collect-AtlasData {
     }
 
     $filePath = Join-Path -Path $AgentPath -ChildPath "$($env:COMPUTERNAME).json"
-    $data | ConvertTo-Json -Depth 4 -Compress | Set-Content -Path $filePath -Encoding UTF8 -Force
+    $json = $data | ConvertTo-Json -Depth 4 -Compress
+    $json | Set-Content -Path $filePath -Encoding UTF8 -Force
+
+    # Rolling buffer of recent samples (last 360) the server pulls incrementally
+    $bufferPath = Join-Path -Path $AgentPath -ChildPath "$($env:COMPUTERNAME).samples.jsonl"
+    $sampleLine = $data | Select-Object timestamp, cpuUsage, totalMemoryGB, usedMemoryGB | ConvertTo-Json -Compress
+    Add-Content -Path $bufferPath -Value $sampleLine -Encoding UTF8
+    @(Get-Content -Path $bufferPath -Encoding UTF8 | Select-Object -Last 360) | Set-Content -Path $bufferPath -Encoding UTF8 -Force
+
+    if ($IngestUrl -like 'http*') {
+        Send-AtlasData -SampleJson $json
+    }
+}
+
+function Send-AtlasData {
+    param([string]$SampleJson)
+    # Unsent samples (up to one day) are kept and sent with the next batch
+    $pendingPath = Join-Path -Path $AgentPath -ChildPath "$($env:COMPUTERNAME).pending.jsonl"
+    Add-Content -Path $pendingPath -Value $SampleJson -Encoding UTF8
+    $pending = @(Get-Content -Path $pendingPath -Encoding UTF8 | Select-Object -Last 1440)
+    $batch = @{
+        name    = $env:COMPUTERNAME
+        samples = @($pending | ForEach-Object { $_ | ConvertFrom-Json })
+    }
+    try {
+        Invoke-RestMethod -Uri $IngestUrl -Method Post -ContentType 'application/json' -TimeoutSec 15 `
+            -Headers @{ Authorization = "Bearer $AgentToken" } `
+            -Body ($batch | ConvertTo-Json -Depth 5 -Compress) | Out-Null
+        Remove-Item -Path $pendingPath -Force
+    }
+    catch {
+        $pending | Set-Content -Path $pendingPath -Encoding UTF8 -Force
+    }
 }
 
 try {
@@ -1,6 +1,8 @@
 #Requires -RunAsAdministrator
 # This script deploys and configures the Atlas performance monitoring agent.
-# It creates a scheduled task that runs every minute to collect performance data.
+# It creates a scheduled task that runs every minute to collect performance data (six samples, 10 s apart,
+# finished within 55 s)
+# and, when the server provided an ingest URL and token, pushes it to the server.
 $ErrorActionPreference = 'Stop'
 try {
     # --- Configuration ---
@@ -18,18 +20,51 @@ try {
     # --- Define the command to be executed by the scheduled task ---
     # This script block gathers performance data and writes it to a JSON file.
     $CommandToRun = {
+        # The scheduled task runs the block without arguments; the deployment itself takes a single sample
+        param([int]$SamplesPerRun = 6)  # the task runs every minute -> one sample every 10 seconds
         # Suppress errors within the task itself to prevent it from failing silently
         $ErrorActionPreference = 'SilentlyContinue'
         $DeviceName = $env:COMPUTERNAME
         $OutputFile = "C:\Atlas\$($DeviceName).json"
-        # Get CPU Usage - More robust method
-        # This samples the processor usage over a brief period.
-        $CpuCounter = (Get-Counter -Counter "\Processor(_Total)\% Processor Time" -SampleInterval 1 -MaxSamples 2).CounterSamples | Select-Object -Last 1
-        $CpuUsage = if ($CpuCounter) { [math]::Round($CpuCounter.CookedValue, 2) } else { 0 }
-        # Get Memory Info
-        $MemoryInfo = Get-CimInstance -ClassName Win32_OperatingSystem
-        $TotalMemoryMB = [math]::Round($MemoryInfo.TotalVisibleMemorySize / 1024, 2)
-        $UsedMemoryMB = [math]::Round(($MemoryInfo.TotalVisibleMemorySize - $MemoryInfo.FreePhysicalMemory) / 1024, 2)
+        # Recent samples are kept in a rolling buffer so the server can pull (or be sent) every
+        # sample taken since it last looked, not just the newest one
+        $BufferFile = "C:\Atlas\$($DeviceName).samples.jsonl"
+        $SampleSeconds = 10
+        $BufferLength = 360     # one hour of samples
+        # Sampling and the push must be over before the next run is due, or the task skips it
+        $RunStart = Get-Date
+        $RunDeadline = $RunStart.AddSeconds(55)
+        $NewSamples = @()
+        for ($i = 0; $i -lt $SamplesPerRun; $i++) {
+            # Get CPU Usage - More robust method
+            # This samples the processor usage over a brief period.
+            $CpuCounter = (Get-Counter -Counter "\Processor(_Total)\% Processor Time" -SampleInterval 1 -MaxSamples 2).CounterSamples | Select-Object -Last 1
+            $CpuUsage = if ($CpuCounter) { [math]::Round($CpuCounter.CookedValue, 2) } else { 0 }
+            # Get Memory Info
+            $MemoryInfo = Get-CimInstance -ClassName Win32_OperatingSystem
+            $TotalMemoryMB = [math]::Round($MemoryInfo.TotalVisibleMemorySize / 1024, 2)
+            $UsedMemoryMB = [math]::Round(($MemoryInfo.TotalVisibleMemorySize - $MemoryInfo.FreePhysicalMemory) / 1024, 2)
+            $Sample = @{
+                timestamp = [datetime]::UtcNow.ToString("o"); # ISO 8601 format
+                cpuUsage = $CpuUsage;
+                totalMemoryGB = $TotalMemoryMB; # This is actually MB now
+                usedMemoryGB = $UsedMemoryMB; # This is actually MB now
+            }
+            $SampleLine = $Sample | ConvertTo-Json -Compress
+            Add-Content -Path $BufferFile -Value $SampleLine -Encoding utf8
+            $NewSamples += $SampleLine
+            if ($i -lt $SamplesPerRun - 1) {
+                # Slots are anchored to the start of the run so they do not drift; taking a sample
+                # needs about two seconds, so stop when the next one would not end before the deadline
+                $NextSlot = $RunStart.AddSeconds(($i + 1) * $SampleSeconds)
+                if ($NextSlot.AddSeconds(2) -gt $RunDeadline) { break }
+                $Remaining = ($NextSlot - (Get-Date)).TotalSeconds
+                if ($Remaining -gt 0) { Start-Sleep -Milliseconds ([int]($Remaining * 1000)) }
+            }
+        }
+        # Keep only the last hour in the buffer
+        $Buffer = @(Get-Content -Path $BufferFile -Encoding utf8 | Select-Object -Last $BufferLength)
+        $Buffer | Set-Content -Path $BufferFile -Encoding utf8 -Force
         
         # Get Disk Info for all fixed disks
         $DiskInfo = Get-Volume | Where-Object { $_.DriveType -eq 'Fixed' -and -not [string]::IsNullOrWhiteSpace($_.DriveLetter) } | ForEach-Object {
@@ -39,21 +74,53 @@ try {
                 freeGB = [math]::Round($_.SizeRemaining / 1GB, 2)
             }
         }
-        # Create the final data object
+        # Create the final data object (the newest sample plus disk info)
         $PerformanceData = @{
-            timestamp = [datetime]::UtcNow.ToString("o"); # ISO 8601 format
-            cpuUsage = $CpuUsage;
-            totalMemoryGB = $TotalMemoryMB; # This is actually MB now
-            usedMemoryGB = $UsedMemoryMB; # This is actually MB now
+            timestamp = $Sample.timestamp;
+            cpuUsage = $Sample.cpuUsage;
+            totalMemoryGB = $Sample.totalMemoryGB;
+            usedMemoryGB = $Sample.usedMemoryGB;
             diskInfo = $DiskInfo;
         }
         # Convert to JSON and write to file
-        $PerformanceData | ConvertTo-Json -Compress | Out-File -FilePath $OutputFile -Encoding utf8 -Force
+        $SampleJson = $PerformanceData | ConvertTo-Json -Compress
+        $SampleJson | Out-File -FilePath $OutputFile -Encoding utf8 -Force
+
+        # --- Push to the Atlas server ---
+        # The server fills in these values at deployment; when it cannot (no reachable address),
+        # they stay as placeholders and the server keeps reading the file above over WinRM.
+        $IngestUrl = '__ATLAS_INGEST_URL__'
+        $AgentToken = '__ATLAS_AGENT_TOKEN__'
+        if ($IngestUrl -like 'http*') {
+            # Samples that could not be sent are kept (up to one day) and sent with the next batch
+            $PendingFile = "C:\Atlas\$($DeviceName).pending.jsonl"
+            # The newest sample is sent as the full snapshot so the server also gets the disk info
+            $Earlier = @($NewSamples | Select-Object -First ($NewSamples.Count - 1))
+            if ($Earlier.Count -gt 0) { Add-Content -Path $PendingFile -Value $Earlier -Encoding utf8 }
+            Add-Content -Path $PendingFile -Value $SampleJson -Encoding utf8
+            $Pending = @(Get-Content -Path $PendingFile -Encoding utf8 | Select-Object -Last 8640)
+            $Batch = @{
+                name = $DeviceName;
+                samples = @($Pending | ForEach-Object { $_ | ConvertFrom-Json });
+            }
+            # The push only gets the time left before the deadline; what is not sent goes with the next run
+            $PushSeconds = [int][math]::Floor(($RunDeadline - (Get-Date)).TotalSeconds)
+            try {
+                if ($PushSeconds -lt 1) { throw "No time left to push before the next run." }
+                Invoke-RestMethod -Uri $IngestUrl -Method Post -ContentType 'application/json' -TimeoutSec $PushSeconds `
+                    -Headers @{ Authorization = "Bearer $AgentToken" } `
+                    -Body ($Batch | ConvertTo-Json -Depth 5 -Compress) | Out-Null
+                Remove-Item -Path $PendingFile -Force
+            } catch {
+                $Pending | Set-Content -Path $PendingFile -Encoding utf8 -Force
+            }
+        }
     }
     # --- Immediate Execution ---
-    # Run the command once immediately to create the file and confirm the script works.
+    # Take a single sample immediately to create the file and confirm the script works;
+    # the scheduled task takes the full series from its first run.
     Write-Host "Performing initial data collection..." -ForegroundColor Yellow
-    Invoke-Command -ScriptBlock $CommandToRun
+    Invoke-Command -ScriptBlock $CommandToRun -ArgumentList 1
     Write-Host "Initial data file created successfully." -ForegroundColor Yellow
     # --- Scheduled Task Creation ---
     # Convert the script block to a string correctly and then encode it for the task argument
@@ -70,7 +137,8 @@ try {
     $TaskPrincipal = New-ScheduledTaskPrincipal -UserId "NT AUTHORITY\SYSTEM" -LogonType ServiceAccount -RunLevel Highest
     
     # Define task settings
-    $TaskSettings = New-ScheduledTaskSettingsSet -AllowStartIfOnBatteries -DontStopIfGoingOnBatteries -ExecutionTimeLimit (New-TimeSpan -Minutes 2)
+    # A run ends within 55 seconds; should one still be running, the next is skipped rather than stacked
+    $TaskSettings = New-ScheduledTaskSettingsSet -AllowStartIfOnBatteries -DontStopIfGoingOnBatteries -MultipleInstances IgnoreNew -ExecutionTimeLimit (New-TimeSpan -Minutes 2)
     # Unregister any existing task with the same name to ensure a clean slate
     Write-Host "Unregistering any existing task..." -ForegroundColor Yellow
     Unregister-ScheduledTask -TaskName $TaskName -Confirm:$false -ErrorAction SilentlyContinue
@@ -0,0 +1,212 @@
+# ترشيح وفرز وتقسيم نتائج قوائم Active Directory على الخادم
+import json
+import base64
+from datetime import datetime, timedelta, timezone
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 5000
+
+# Filters each listing understands
+SUPPORTED_FILTERS = {
+    "computers": ("enabled", "os", "ou", "stale_since", "name"),
+    "users": ("enabled", "ou", "stale_since", "name"),
+    "groups": ("ou", "name"),
+    "ous": ("ou", "name"),
+}
+
+# Record field -> LDAP attribute the "name" prefix filter matches, per listing;
+# the LDAP and the replica path check the same attributes
+NAME_FILTER_FIELDS = {
+    "computers": (("name", "name"),),
+    "users": (("username", "sAMAccountName"), ("display_name", "displayName")),
+    "groups": (("name", "sAMAccountName"),),
+    "ous": (("name", "ou"),),
+}
+
+# Fields whose display string does not sort in time order ("Never", local dates);
+# they sort on the raw epoch value instead, with "Never" as the oldest
+RAW_SORT_FIELDS = {"last_logon": "last_logon_ts"}
+
+# Bitwise AND matching rule used to test userAccountControl flags on the DC
+MATCHING_RULE_BIT_AND = "1.2.840.113556.1.4.803"
+ACCOUNT_DISABLE = 0x0002
+_FILETIME_EPOCH = datetime(1601, 1, 1, tzinfo=timezone.utc)
+
+
+def _parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    if str(value).lower() in ("1", "true", "yes", "enabled"):
+        return True
+    if str(value).lower() in ("0", "false", "no", "disabled"):
+        return False
+    raise ValueError(f"Invalid boolean value '{value}'.")
+
+
+def _parse_stale_since(value):
+    """Accepts a number of days or an ISO date and returns the cutoff as a local datetime."""
+    if isinstance(value, (int, float)) or str(value).isdigit():
+        return datetime.now() - timedelta(days=int(value))
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        raise ValueError(f"Invalid stale_since value '{value}'. Use a number of days or an ISO date.")
+
+
+def _encode_cursor(offset):
+    return base64.urlsafe_b64encode(json.dumps({"o": offset}).encode("utf-8")).decode("ascii")
+
+
+def _decode_cursor(cursor):
+    try:
+        return max(0, int(json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))["o"]))
+    except Exception:
+        raise ValueError("Invalid cursor.")
+
+
+def parse_list_query(params, kind):
+    """
+    Validates the filter / sort / fields / paging options of an AD listing request.
+    params may carry a "filter" dict or the same keys at top level (query string).
+    Returns a query dict, or raises ValueError with a message for the client.
+    """
+    params = params or {}
+    supported = SUPPORTED_FILTERS.get(kind, ())
+    raw_filters = params.get("filter") if isinstance(params.get("filter"), dict) else {}
+    raw_filters = {**{key: params[key] for key in supported if key in params}, **raw_filters}
+
+    filters = {}
+    for key, value in raw_filters.items():
+        if value in (None, ""):
+            continue
+        if key not in supported:
+            raise ValueError(f"Filter '{key}' is not supported for {kind}. Supported: {', '.join(supported)}.")
+        if key == "enabled":
+            filters[key] = _parse_bool(value)
+        elif key == "stale_since":
+            filters[key] = _parse_stale_since(value)
+        else:
+            filters[key] = str(value)
+
+    sort = params.get("sort") or []
+    if isinstance(sort, str):
+        sort = [part.strip() for part in sort.split(",") if part.strip()]
+    sort_keys = [(key.lstrip("-+"), key.startswith("-")) for key in sort]
+
+    fields = params.get("fields") or []
+    if isinstance(fields, str):
+        fields = [part.strip() for part in fields.split(",") if part.strip()]
+
+    page_size = params.get("page_size")
+    page = params.get("page")
+    cursor = params.get("cursor")
+    offset = None
+    if page_size is not None or page is not None or cursor:
+        try:
+            page_size = min(MAX_PAGE_SIZE, max(1, int(page_size or DEFAULT_PAGE_SIZE)))
+            offset = _decode_cursor(cursor) if cursor else (max(1, int(page or 1)) - 1) * page_size
+        except (TypeError, ValueError) as e:
+            raise ValueError(str(e) if "cursor" in str(e) else "page and page_size must be positive integers.")
+
+    return {"kind": kind, "filters": filters, "sort": sort_keys, "fields": list(fields), "offset": offset, "page_size": page_size}
+
+
+def compile_ldap_query(base_filter, base_dn, query):
+    """
+    Pushes the query's filters into the LDAP search. Returns (search_filter, search_base):
+    'ou' becomes the search base, everything else an extra filter clause.
+    """
+    from ldap3.utils.conv import escape_filter_chars
+    query = query or {}
+    filters = query.get("filters") or {}
+    clauses = []
+    if "enabled" in filters:
+        disabled = f"(userAccountControl:{MATCHING_RULE_BIT_AND}:={ACCOUNT_DISABLE})"
+        clauses.append(f"(!{disabled})" if filters["enabled"] else disabled)
+    if "os" in filters:
+        clauses.append(f"(operatingSystem=*{escape_filter_chars(filters['os'])}*)")
+    if "name" in filters:
+        prefix = escape_filter_chars(filters["name"])
+        attributes = [attribute for _, attribute in NAME_FILTER_FIELDS.get(query.get("kind"), (("name", "name"),))]
+        clauses.append(f"(|{''.join(f'({attribute}={prefix}*)' for attribute in attributes)})")
+    if "stale_since" in filters:
+        cutoff = filters["stale_since"].astimezone(timezone.utc)
+        filetime = int((cutoff - _FILETIME_EPOCH).total_seconds() * 10_000_000)
+        clauses.append(f"(|(!(lastLogonTimestamp=*))(lastLogonTimestamp<={filetime}))")
+    search_filter = f"(&{base_filter}{''.join(clauses)})" if clauses else base_filter
+    return search_filter, filters.get("ou") or base_dn
+
+
+def record_matches(record, filters, kind=None):
+    """Evaluates the query's filters against an already-built listing record (replica path)."""
+    if "enabled" in filters and record.get("enabled") != filters["enabled"]:
+        return False
+    if "os" in filters and filters["os"].lower() not in (record.get("os") or "").lower():
+        return False
+    if "name" in filters:
+        prefix = filters["name"].lower()
+        names = (record.get(field) for field, _ in NAME_FILTER_FIELDS.get(kind, (("name", "name"),)))
+        if not any((name or "").lower().startswith(prefix) for name in names):
+            return False
+    if "ou" in filters:
+        dn = (record.get("dn") or record.get("path") or "").lower()
+        ou = filters["ou"].lower()
+        if dn != ou and not dn.endswith("," + ou):
+            return False
+    if "stale_since" in filters:
+        last_logon = record.get("last_logon_ts")
+        if last_logon and last_logon > filters["stale_since"].timestamp():
+            return False
+    return True
+
+
+def _sort_value(value):
+    if isinstance(value, str):
+        return (value is None, value.lower())
+    return (value is None, value if value is not None else 0)
+
+
+def _sort_key(field):
+    raw_field = RAW_SORT_FIELDS.get(field)
+    if raw_field:
+        return lambda record: record.get(raw_field) or 0
+    return lambda record: _sort_value(record.get(field))
+
+
+def apply_list_query(records, query, filtered=False):
+    """
+    Filters (unless already done by LDAP), sorts, pages and projects a list of records.
+    Returns (records, paging) where paging is None when no page was requested.
+    """
+    filters = query.get("filters") or {}
+    if filters and not filtered:
+        records = [record for record in records if record_matches(record, filters, query.get("kind"))]
+    else:
+        records = list(records)
+
+    # Stable sorts applied from the least to the most significant key
+    for field, descending in reversed(query.get("sort") or []):
+        records.sort(key=_sort_key(field), reverse=descending)
+
+    paging = None
+    if query.get("offset") is not None:
+        total = len(records)
+        offset, page_size = query["offset"], query["page_size"]
+        records = records[offset:offset + page_size]
+        next_offset = offset + page_size
+        paging = {
+            "total": total,
+            "page": offset // page_size + 1,
+            "page_size": page_size,
+            "next_cursor": _encode_cursor(next_offset) if next_offset < total else None,
+        }
+
+    fields = query.get("fields")
+    if fields:
+        records = [{field: record.get(field) for field in fields} for record in records]
+    return records, paging
+
+
+def project_record(record, query):
+    fields = (query or {}).get("fields")
+    return {field: record.get(field) for field in fields} if fields else record
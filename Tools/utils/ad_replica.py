@@ -0,0 +1,385 @@
+# نسخة محلية من كائنات Active Directory تتم مزامنتها تدريجياً في الخلفية (uSNChanged)
+import time
+import uuid
+import threading
+from Tools.utils.logger import logger
+from Tools.utils.ldap_pool import ldap_pool, paged_search
+from Tools.utils.settings_manager import get_setting
+from Tools.utils.ou_tree import OuCounts, build_ou_tree
+
+# A full resync also reconciles deletions we could not see through tombstones
+FULL_RESYNC_SECONDS = 3600
+# Deleted-object markers kept for 'since' deltas; older clients get a full listing
+MAX_TOMBSTONES = 20000
+# LDAP_SERVER_SHOW_DELETED_OID, needed to see tombstones of deleted objects
+SHOW_DELETED_CONTROL = ("1.2.840.113556.1.4.417", True, None)
+# Attributes every synced object needs, on top of what the record builder reads
+SYNC_ATTRIBUTES = ["objectGUID", "uSNChanged", "sAMAccountName", "name", "distinguishedName"]
+
+
+def entry_guid(entry):
+    """Returns the objectGUID of a search result entry as a canonical string."""
+    raw = entry.get("raw_attributes", {}).get("objectGUID")
+    if isinstance(raw, list):
+        raw = raw[0] if raw else None
+    if isinstance(raw, (bytes, bytearray)) and len(raw) == 16:
+        return str(uuid.UUID(bytes_le=bytes(raw)))
+    value = entry.get("attributes", {}).get("objectGUID")
+    return str(value).strip("{}").lower() if value else None
+
+
+def _first(value):
+    if isinstance(value, list):
+        return value[0] if value else None
+    return value
+
+
+class AdReplica:
+    """
+    In-memory copy of the computers, users, groups and OUs of one domain.
+    kinds maps a listing key (e.g. "computers") to a dict with the LDAP "filter",
+    the "attributes" to read and a "build" function turning a search result entry
+    into the record served to clients.
+
+    The first sync reads everything; later syncs only ask for objects whose
+    uSNChanged advanced past the highestCommittedUSN seen at the previous sync,
+    plus tombstones of deleted objects. USNs are local to a domain controller,
+    so a change of DC (dsServiceName) forces a full resync.
+    Every applied change bumps a version number; clients pass the last version
+    they saw as 'since' to get only what changed.
+    """
+
+    def __init__(self, domain, kinds, listeners=None):
+        self.domain = domain
+        self.kinds = kinds
+        # Called as listener(kind, guid, record) on every change, with record=None on delete
+        self.listeners = listeners if listeners is not None else []
+        self._lock = threading.RLock()
+        # guid -> {"kind", "dn", "sam", "name", "record", "version"}
+        self._objects = {}
+        self._by_dn = {}
+        # kind -> {"sam": {lower: guid}, "name": {lower: guid}}
+        self._by_kind = {kind: {"sam": {}, "name": {}} for kind in kinds}
+        # guid -> (version, kind)
+        self._tombstones = {}
+        # Versions at or below this may have lost tombstones; 'since' older than it gets a full listing
+        self._tombstone_floor = 0
+        # Computers / users per container, kept up to date with every change
+        self._ou_counts = OuCounts()
+        self.base_dn = None
+        self.version = 0
+        self._highest_usn = None
+        self._dc_service_name = None
+        self._last_full_sync = 0
+        self.ready = False
+        self.synced_at = None
+        self.last_error = None
+        self.last_sync_duration = None
+
+    # --- Index maintenance -------------------------------------------------
+
+    def _notify(self, kind, guid, record):
+        for listener in self.listeners:
+            try:
+                listener(kind, guid, record)
+            except Exception as e:
+                logger.warning(f"AD replica '{self.domain}': change listener failed: {e}")
+
+    def _unindex(self, guid, item):
+        if self._by_dn.get(item["dn"].lower()) == guid:
+            del self._by_dn[item["dn"].lower()]
+        indexes = self._by_kind[item["kind"]]
+        if item["sam"] and indexes["sam"].get(item["sam"]) == guid:
+            del indexes["sam"][item["sam"]]
+        if item["name"] and indexes["name"].get(item["name"]) == guid:
+            del indexes["name"][item["name"]]
+
+    def _index(self, guid, item):
+        self._by_dn[item["dn"].lower()] = guid
+        indexes = self._by_kind[item["kind"]]
+        if item["sam"]:
+            indexes["sam"][item["sam"]] = guid
+        if item["name"]:
+            indexes["name"][item["name"]] = guid
+
+    def _upsert(self, kind, guid, entry, record):
+        attributes = entry.get("attributes", {})
+        item = {
+            "kind": kind,
+            "dn": entry.get("dn") or "",
+            "sam": str(_first(attributes.get("sAMAccountName")) or "").lower(),
+            "name": str(_first(attributes.get("name")) or "").lower(),
+            "record": record,
+            "version": None,
+        }
+        existing = self._objects.get(guid)
+        if existing is not None:
+            if existing["record"] == record and existing["dn"] == item["dn"] and existing["kind"] == kind:
+                return False
+            self._unindex(guid, existing)
+            self._ou_counts.remove(existing["kind"], existing["dn"])
+        self.version += 1
+        item["version"] = self.version
+        self._objects[guid] = item
+        self._index(guid, item)
+        self._ou_counts.add(kind, item["dn"])
+        self._tombstones.pop(guid, None)
+        self._notify(kind, guid, record)
+        return True
+
+    def _remove(self, guid):
+        item = self._objects.pop(guid, None)
+        if item is None:
+            return False
+        self._unindex(guid, item)
+        self._ou_counts.remove(item["kind"], item["dn"])
+        self.version += 1
+        self._tombstones[guid] = (self.version, item["kind"])
+        self._notify(item["kind"], guid, None)
+        if len(self._tombstones) > MAX_TOMBSTONES:
+            oldest = sorted(self._tombstones.items(), key=lambda kv: kv[1][0])[:len(self._tombstones) - MAX_TOMBSTONES]
+            for old_guid, (old_version, _) in oldest:
+                del self._tombstones[old_guid]
+                self._tombstone_floor = max(self._tombstone_floor, old_version)
+        return True
+
+    # --- Synchronisation ---------------------------------------------------
+
+    @staticmethod
+    def _read_root_dse(conn):
+        from ldap3 import BASE
+        conn.search("", "(objectClass=*)", search_scope=BASE, attributes=["highestCommittedUSN", "dsServiceName"])
+        if not conn.response:
+            raise RuntimeError("Could not read the rootDSE of the domain controller.")
+        attributes = conn.response[0].get("attributes", {})
+        return int(_first(attributes.get("highestCommittedUSN")) or 0), str(_first(attributes.get("dsServiceName")) or "")
+
+    def _fetch(self, conn, base_dn, kind, usn_floor=None):
+        spec = self.kinds[kind]
+        search_filter = spec["filter"]
+        if usn_floor is not None:
+            search_filter = f"(&{search_filter}(uSNChanged>={usn_floor}))"
+        attributes = list(dict.fromkeys(spec["attributes"] + SYNC_ATTRIBUTES))
+        for entry in paged_search(conn, base_dn, search_filter, attributes):
+            guid = entry_guid(entry)
+            if guid:
+                record = spec["build"](entry, self.domain)
+                # Lets clients match records against the GUIDs listed in 'deleted'
+                record["guid"] = guid
+                yield guid, entry, record
+
+    def _fetch_deleted(self, conn, base_dn, usn_floor):
+        """Returns GUIDs of objects deleted since usn_floor, or None if tombstones are not readable."""
+        try:
+            return [
+                guid for guid in (
+                    entry_guid(entry) for entry in paged_search(
+                        conn, base_dn, f"(&(isDeleted=TRUE)(uSNChanged>={usn_floor}))",
+                        ["objectGUID"], controls=[SHOW_DELETED_CONTROL])
+                ) if guid
+            ]
+        except Exception as e:
+            logger.warning(f"AD replica '{self.domain}': could not read deleted objects, deletions wait for the next full sync: {e}")
+            return None
+
+    def sync(self, conn):
+        """Brings the replica up to date using a bound connection. Returns the number of changes applied."""
+        started = time.time()
+        base_dn = conn.server.info.other.get('defaultNamingContext')[0]
+        highest_usn, dc_service_name = self._read_root_dse(conn)
+
+        full = (
+            self._highest_usn is None
+            or dc_service_name != self._dc_service_name
+            or started - self._last_full_sync > FULL_RESYNC_SECONDS
+        )
+        changes = 0
+        if full:
+            seen = set()
+            for kind in self.kinds:
+                for guid, entry, record in self._fetch(conn, base_dn, kind):
+                    seen.add(guid)
+                    with self._lock:
+                        changes += self._upsert(kind, guid, entry, record)
+            with self._lock:
+                for guid in [guid for guid in self._objects if guid not in seen]:
+                    changes += self._remove(guid)
+                self._last_full_sync = started
+        else:
+            usn_floor = self._highest_usn + 1
+            for kind in self.kinds:
+                for guid, entry, record in self._fetch(conn, base_dn, kind, usn_floor):
+                    with self._lock:
+                        changes += self._upsert(kind, guid, entry, record)
+            deleted = self._fetch_deleted(conn, base_dn, usn_floor)
+            with self._lock:
+                for guid in deleted or []:
+                    changes += self._remove(guid)
+
+        with self._lock:
+            # Anything that changed while we were reading has a USN above the one read up front
+            self._highest_usn = highest_usn
+            self._dc_service_name = dc_service_name
+            self.base_dn = base_dn
+            self.ready = True
+            self.synced_at = time.time()
+            self.last_error = None
+            self.last_sync_duration = round(self.synced_at - started, 3)
+        logger.info(f"AD replica '{self.domain}': {'full' if full else 'incremental'} sync applied {changes} changes "
+                    f"in {self.last_sync_duration}s ({len(self._objects)} objects, version {self.version}).")
+        return changes
+
+    def mark_failed(self, error):
+        with self._lock:
+            self.last_error = str(error)
+
+    # --- Reads -------------------------------------------------------------
+
+    def is_stale(self, interval_seconds):
+        with self._lock:
+            if not self.ready or self.last_error:
+                return True
+            return time.time() - self.synced_at > 2 * interval_seconds
+
+    def records(self, kind):
+        with self._lock:
+            return [item["record"] for item in self._objects.values() if item["kind"] == kind]
+
+    def snapshot(self, kind, since=None):
+        """
+        Returns {"records", "deleted", "version", "delta"} for one kind.
+        With a usable 'since' only records changed after that version and the GUIDs
+        deleted after it are returned (delta=True); otherwise everything is.
+        """
+        with self._lock:
+            delta = since is not None and self._tombstone_floor <= since <= self.version
+            if delta:
+                records = [item["record"] for item in self._objects.values() if item["kind"] == kind and item["version"] > since]
+                deleted = [guid for guid, (version, deleted_kind) in self._tombstones.items() if deleted_kind == kind and version > since]
+            else:
+                records = [item["record"] for item in self._objects.values() if item["kind"] == kind]
+                deleted = []
+            return {"records": records, "deleted": deleted, "version": self.version, "delta": delta}
+
+    def ou_tree(self, root=None):
+        """Returns the OU hierarchy with direct and subtree computer/user counts (see build_ou_tree)."""
+        with self._lock:
+            ous = [item["record"] for item in self._objects.values() if item["kind"] == "ous"]
+            return build_ou_tree(self.base_dn, ous, self._ou_counts, root)
+
+    def get_by_dn(self, dn):
+        with self._lock:
+            guid = self._by_dn.get((dn or "").lower())
+            return self._objects[guid]["record"] if guid else None
+
+    def find(self, kind, sam=None, name=None):
+        """Looks an object up by sAMAccountName or name (case-insensitive)."""
+        with self._lock:
+            indexes = self._by_kind.get(kind)
+            if not indexes:
+                return None
+            guid = None
+            if sam:
+                guid = indexes["sam"].get(sam.lower())
+            if guid is None and name:
+                guid = indexes["name"].get(name.lower())
+            return self._objects[guid]["record"] if guid else None
+
+
+class AdReplicaManager:
+    """
+    Owns one AdReplica and one background sync thread per domain.
+    The thread binds with the credentials of the last user who used the AD pages;
+    they are kept in memory only and dropped again on logout.
+    """
+
+    def __init__(self, kinds=None):
+        self.kinds = kinds or {}
+        self.listeners = []
+        self._lock = threading.Lock()
+        self._replicas = {}
+        self._credentials = {}
+        self._threads = {}
+        self._wakeups = {}
+
+    def configure(self, kinds):
+        self.kinds = kinds
+
+    def add_listener(self, listener):
+        """Registers listener(kind, guid, record) for changes of every domain's replica."""
+        self.listeners.append(listener)
+
+    @staticmethod
+    def sync_interval():
+        try:
+            return max(30, int(get_setting('ad_sync_interval_seconds')))
+        except (TypeError, ValueError):
+            return 300
+
+    def register(self, domain, user, password):
+        """Records credentials for a domain and starts its sync thread. Returns the replica."""
+        key = domain.lower()
+        with self._lock:
+            self._credentials[key] = (domain, user, password)
+            replica = self._replicas.get(key)
+            if replica is None:
+                replica = AdReplica(domain, self.kinds, self.listeners)
+                self._replicas[key] = replica
+            thread = self._threads.get(key)
+            if thread is None or not thread.is_alive():
+                wakeup = threading.Event()
+                self._wakeups[key] = wakeup
+                thread = threading.Thread(target=self._run, args=(key, wakeup), name=f"ad_replica_{key}", daemon=True)
+                self._threads[key] = thread
+                thread.start()
+        return replica
+
+    def get(self, domain):
+        with self._lock:
+            return self._replicas.get((domain or "").lower())
+
+    def request_sync(self, domain):
+        """Wakes the sync thread of a domain, e.g. right after a change was written."""
+        with self._lock:
+            wakeup = self._wakeups.get((domain or "").lower())
+        if wakeup is not None:
+            wakeup.set()
+
+    def forget_credentials(self, domain, user):
+        key = (domain or "").lower()
+        with self._lock:
+            stored = self._credentials.get(key)
+            if stored and stored[1].lower() == (user or "").lower():
+                del self._credentials[key]
+
+    def _sync_once(self, key):
+        with self._lock:
+            replica = self._replicas.get(key)
+            credentials = self._credentials.get(key)
+        if replica is None or credentials is None:
+            return
+        domain, user, password = credentials
+        conn, error = ldap_pool.acquire(domain, user, password)
+        if error:
+            logger.warning(f"AD replica '{domain}': could not bind for sync: {error}")
+            replica.mark_failed(error)
+            return
+        try:
+            replica.sync(conn)
+        except Exception as e:
+            logger.error(f"AD replica '{domain}': sync failed: {e}", exc_info=True)
+            replica.mark_failed(e)
+            ldap_pool.release(conn, discard=True)
+            conn = None
+        finally:
+            ldap_pool.release(conn)
+
+    def _run(self, key, wakeup):
+        while True:
+            wakeup.clear()
+            self._sync_once(key)
+            wakeup.wait(self.sync_interval())
+
+
+# A single manager shared across the app; the AD routes configure which object kinds it syncs
+ad_replicas = AdReplicaManager()
@@ -0,0 +1,128 @@
+# التحقق من عضوية مجموعة Domain Admins عبر LDAP (tokenGroups) مع تخزين مؤقت لكل مستخدم
+import time
+import struct
+import threading
+from Tools.utils.logger import logger
+from Tools.utils.ldap_pool import ldap_pool
+
+# Well-known RID of the "Domain Admins" group
+DOMAIN_ADMINS_RID = 512
+# How long a positive answer is trusted, and after how long it is refreshed in the background
+ADMIN_CACHE_TTL_SECONDS = 900
+ADMIN_REFRESH_AFTER_SECONDS = 300
+# Negative answers expire quickly so a user who was just added can log in soon after
+NON_ADMIN_CACHE_TTL_SECONDS = 60
+
+
+def sid_to_str(raw):
+    """Converts a binary SID to its 'S-1-5-21-...' string form."""
+    raw = bytes(raw)
+    revision, sub_authority_count = raw[0], raw[1]
+    authority = int.from_bytes(raw[2:8], "big")
+    sub_authorities = struct.unpack(f"<{sub_authority_count}I", raw[8:8 + 4 * sub_authority_count])
+    return "S-{}-{}".format(revision, authority) + "".join(f"-{value}" for value in sub_authorities)
+
+
+def lookup_domain_admin(domain, email, password):
+    """
+    Binds as the user and reads its tokenGroups (every group SID the user holds,
+    nested groups and the primary group included). Returns (is_admin, error_message).
+    Only membership of the domain's own Domain Admins group (<domain SID>-512) counts.
+    """
+    from ldap3 import BASE
+    from ldap3.utils.conv import escape_filter_chars
+
+    conn, error = ldap_pool.acquire(domain, email, password)
+    if error:
+        return False, f"تعذر الاتصال بوحدة التحكم بالمجال للتحقق من صلاحيات المدير: {error}"
+    try:
+        base_dn = conn.server.info.other.get('defaultNamingContext')[0]
+        username = email.split("@")[0]
+        conn.search(base_dn, f"(&(objectCategory=person)(objectClass=user)(|(userPrincipalName={escape_filter_chars(email)})(sAMAccountName={escape_filter_chars(username)})))",
+                    attributes=["objectSid"])
+        users = [entry for entry in conn.response if entry.get("type") == "searchResEntry"]
+        if not users:
+            return False, f"لم يتم العثور على المستخدم '{email}' في Active Directory."
+        user_dn = users[0]["dn"]
+        user_sid = sid_to_str(users[0]["raw_attributes"]["objectSid"][0])
+        domain_admins_sid = user_sid.rsplit("-", 1)[0] + f"-{DOMAIN_ADMINS_RID}"
+
+        # tokenGroups is a constructed attribute and can only be read with a BASE search
+        conn.search(user_dn, "(objectClass=*)", search_scope=BASE, attributes=["tokenGroups"])
+        if not conn.response or "tokenGroups" not in conn.response[0].get("raw_attributes", {}):
+            return False, "تعذر قراءة عضويات المجموعات (tokenGroups) للمستخدم."
+        group_sids = {sid_to_str(value) for value in conn.response[0]["raw_attributes"]["tokenGroups"]}
+        return domain_admins_sid in group_sids, None
+    except Exception as e:
+        ldap_pool.release(conn, discard=True)
+        conn = None
+        return False, f"حدث خطأ غير متوقع: {str(e)}"
+    finally:
+        ldap_pool.release(conn)
+
+
+class AdminMembershipCache:
+    """
+    Caches the Domain Admins check per (domain, user). Answers younger than
+    ADMIN_REFRESH_AFTER_SECONDS are returned as they are; older (but still valid)
+    positive answers are returned immediately while a background thread refreshes
+    them, so repeated logins never wait for the DC.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._refreshing = set()
+
+    @staticmethod
+    def _key(domain, email):
+        return (domain.lower(), email.lower())
+
+    def _store(self, key, is_admin, error):
+        if error:
+            # Errors are never cached
+            return
+        with self._lock:
+            self._entries[key] = {"is_admin": is_admin, "checked_at": time.time()}
+
+    def _refresh(self, key, domain, email, password):
+        try:
+            is_admin, error = lookup_domain_admin(domain, email, password)
+            if error:
+                logger.warning(f"Background admin check for '{email}' failed: {error}")
+            self._store(key, is_admin, error)
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def is_domain_admin(self, domain, email, password):
+        """Returns (is_admin, error_message), from the cache when possible."""
+        key = self._key(domain, email)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry:
+            age = now - entry["checked_at"]
+            ttl = ADMIN_CACHE_TTL_SECONDS if entry["is_admin"] else NON_ADMIN_CACHE_TTL_SECONDS
+            if age < ttl:
+                if entry["is_admin"] and age > ADMIN_REFRESH_AFTER_SECONDS:
+                    with self._lock:
+                        start_refresh = key not in self._refreshing
+                        self._refreshing.add(key)
+                    if start_refresh:
+                        threading.Thread(target=self._refresh, args=(key, domain, email, password),
+                                         name="admin_check_refresh", daemon=True).start()
+                return entry["is_admin"], None
+
+        is_admin, error = lookup_domain_admin(domain, email, password)
+        self._store(key, is_admin, error)
+        logger.info(f"Domain Admins check for '{email}': {'admin' if is_admin else 'not admin'}{f' ({error})' if error else ''}.")
+        return is_admin, error
+
+    def invalidate(self, domain, email):
+        with self._lock:
+            self._entries.pop(self._key(domain, email), None)
+
+
+# A single cache shared across the app
+admin_cache = AdminMembershipCache()
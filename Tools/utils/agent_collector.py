@@ -0,0 +1,403 @@
+# جامع خلفي لبيانات أداء الأجهزة التي تعمل عليها Atlas Agent وتخزينها في تاريخ المراقبة
+import os
+import json
+import time
+import random
+import zlib
+import hmac
+import hashlib
+import secrets
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from Tools.utils.logger import logger
+from Tools.utils.helpers import run_winrm_command
+from Tools.utils.settings_manager import get_setting
+from Tools.utils.metrics_db import metrics_store, parse_timestamp, LOGS_DIR
+
+REGISTRY_FILE = os.path.join(LOGS_DIR, 'agents.json')
+# WinRM reads running at the same time
+MAX_CONCURRENT_POLLS = 16
+# Each poll is moved by up to this fraction of the interval so hosts do not line up again
+POLL_JITTER_RATIO = 0.1
+# The live-data endpoint serves the cached sample while it is younger than this many intervals
+LIVE_CACHE_INTERVALS = 2
+# How often the scheduler looks for due devices
+SCHEDULER_TICK_SECONDS = 1.0
+# Largest number of samples accepted in one pushed batch (the newest are kept)
+MAX_PUSH_SAMPLES = 10000
+
+
+def _hash_token(token):
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def _sample_time(live_data, default):
+    """When the agent took a sample (epoch seconds, never in the future), or default if it has no valid timestamp."""
+    try:
+        return min(parse_timestamp(live_data["timestamp"]), default)
+    except (KeyError, TypeError, ValueError, AttributeError):
+        return default
+
+
+def _stale_result(name, live_data):
+    """
+    Error result when the agent's newest sample is older than the live cache accepts
+    (its scheduled task stopped writing), None while it is fresh.
+    """
+    max_age = AgentCollector.poll_interval() * LIVE_CACHE_INTERVALS
+    now = time.time()
+    if now - _sample_time(live_data, now) <= max_age:
+        return None
+    logger.warning(f"Agent data of '{name}' is stale: last sample at {live_data.get('timestamp')}.")
+    return {"ok": False, "error": "The agent has not written new data recently.",
+            "details": f"Last sample at {live_data.get('timestamp')}; check the AtlasAgentPerfMonitor scheduled task."}
+
+
+# .NET ticks (100 ns since 0001-01-01) of the Unix epoch, to compare timestamps on the agent side
+_DOTNET_EPOCH_TICKS = 621355968000000000
+# Last agent file version (LastWriteTimeUtc ticks) and snapshot read per device
+_file_versions = {}
+_file_versions_lock = threading.Lock()
+
+
+def _agent_read_command(name, known_version, since_ticks):
+    """
+    PowerShell run on the agent: prints {"unchanged": true} if the snapshot file was not
+    rewritten since known_version, otherwise the snapshot, its version and the buffered
+    samples newer than since_ticks - a few hundred bytes per poll instead of the whole history.
+    """
+    return (
+        f"$f = 'C:\\Atlas\\{name}.json'; $r = 'C:\\Atlas\\{name}.samples.jsonl'; "
+        "$version = (Get-Item -LiteralPath $f -ErrorAction Stop).LastWriteTimeUtc.Ticks; "
+        f"if ($version -eq {known_version}) {{ '{{\"unchanged\":true}}' }} else {{ "
+        "$samples = @(); "
+        "if (Test-Path -LiteralPath $r) { $samples = @(Get-Content -LiteralPath $r | Where-Object { "
+        "$m = [regex]::Match($_, '\"timestamp\":\"([^\"]+)\"'); "
+        f"$m.Success -and ([datetimeoffset]::Parse($m.Groups[1].Value)).UtcTicks -gt {since_ticks} }}) }}; "
+        "'{\"version\":' + $version + ',\"snapshot\":' + (Get-Content -LiteralPath $f -Raw).Trim() + ',\"samples\":[' + ($samples -join ',') + ']}' }"
+    )
+
+
+def read_agent_data(ip, name, user, password):
+    """
+    Reads the agent's performance file (C:\\Atlas\\<name>.json) over WinRM and records the
+    CPU / memory samples in the metrics database. Only samples of the agent's rolling
+    buffer newer than the last stored one are transferred, and nothing but a marker
+    when the agent has not written since the previous read.
+    Returns (result, http_status) where result is the JSON body served to the frontend.
+    """
+    logger.info(f"Reading performance data for '{name}' from agent file on {ip}.")
+
+    key = name.upper()
+    with _file_versions_lock:
+        known = _file_versions.get(key)
+    try:
+        last_ts = metrics_store.last_timestamp(name)
+    except sqlite3.Error as e:
+        # Without history the whole buffer is read; the live data is still served
+        logger.warning(f"Could not read the last stored sample of {name}: {e}")
+        last_ts = None
+    since_ticks = int(last_ts * 10_000_000) + _DOTNET_EPOCH_TICKS if last_ts else 0
+    ps_command = _agent_read_command(name, known["version"] if known else -1, since_ticks)
+
+    # Use a longer timeout to ensure the agent has time to collect data
+    rc, out, err = run_winrm_command(ip, user, password, ps_command, timeout=30)
+
+    if rc != 0:
+        logger.warning(f"Failed to read agent file from {ip} for {name}. Error: {err}")
+        return {"ok": False, "error": "Could not read agent data file.", "details": err}, 200
+
+    try:
+        payload = json.loads(out)
+        if payload.get("unchanged") and known:
+            stale = _stale_result(name, known["snapshot"])
+            if stale:
+                return stale, 200
+            return {"ok": True, "liveData": known["snapshot"], "unchanged": True}, 200
+
+        perf_data = payload["snapshot"]
+        # Save historical data for graphs (CPU and Memory only): the buffered samples plus the snapshot
+        samples = [sample for sample in payload.get("samples") or [] if isinstance(sample, dict)] + [perf_data]
+        history = []
+        for sample in samples:
+            try:
+                history.append((parse_timestamp(sample["timestamp"]), sample.get("cpuUsage"), sample.get("usedMemoryGB")))
+            except (KeyError, TypeError, ValueError, AttributeError):
+                continue
+        if not history:
+            logger.error(f"Failed to write history log for {name}: no valid timestamp in the agent data.")
+        else:
+            try:
+                metrics_store.append_many(name, history)
+            except sqlite3.Error as e:
+                logger.error(f"Failed to write history log for {name}: {e}")
+
+        with _file_versions_lock:
+            _file_versions[key] = {"version": payload.get("version"), "snapshot": perf_data}
+
+        stale = _stale_result(name, perf_data)
+        if stale:
+            return stale, 200
+        # Return live data directly to the frontend (includes disk info)
+        return {"ok": True, "liveData": perf_data}, 200
+
+    except (json.JSONDecodeError, KeyError, AttributeError, TypeError) as e:
+        logger.error(f"Error decoding JSON from agent file for {name}: {e}. Raw data: {out}")
+        return {"ok": False, "error": "Failed to parse data file from agent.", "details": out}, 500
+    except Exception as e:
+        logger.error(f"Unexpected error processing agent data for {name}: {e}", exc_info=True)
+        return {"ok": False, "error": "An unexpected error occurred."}, 500
+
+
+class AgentCollector:
+    """
+    Polls every device known to run the Atlas agent on a fixed cadence
+    (agent_poll_interval_seconds), whether or not anybody has the monitoring page
+    open. Each device gets a stable offset inside the interval plus a little
+    random jitter, so polls are spread evenly instead of bursting, and at most
+    MAX_CONCURRENT_POLLS WinRM reads run at once.
+
+    Devices are added when an agent is deployed or read successfully; the list is
+    kept in monitoring_logs/agents.json. The WinRM credentials are those of the
+    last user who used the monitoring pages, kept in memory only.
+    Agents deployed with a push token POST their samples to the ingestion
+    endpoint instead; while a device keeps pushing it is not polled at all.
+    The latest sample of each device is cached for the live-data endpoint.
+    """
+
+    def __init__(self, registry_file=REGISTRY_FILE):
+        self.registry_file = registry_file
+        self._lock = threading.Lock()
+        # name (upper) -> {"name", "ip", "added_at", "token_hash"}
+        self._devices = None
+        # name (upper) -> {"live", "fetched_at", "last_attempt", "last_error", "next_due", "pushed_at"}
+        self._state = {}
+        self._in_flight = set()
+        self._credentials = None
+        self._thread = None
+        self._executor = None
+
+    @staticmethod
+    def _key(name):
+        return (name or "").upper()
+
+    @staticmethod
+    def poll_interval():
+        try:
+            return max(15, int(get_setting('agent_poll_interval_seconds')))
+        except (TypeError, ValueError):
+            return 60
+
+    # --- Registry ------------------------------------------------------------
+
+    def _load(self):
+        if self._devices is not None:
+            return
+        self._devices = {}
+        try:
+            with open(self.registry_file, 'r', encoding='utf-8') as f:
+                for device in json.load(f):
+                    if device.get("name") and device.get("ip"):
+                        self._devices[self._key(device["name"])] = device
+        except FileNotFoundError:
+            pass
+        except (IOError, json.JSONDecodeError) as e:
+            logger.error(f"Could not read the agent registry {self.registry_file}: {e}")
+
+    def _save(self):
+        try:
+            os.makedirs(os.path.dirname(self.registry_file), exist_ok=True)
+            tmp_file = self.registry_file + ".tmp"
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(list(self._devices.values()), f, indent=2)
+            os.replace(tmp_file, self.registry_file)
+        except IOError as e:
+            logger.error(f"Could not write the agent registry {self.registry_file}: {e}")
+
+    def add_device(self, name, ip):
+        """Registers (or updates the IP of) an agent device."""
+        key = self._key(name)
+        with self._lock:
+            self._load()
+            device = self._devices.get(key)
+            if device and device["ip"] == ip:
+                return
+            self._devices[key] = {**(device or {}), "name": name, "ip": ip, "added_at": (device or {}).get("added_at", time.time())}
+            self._save()
+        logger.info(f"Agent collector: polling {name} ({ip}).")
+
+    def issue_token(self, name, ip):
+        """
+        Registers the device and gives it a new push token, replacing any earlier one.
+        Only the token's SHA-256 is stored; the token itself is returned once, to be
+        embedded in the agent at deployment.
+        """
+        self.add_device(name, ip)
+        token = secrets.token_urlsafe(32)
+        with self._lock:
+            self._devices[self._key(name)]["token_hash"] = _hash_token(token)
+            self._save()
+        return token
+
+    def verify_token(self, name, token):
+        with self._lock:
+            self._load()
+            device = self._devices.get(self._key(name))
+            stored = (device or {}).get("token_hash")
+        return bool(stored and token) and hmac.compare_digest(stored, _hash_token(token))
+
+    def remove_device(self, name):
+        key = self._key(name)
+        with self._lock:
+            self._load()
+            removed = self._devices.pop(key, None)
+            self._state.pop(key, None)
+            if removed:
+                self._save()
+        return removed is not None
+
+    # --- Credentials and lifecycle ---------------------------------------------
+
+    def set_credentials(self, user, password):
+        """Records the WinRM credentials used for polling and starts the scheduler."""
+        with self._lock:
+            self._credentials = (user, password)
+            self._load()
+            if self._thread is None or not self._thread.is_alive():
+                self._executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_POLLS, thread_name_prefix="agent_poll")
+                self._thread = threading.Thread(target=self._run, name="agent_collector", daemon=True)
+                self._thread.start()
+
+    def forget_credentials(self, user):
+        with self._lock:
+            if self._credentials and self._credentials[0].lower() == (user or "").lower():
+                self._credentials = None
+
+    # --- Polling ---------------------------------------------------------------
+
+    def _first_due(self, key, interval, now):
+        # Stable per-host offset spreads the fleet evenly over the interval
+        return now + (zlib.crc32(key.encode()) % (interval * 1000)) / 1000
+
+    def _run(self):
+        while True:
+            time.sleep(SCHEDULER_TICK_SECONDS)
+            interval = self.poll_interval()
+            now = time.time()
+            due = []
+            with self._lock:
+                if self._credentials is None:
+                    continue
+                credentials = self._credentials
+                for key, device in self._devices.items():
+                    state = self._state.setdefault(key, {"live": None, "fetched_at": None, "last_attempt": None, "last_error": None})
+                    if state.get("next_due") is None:
+                        state["next_due"] = self._first_due(key, interval, now)
+                    if key in self._in_flight or state["next_due"] > now:
+                        continue
+                    # Devices that push their samples need no WinRM round-trip
+                    if state.get("pushed_at") and now - state["pushed_at"] < interval * LIVE_CACHE_INTERVALS:
+                        state["next_due"] = now + interval
+                        continue
+                    jitter = random.uniform(-POLL_JITTER_RATIO, POLL_JITTER_RATIO) * interval
+                    # Schedule from the previous slot to keep the cadence, but never in the past
+                    state["next_due"] = max(state["next_due"] + interval + jitter, now + interval / 2)
+                    self._in_flight.add(key)
+                    due.append((key, dict(device)))
+            for key, device in due:
+                try:
+                    self._executor.submit(self._poll, key, device, credentials)
+                except RuntimeError:
+                    # The executor is shut down when the interpreter exits
+                    return
+
+    def _poll(self, key, device, credentials):
+        try:
+            result, _ = read_agent_data(device["ip"], device["name"], *credentials)
+            with self._lock:
+                state = self._state.get(key)
+                if state is None:
+                    return
+                state["last_attempt"] = time.time()
+                if result.get("ok"):
+                    state["live"] = result["liveData"]
+                    # The cache ages with the sample itself, not with the poll that read it
+                    state["fetched_at"] = _sample_time(result["liveData"], state["last_attempt"])
+                    state["last_error"] = None
+                else:
+                    state["last_error"] = result.get("details") or result.get("error")
+        except Exception as e:
+            logger.error(f"Agent collector: polling {device['name']} failed: {e}", exc_info=True)
+        finally:
+            with self._lock:
+                self._in_flight.discard(key)
+
+    # --- Reading -----------------------------------------------------------------
+
+    def record_live(self, name, ip, live_data):
+        """Stores a sample fetched outside the collector (e.g. an on-demand read) and registers the device."""
+        self.add_device(name, ip)
+        with self._lock:
+            state = self._state.setdefault(self._key(name), {"live": None, "fetched_at": None, "last_attempt": None, "last_error": None})
+            state["live"] = live_data
+            state["last_attempt"] = time.time()
+            state["fetched_at"] = _sample_time(live_data, state["last_attempt"])
+            state["last_error"] = None
+
+    def record_push(self, name, samples):
+        """
+        Stores a batch pushed by an agent: every sample goes to the metrics database in
+        one queue pass and the newest one becomes the cached live data.
+        Returns the number of samples accepted.
+        """
+        parsed = []
+        for sample in samples[-MAX_PUSH_SAMPLES:]:
+            try:
+                parsed.append((parse_timestamp(sample["timestamp"]), sample))
+            except (KeyError, TypeError, ValueError, AttributeError):
+                continue
+        if not parsed:
+            return 0
+        parsed.sort(key=lambda item: item[0])
+        metrics_store.append_many(name, [(ts, sample.get("cpuUsage"), sample.get("usedMemoryGB")) for ts, sample in parsed])
+
+        now = time.time()
+        with self._lock:
+            state = self._state.setdefault(self._key(name), {"live": None, "fetched_at": None, "last_attempt": None, "last_error": None})
+            state["live"] = parsed[-1][1]
+            state["pushed_at"] = now
+            state["fetched_at"] = min(parsed[-1][0], now)
+            state["last_error"] = None
+        return len(parsed)
+
+    def get_live(self, name):
+        """Returns (live_data, fetched_at) if a fresh enough sample is cached, else (None, None); fetched_at is the sample's own time."""
+        max_age = self.poll_interval() * LIVE_CACHE_INTERVALS
+        with self._lock:
+            state = self._state.get(self._key(name))
+            if not state or not state["live"] or time.time() - state["fetched_at"] > max_age:
+                return None, None
+            return state["live"], state["fetched_at"]
+
+    def status(self):
+        with self._lock:
+            self._load()
+            devices = []
+            for key, device in sorted(self._devices.items()):
+                state = self._state.get(key) or {}
+                devices.append({
+                    "name": device["name"], "ip": device["ip"],
+                    "fetched_at": state.get("fetched_at"), "last_attempt": state.get("last_attempt"),
+                    "last_error": state.get("last_error"), "next_due": state.get("next_due"),
+                    "pushed_at": state.get("pushed_at"), "push_enabled": bool(device.get("token_hash")),
+                })
+            return {
+                "running": self._thread is not None and self._thread.is_alive() and self._credentials is not None,
+                "interval_seconds": self.poll_interval(),
+                "devices": devices,
+            }
+
+
+# A single collector shared across the app
+agent_collector = AgentCollector()
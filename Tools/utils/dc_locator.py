@@ -0,0 +1,158 @@
+# اكتشاف وحدات التحكم بالمجال (DC) عبر سجلات SRV وترتيبها حسب زمن الاستجابة
+import os
+import re
+import time
+import socket
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from Tools.utils.logger import logger
+
+LDAP_PORT = 389
+LDAPS_PORT = 636
+# How long a ranking is trusted before the DCs are probed again
+RERANK_SECONDS = 600
+# TCP connect timeout used when probing a DC
+PROBE_TIMEOUT = 1.5
+# A new DC only replaces the current first choice if it is this much faster (sticky choice)
+STICKY_LATENCY_RATIO = 0.7
+MAX_PROBE_WORKERS = 16
+
+
+def _srv_names(domain):
+    # DC-specific records first; _ldap._tcp.<domain> can also list non-DC LDAP servers
+    return [f"_ldap._tcp.dc._msdcs.{domain}", f"_ldap._tcp.{domain}"]
+
+
+def _lookup_srv_dnspython(name):
+    import dns.resolver
+    answers = dns.resolver.resolve(name, "SRV", lifetime=3)
+    return [
+        {"host": str(answer.target).rstrip("."), "port": int(answer.port),
+         "priority": int(answer.priority), "weight": int(answer.weight)}
+        for answer in answers
+    ]
+
+
+def _lookup_srv_nslookup(name):
+    """Fallback for hosts without dnspython. Understands Windows and BIND style nslookup output."""
+    kwargs = {"creationflags": subprocess.CREATE_NO_WINDOW} if os.name == "nt" else {}
+    proc = subprocess.run(["nslookup", "-type=SRV", name], capture_output=True, text=True, timeout=10, **kwargs)
+    output = proc.stdout
+    records = []
+    # BIND style: "<name>  service = 0 100 389 dc1.corp.local."
+    for priority, weight, port, host in re.findall(r"service = (\d+) (\d+) (\d+) (\S+)", output):
+        records.append({"host": host.rstrip("."), "port": int(port), "priority": int(priority), "weight": int(weight)})
+    # Windows style: blocks of "priority = 0", "weight = 100", "port = 389", "svr hostname = dc1.corp.local"
+    current = {}
+    for line in output.splitlines():
+        match = re.match(r"\s*(priority|weight|port|svr hostname)\s*=\s*(\S+)", line)
+        if not match:
+            continue
+        key, value = match.groups()
+        if key == "svr hostname":
+            current["host"] = value.rstrip(".")
+            if "port" in current:
+                records.append({"priority": 0, "weight": 0, **current})
+            current = {}
+        else:
+            current[key] = int(value)
+    return records
+
+
+def lookup_domain_controllers(domain):
+    """Returns the SRV records of the domain's LDAP servers, or [] if none could be found."""
+    for name in _srv_names(domain):
+        try:
+            try:
+                records = _lookup_srv_dnspython(name)
+            except ImportError:
+                records = _lookup_srv_nslookup(name)
+        except Exception as e:
+            logger.info(f"SRV lookup of {name} failed: {e}")
+            continue
+        if records:
+            # The same DC can be listed under several names
+            unique = {record["host"].lower(): record for record in records}
+            return list(unique.values())
+    return []
+
+
+def probe_latency(host, port, timeout=PROBE_TIMEOUT):
+    """Returns the TCP connect time to host:port in milliseconds, or None if it is unreachable."""
+    started = time.perf_counter()
+    try:
+        with socket.create_connection((host, port), timeout=timeout):
+            return round((time.perf_counter() - started) * 1000, 2)
+    except OSError:
+        return None
+
+
+def _probe(record):
+    ldap_latency = probe_latency(record["host"], record.get("port") or LDAP_PORT)
+    ldaps_latency = probe_latency(record["host"], LDAPS_PORT) if ldap_latency is not None else None
+    return {
+        **record,
+        "latency_ms": ldap_latency,
+        "ldaps": ldaps_latency is not None,
+        "healthy": ldap_latency is not None,
+    }
+
+
+class DomainControllerLocator:
+    """
+    Finds the DCs of a domain via SRV records, probes them concurrently and keeps
+    a ranking: healthy before unhealthy, then by SRV priority and latency.
+    The first choice is sticky - it only changes when it stops answering or when
+    another DC is clearly faster - so every AD call keeps going to the same DC.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rankings = {}
+
+    def _rank(self, domain, previous):
+        records = lookup_domain_controllers(domain)
+        if not records:
+            logger.info(f"No SRV records for '{domain}', falling back to the domain name.")
+            records = [{"host": domain, "port": LDAP_PORT, "priority": 0, "weight": 0}]
+
+        with ThreadPoolExecutor(max_workers=min(MAX_PROBE_WORKERS, len(records))) as executor:
+            probed = list(executor.map(_probe, records))
+        probed.sort(key=lambda dc: (not dc["healthy"], dc["priority"], dc["latency_ms"] if dc["latency_ms"] is not None else float("inf")))
+
+        # Keep the previous first choice unless it is down or clearly slower than the new best
+        if previous and probed[0]["healthy"]:
+            current = next((dc for dc in probed if dc["host"].lower() == previous[0]["host"].lower() and dc["healthy"]), None)
+            if current and current is not probed[0] and current["priority"] == probed[0]["priority"] \
+                    and probed[0]["latency_ms"] > current["latency_ms"] * STICKY_LATENCY_RATIO:
+                probed.remove(current)
+                probed.insert(0, current)
+
+        logger.info(f"Domain controllers for '{domain}': " + ", ".join(
+            f"{dc['host']} ({dc['latency_ms']} ms)" if dc["healthy"] else f"{dc['host']} (down)" for dc in probed))
+        return probed
+
+    def get_ranking(self, domain, force_refresh=False):
+        """Returns the ranked DC list of a domain, probing again at most every RERANK_SECONDS."""
+        key = domain.lower()
+        with self._lock:
+            cached = self._rankings.get(key)
+        if cached and not force_refresh and time.time() - cached["ranked_at"] < RERANK_SECONDS:
+            return cached["dcs"]
+
+        dcs = self._rank(domain, cached["dcs"] if cached else None)
+        with self._lock:
+            self._rankings[key] = {"dcs": dcs, "ranked_at": time.time()}
+        return dcs
+
+    def report_failure(self, domain):
+        """Forces a re-rank on the next lookup, e.g. after every DC in the pool failed."""
+        with self._lock:
+            cached = self._rankings.get(domain.lower())
+            if cached:
+                cached["ranked_at"] = 0
+
+
+# A single locator shared across the app
+dc_locator = DomainControllerLocator()
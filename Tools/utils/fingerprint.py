@@ -0,0 +1,287 @@
+# بصمة الخدمات ونوع الجهاز للأجهزة المكتشفة (asyncio)
+import os
+import uuid
+import asyncio
+import struct
+from Tools.utils.logger import logger
+
+DEFAULT_FINGERPRINT_PORTS = [21, 22, 23, 25, 53, 80, 88, 135, 139, 389, 443, 445, 515, 554, 631, 3389, 5985, 8080, 9100]
+
+# Per-connection budgets (seconds). A probe never takes longer than connect + read.
+CONNECT_TIMEOUT = 1.0
+READ_TIMEOUT = 1.5
+# Upper bound on simultaneously open connections across all hosts
+FINGERPRINT_CONCURRENCY = 2000
+BANNER_MAX_BYTES = 1024
+
+# Services that talk first, and probes for services that expect the client to talk first
+BANNER_PORTS = {21, 22, 23, 25, 110, 143}
+HTTP_PORTS = {80, 8000, 8008, 8080, 8888}
+RTSP_PORTS = {554}
+SMB_PORT = 445
+
+PRINTER_PORTS = {515, 631, 9100}
+CAMERA_KEYWORDS = ("hikvision", "dahua", "axis", "uc-httpd", "dnvrs", "app-webs", "ipcam", "webcam", "netwave", "boa/")
+NETWORK_DEVICE_KEYWORDS = ("cisco", "mikrotik", "routeros", "rosssh", "procurve", "aruba", "juniper", "fortinet", "fortigate", "ubiquiti", "edgeos", "huawei", "zyxel", "netgear", "tp-link")
+PRINTER_KEYWORDS = ("printer", "jetdirect", "laserjet", "cups", "ipp", "lexmark", "kyocera", "ricoh", "xerox", "brother")
+LINUX_HINTS = (("ubuntu", "Ubuntu Linux"), ("debian", "Debian Linux"), ("raspbian", "Raspberry Pi OS"), ("centos", "CentOS Linux"), ("red hat", "Red Hat Linux"), ("freebsd", "FreeBSD"), ("openssh", "Linux/Unix"))
+
+SMB2_DIALECTS = {0x0202: "SMB 2.0.2", 0x0210: "SMB 2.1", 0x0300: "SMB 3.0", 0x0302: "SMB 3.0.2"}
+STATUS_MORE_PROCESSING_REQUIRED = 0xC0000016
+# NTLMSSP NEGOTIATE flags: UNICODE | REQUEST_TARGET | NTLM | ALWAYS_SIGN | EXTENDED_SESSIONSECURITY | TARGET_INFO | VERSION | 128 | 56
+NTLM_NEGOTIATE_FLAGS = 0xA2888205
+NTLM_FLAG_VERSION = 0x02000000
+NTLM_AV_IDS = {1: "netbios_computer", 2: "netbios_domain", 3: "dns_computer", 4: "dns_domain", 5: "dns_forest"}
+
+
+# --- SMB2 / NTLMSSP helpers ---
+
+def _netbios_frame(payload):
+    return b"\x00" + len(payload).to_bytes(3, "big") + payload
+
+
+def _smb2_header(command, message_id):
+    return struct.pack("<4sHHIHHIIQIIQ16s", b"\xfeSMB", 64, 0, 0, command, 31, 0, 0, message_id, 0xFEFF, 0, 0, b"\x00" * 16)
+
+
+def build_smb2_negotiate():
+    dialects = list(SMB2_DIALECTS)
+    body = struct.pack("<HHHHI16sQ", 36, len(dialects), 1, 0, 0, uuid.uuid4().bytes, 0)
+    body += struct.pack(f"<{len(dialects)}H", *dialects)
+    return _netbios_frame(_smb2_header(0x0000, 0) + body)
+
+
+def build_smb2_session_setup_ntlm():
+    # A raw NTLMSSP NEGOTIATE token is accepted by Windows and Samba in place of SPNEGO
+    token = b"NTLMSSP\x00" + struct.pack("<II", 1, NTLM_NEGOTIATE_FLAGS) + b"\x00" * 16
+    body = struct.pack("<HBBIIHHQ", 25, 0, 1, 0, 0, 64 + 24, len(token), 0) + token
+    return _netbios_frame(_smb2_header(0x0001, 1) + body)
+
+
+def windows_version_name(major, minor, build):
+    """Maps an NTLM OS version to a Windows release name."""
+    if major == 10:
+        server_builds = {14393: "Windows 10 1607 / Server 2016", 17763: "Windows 10 1809 / Server 2019", 20348: "Windows Server 2022", 26100: "Windows 11 24H2 / Server 2025"}
+        name = server_builds.get(build) or ("Windows 11" if build >= 22000 else "Windows 10")
+    elif (major, minor) == (6, 3):
+        name = "Windows 8.1 / Server 2012 R2"
+    elif (major, minor) == (6, 2):
+        name = "Windows 8 / Server 2012"
+    elif (major, minor) == (6, 1):
+        name = "Windows 7 / Server 2008 R2"
+    elif (major, minor) == (6, 0):
+        name = "Windows Vista / Server 2008"
+    elif major == 5:
+        name = "Windows XP / Server 2003"
+    else:
+        name = f"Windows {major}.{minor}"
+    return f"{name} (build {build})"
+
+
+def parse_ntlm_challenge(blob):
+    """Extracts the OS version and target names from an NTLMSSP CHALLENGE message."""
+    start = blob.find(b"NTLMSSP\x00")
+    if start < 0:
+        return {}
+    chal = blob[start:]
+    if len(chal) < 48 or struct.unpack("<I", chal[8:12])[0] != 2:
+        return {}
+
+    info = {}
+    flags = struct.unpack("<I", chal[20:24])[0]
+    if flags & NTLM_FLAG_VERSION and len(chal) >= 56:
+        major, minor, build = struct.unpack("<BBH", chal[48:52])
+        info["os_version"] = f"{major}.{minor}.{build}"
+        info["os"] = windows_version_name(major, minor, build)
+
+    ti_len, _, ti_offset = struct.unpack("<HHI", chal[40:48])
+    target_info = chal[ti_offset:ti_offset + ti_len]
+    pos = 0
+    while pos + 4 <= len(target_info):
+        av_id, av_len = struct.unpack("<HH", target_info[pos:pos + 4])
+        if av_id == 0:
+            break
+        if av_id in NTLM_AV_IDS:
+            info[NTLM_AV_IDS[av_id]] = target_info[pos + 4:pos + 4 + av_len].decode("utf-16-le", errors="ignore")
+        pos += 4 + av_len
+    return info
+
+
+async def _read_smb2_message(reader):
+    header = await reader.readexactly(4)
+    length = int.from_bytes(header[1:4], "big")
+    return await reader.readexactly(length)
+
+
+async def _probe_smb(reader, writer):
+    """SMB2 NEGOTIATE followed by an anonymous NTLMSSP SESSION_SETUP to read OS/version hints."""
+    info = {}
+    writer.write(build_smb2_negotiate())
+    await writer.drain()
+    response = await _read_smb2_message(reader)
+    if response[:4] != b"\xfeSMB" or len(response) < 70:
+        return info
+    dialect = struct.unpack("<H", response[68:70])[0]
+    info["smb_dialect"] = SMB2_DIALECTS.get(dialect, hex(dialect))
+    info["smb_signing_required"] = bool(struct.unpack("<H", response[66:68])[0] & 0x02)
+
+    writer.write(build_smb2_session_setup_ntlm())
+    await writer.drain()
+    response = await _read_smb2_message(reader)
+    status = struct.unpack("<I", response[8:12])[0]
+    if status != STATUS_MORE_PROCESSING_REQUIRED or len(response) < 72:
+        return info
+    buffer_offset, buffer_length = struct.unpack("<HH", response[68:72])
+    info.update(parse_ntlm_challenge(response[buffer_offset:buffer_offset + buffer_length]))
+    return info
+
+
+# --- Generic probes ---
+
+def _first_line(data):
+    return data.decode("latin-1", errors="ignore").strip().splitlines()[0][:200] if data.strip() else ""
+
+
+def _header_value(data, header_name):
+    for line in data.decode("latin-1", errors="ignore").splitlines():
+        if line.lower().startswith(header_name.lower() + ":"):
+            return line.split(":", 1)[1].strip()[:200]
+    return None
+
+
+async def _probe_port(ip, port, connect_timeout, read_timeout):
+    """Returns (is_open, details_dict) for one TCP port."""
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(ip, port), connect_timeout)
+    except (asyncio.TimeoutError, OSError):
+        return False, None
+
+    details = {}
+    try:
+        if port == SMB_PORT:
+            details = await asyncio.wait_for(_probe_smb(reader, writer), read_timeout)
+        elif port in BANNER_PORTS:
+            data = await asyncio.wait_for(reader.read(BANNER_MAX_BYTES), read_timeout)
+            if data:
+                details["banner"] = _first_line(data)
+        elif port in HTTP_PORTS or port in RTSP_PORTS:
+            if port in RTSP_PORTS:
+                request = f"OPTIONS rtsp://{ip}/ RTSP/1.0\r\nCSeq: 1\r\n\r\n"
+            else:
+                request = f"HEAD / HTTP/1.0\r\nHost: {ip}\r\nUser-Agent: Atlas-Fingerprint\r\n\r\n"
+            writer.write(request.encode("ascii"))
+            await writer.drain()
+            data = await asyncio.wait_for(reader.read(BANNER_MAX_BYTES), read_timeout)
+            if data:
+                details["banner"] = _first_line(data)
+                server = _header_value(data, "Server")
+                realm = _header_value(data, "WWW-Authenticate")
+                if server:
+                    details["server"] = server
+                if realm:
+                    details["auth"] = realm
+    except (asyncio.TimeoutError, asyncio.IncompleteReadError, OSError, struct.error, IndexError):
+        # The port is open even if the service did not answer our probe in time
+        pass
+    finally:
+        writer.close()
+        try:
+            await asyncio.wait_for(writer.wait_closed(), 0.5)
+        except (asyncio.TimeoutError, OSError):
+            pass
+    return True, details
+
+
+def classify_device(open_ports, services):
+    """
+    Derives (device_type, os_guess) from open ports and collected banners.
+    device_type is one of: domain_controller, windows, printer, camera, network_device, linux, web_device, unknown.
+    """
+    ports = set(open_ports)
+    text = " ".join(
+        " ".join(str(v) for v in details.values()) for details in services.values() if details
+    ).lower()
+    smb = services.get(SMB_PORT) or {}
+    os_guess = smb.get("os")
+
+    if ports & PRINTER_PORTS or any(k in text for k in PRINTER_KEYWORDS):
+        return "printer", os_guess
+    if any(k in text for k in CAMERA_KEYWORDS) or (ports & RTSP_PORTS and SMB_PORT not in ports):
+        return "camera", os_guess
+    if SMB_PORT in ports or 135 in ports or 3389 in ports or 5985 in ports:
+        if {88, 389} <= ports:
+            return "domain_controller", os_guess or "Windows Server"
+        if "samba" in text or (22 in ports and 135 not in ports and not os_guess):
+            return "linux", os_guess or "Linux/Unix (Samba)"
+        return "windows", os_guess or "Windows"
+    if any(k in text for k in NETWORK_DEVICE_KEYWORDS) or 23 in ports:
+        return "network_device", os_guess
+    if 22 in ports:
+        hint = next((name for keyword, name in LINUX_HINTS if keyword in text), "Linux/Unix")
+        return "linux", hint
+    if ports & (HTTP_PORTS | {443}):
+        return "web_device", os_guess
+    return "unknown", os_guess
+
+
+def _effective_concurrency(requested):
+    """Keeps concurrency below the process file-descriptor limit on POSIX systems."""
+    try:
+        import resource
+        soft_limit, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+        return max(16, min(requested, soft_limit - 64))
+    except (ImportError, ValueError, OSError):
+        return requested
+
+
+async def _fingerprint_hosts_async(ips, ports, connect_timeout, read_timeout, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded_probe(ip, port):
+        async with semaphore:
+            return ip, port, await _probe_port(ip, port, connect_timeout, read_timeout)
+
+    tasks = [bounded_probe(ip, port) for ip in ips for port in ports]
+    per_host = {ip: {} for ip in ips}
+    for ip, port, (is_open, details) in await asyncio.gather(*tasks):
+        if is_open:
+            per_host[ip][port] = details or {}
+
+    results = {}
+    for ip, services in per_host.items():
+        open_ports = sorted(services)
+        device_type, os_guess = classify_device(open_ports, services)
+        results[ip] = {
+            "open_ports": open_ports,
+            "services": {str(port): details for port, details in services.items() if details},
+            "device_type": device_type,
+            "os": os_guess,
+        }
+    return results
+
+
+def fingerprint_hosts(ips, ports=None, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT, concurrency=FINGERPRINT_CONCURRENCY):
+    """
+    Probes every (ip, port) pair concurrently and classifies each host.
+    Returns {ip: {"open_ports", "services", "device_type", "os"}}.
+    Safe to call from a Flask worker thread: it runs its own event loop.
+    """
+    ips = list(dict.fromkeys(ips))
+    ports = sorted(set(ports or DEFAULT_FINGERPRINT_PORTS))
+    if not ips:
+        return {}
+
+    concurrency = _effective_concurrency(concurrency)
+    logger.info(f"Fingerprinting {len(ips)} hosts on {len(ports)} ports ({len(ips) * len(ports)} probes, concurrency {concurrency}).")
+    if os.name == "nt":
+        # The proactor loop (Windows default) is not limited to 512 sockets like select()
+        loop = asyncio.ProactorEventLoop()
+    else:
+        loop = asyncio.new_event_loop()
+    try:
+        results = loop.run_until_complete(_fingerprint_hosts_async(ips, ports, connect_timeout, read_timeout, concurrency))
+    finally:
+        loop.close()
+
+    logger.info(f"Fingerprinting complete for {len(results)} hosts.")
+    return results
@@ -0,0 +1,288 @@
+# إدارة عناوين IP (IPAM) باستخدام خرائط بت مضغوطة لكل شبكة فرعية
+import time
+import threading
+import ipaddress
+from collections import deque
+from Tools.utils.logger import logger
+
+# Bitmaps are allocated per subnet; anything larger than a /16 is refused.
+MAX_SUBNET_ADDRESSES = 65536
+# Addresses outside every known subnet are grouped into inferred subnets of this size
+INFERRED_PREFIXLEN = 24
+# Window used for duplicate-IP and MAC-flapping reports
+CONFLICT_WINDOW_SECONDS = 3600
+# How many (mac, timestamp) observations are kept per IP
+IP_HISTORY_LENGTH = 8
+
+
+def mac_to_int(mac):
+    if not mac or mac in ("N/A", "Error"):
+        return None
+    try:
+        return int(mac.replace(":", "").replace("-", ""), 16)
+    except ValueError:
+        return None
+
+
+def int_to_mac(value):
+    raw = f"{value:012X}"
+    return ":".join(raw[i:i + 2] for i in range(0, 12, 2))
+
+
+class SubnetBitmap:
+    """
+    Address usage for one subnet, one bit per address.
+    'live' holds hosts seen by the last discovery of each range, 'ad' holds addresses
+    registered in Active Directory. A /16 costs 2 x 8 KB.
+    """
+    __slots__ = ("network", "base", "size", "live", "ad", "last_scanned", "inferred")
+
+    def __init__(self, network, inferred=False):
+        self.network = network
+        self.base = int(network.network_address)
+        self.size = network.num_addresses
+        self.live = bytearray((self.size + 7) // 8)
+        self.ad = bytearray((self.size + 7) // 8)
+        self.last_scanned = None
+        self.inferred = inferred
+
+    def contains(self, ip_int):
+        return self.base <= ip_int < self.base + self.size
+
+    @staticmethod
+    def _set(bitmap, offset):
+        bitmap[offset >> 3] |= 0x80 >> (offset & 7)
+
+    @staticmethod
+    def _test(bitmap, offset):
+        return bool(bitmap[offset >> 3] & (0x80 >> (offset & 7)))
+
+    @staticmethod
+    def _popcount(bitmap):
+        return bin(int.from_bytes(bitmap, "big")).count("1")
+
+    def mark_live(self, ip_int):
+        self._set(self.live, ip_int - self.base)
+
+    def mark_ad(self, ip_int):
+        self._set(self.ad, ip_int - self.base)
+
+    def clear_range(self, bitmap_name, start_int, end_int):
+        """Clears bits for [start_int, end_int] (inclusive), e.g. before re-recording a scan of that range."""
+        bitmap = getattr(self, bitmap_name)
+        start = max(start_int, self.base) - self.base
+        end = min(end_int, self.base + self.size - 1) - self.base
+        offset = start
+        while offset <= end:
+            # Clear whole bytes at a time when aligned
+            if offset & 7 == 0 and offset + 7 <= end:
+                bitmap[offset >> 3] = 0
+                offset += 8
+            else:
+                bitmap[offset >> 3] &= ~(0x80 >> (offset & 7)) & 0xFF
+                offset += 1
+
+    def _usable_bounds(self):
+        # Network and broadcast addresses are never assignable in subnets larger than /31
+        if self.size > 2:
+            return 1, self.size - 2
+        return 0, self.size - 1
+
+    def stats(self):
+        used_bitmap = bytes(a | b for a, b in zip(self.live, self.ad))
+        first, last = self._usable_bounds()
+        usable = last - first + 1
+        used = self._popcount(used_bitmap)
+        live = self._popcount(self.live)
+        ad = self._popcount(self.ad)
+        both = self._popcount(bytes(a & b for a, b in zip(self.live, self.ad)))
+        return {
+            "cidr": str(self.network),
+            "size": usable,
+            "used": used,
+            "free": max(usable - used, 0),
+            "utilization_pct": round(100.0 * used / usable, 2) if usable else 0.0,
+            "live": live,
+            "ad_registered": ad,
+            "live_not_in_ad": live - both,
+            "ad_not_live": ad - both,
+            "last_scanned": self.last_scanned,
+            "inferred": self.inferred,
+        }
+
+    def free_ranges(self, limit=None):
+        """Yields (first_ip, last_ip, count) runs of addresses that are neither live nor AD-registered."""
+        first, last = self._usable_bounds()
+        run_start = None
+        emitted = 0
+        for offset in range(first, last + 2):
+            is_free = offset <= last and not (self._test(self.live, offset) or self._test(self.ad, offset))
+            if is_free and run_start is None:
+                run_start = offset
+            elif not is_free and run_start is not None:
+                yield (str(ipaddress.ip_address(self.base + run_start)), str(ipaddress.ip_address(self.base + offset - 1)), offset - run_start)
+                run_start = None
+                emitted += 1
+                if limit and emitted >= limit:
+                    return
+
+
+class IpamStore:
+    """In-memory IPAM built from discovery scans and AD computer records."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subnets = {}
+        # ip_int -> deque of (mac_int, timestamp)
+        self._ip_history = {}
+        # mac_int -> {ip_int: last_seen}
+        self._mac_to_ips = {}
+        # ip_int -> set of AD computer names resolving to it
+        self._ad_names_by_ip = {}
+
+    def _subnets_for(self, ip_int):
+        """Returns every subnet containing the address, inferring a /24 if none does."""
+        subnets = [subnet for subnet in self._subnets.values() if subnet.contains(ip_int)]
+        if not subnets:
+            network = ipaddress.ip_network(f"{ipaddress.ip_address(ip_int)}/{INFERRED_PREFIXLEN}", strict=False)
+            subnet = SubnetBitmap(network, inferred=True)
+            self._subnets[str(network)] = subnet
+            subnets = [subnet]
+        return subnets
+
+    def ensure_subnet(self, cidr):
+        """Registers a subnet so that it gets its own bitmap. Returns False if it is too large."""
+        network = ipaddress.ip_network(cidr, strict=False)
+        if network.version != 4 or network.num_addresses > MAX_SUBNET_ADDRESSES:
+            return False
+        key = str(network)
+        with self._lock:
+            existing = self._subnets.get(key)
+            if existing is None:
+                subnet = SubnetBitmap(network)
+                # Carry over bits from inferred subnets that the new subnet now covers
+                for other_key, other in list(self._subnets.items()):
+                    if other.inferred and other.network.subnet_of(network):
+                        for offset in range(other.size):
+                            if SubnetBitmap._test(other.live, offset):
+                                subnet.mark_live(other.base + offset)
+                            if SubnetBitmap._test(other.ad, offset):
+                                subnet.mark_ad(other.base + offset)
+                        del self._subnets[other_key]
+                self._subnets[key] = subnet
+            elif existing.inferred:
+                existing.inferred = False
+        return True
+
+    def record_scan(self, cidr, hosts, scanned_at=None):
+        """
+        Records the result of a discovery scan. hosts is an iterable of (ip, mac-or-None).
+        The live bits of the scanned range are reset first, so the bitmap reflects the latest scan.
+        """
+        network = ipaddress.ip_network(cidr, strict=False)
+        if network.version != 4:
+            return
+        scanned_at = scanned_at or time.time()
+        with self._lock:
+            covered = any(not subnet.inferred and network.subnet_of(subnet.network) for subnet in self._subnets.values())
+        # A scan of part of a known subnet is recorded into that subnet instead of creating a new one
+        if not covered and network.num_addresses <= MAX_SUBNET_ADDRESSES:
+            self.ensure_subnet(cidr)
+
+        start_int = int(network.network_address)
+        end_int = int(network.broadcast_address)
+        with self._lock:
+            for subnet in self._subnets.values():
+                if subnet.network.overlaps(network):
+                    subnet.clear_range("live", start_int, end_int)
+                    subnet.last_scanned = scanned_at
+
+            for ip, mac in hosts:
+                ip_int = int(ipaddress.ip_address(ip))
+                for subnet in self._subnets_for(ip_int):
+                    subnet.mark_live(ip_int)
+                mac_int = mac_to_int(mac)
+                if mac_int is None:
+                    continue
+                history = self._ip_history.setdefault(ip_int, deque(maxlen=IP_HISTORY_LENGTH))
+                if not history or history[-1][0] != mac_int:
+                    history.append((mac_int, scanned_at))
+                else:
+                    history[-1] = (mac_int, scanned_at)
+                self._mac_to_ips.setdefault(mac_int, {})[ip_int] = scanned_at
+
+    def record_ad_computers(self, computers):
+        """Replaces the AD-registered bits with the resolved IPs of the given AD computer records."""
+        resolved = []
+        for computer in computers:
+            try:
+                resolved.append((int(ipaddress.ip_address(computer.get("dns_hostname") or "")), computer.get("name") or ""))
+            except ValueError:
+                continue
+
+        with self._lock:
+            for subnet in self._subnets.values():
+                subnet.ad = bytearray(len(subnet.ad))
+            self._ad_names_by_ip = {}
+            for ip_int, name in resolved:
+                if ipaddress.ip_address(ip_int).version != 4:
+                    continue
+                for subnet in self._subnets_for(ip_int):
+                    subnet.mark_ad(ip_int)
+                self._ad_names_by_ip.setdefault(ip_int, set()).add(name)
+        logger.info(f"IPAM: recorded {len(resolved)} AD computer addresses.")
+
+    def subnet_summaries(self):
+        with self._lock:
+            subnets = list(self._subnets.values())
+            return sorted((subnet.stats() for subnet in subnets), key=lambda s: ipaddress.ip_network(s["cidr"]))
+
+    def subnet_detail(self, cidr, max_ranges=256):
+        network = ipaddress.ip_network(cidr, strict=False)
+        with self._lock:
+            subnet = self._subnets.get(str(network))
+            if subnet is None:
+                return None
+            detail = subnet.stats()
+            detail["free_ranges"] = [
+                {"start": first, "end": last, "count": count}
+                for first, last, count in subnet.free_ranges(limit=max_ranges)
+            ]
+            return detail
+
+    def conflicts(self, window_seconds=CONFLICT_WINDOW_SECONDS):
+        """
+        duplicate_ips: IPs answered by more than one MAC within the window, or claimed by several AD computers.
+        mac_flapping: MACs seen on more than one IP within the window.
+        """
+        cutoff = time.time() - window_seconds
+        duplicate_ips = []
+        mac_flapping = []
+        with self._lock:
+            for ip_int, history in self._ip_history.items():
+                recent_macs = {mac for mac, seen_at in history if seen_at >= cutoff}
+                if len(recent_macs) > 1:
+                    duplicate_ips.append({
+                        "ip": str(ipaddress.ip_address(ip_int)),
+                        "source": "discovery",
+                        "macs": sorted(int_to_mac(mac) for mac in recent_macs),
+                    })
+            for ip_int, names in self._ad_names_by_ip.items():
+                if len(names) > 1:
+                    duplicate_ips.append({
+                        "ip": str(ipaddress.ip_address(ip_int)),
+                        "source": "ad",
+                        "computers": sorted(names),
+                    })
+            for mac_int, ips in self._mac_to_ips.items():
+                recent_ips = [ip_int for ip_int, seen_at in ips.items() if seen_at >= cutoff]
+                if len(recent_ips) > 1:
+                    mac_flapping.append({
+                        "mac": int_to_mac(mac_int),
+                        "ips": [str(ipaddress.ip_address(ip_int)) for ip_int in sorted(recent_ips)],
+                    })
+        return {"duplicate_ips": duplicate_ips, "mac_flapping": mac_flapping}
+
+
+# A single instance shared across the app
+ipam_store = IpamStore()
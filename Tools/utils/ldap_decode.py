@@ -0,0 +1,81 @@
+# تحويل سريع لنتائج LDAP الخام (raw_attributes) دون المرور بكائنات Entry في ldap3
+from datetime import datetime, timedelta, timezone
+
+# lastLogonTimestamp / accountExpires use this for "never"
+FILETIME_NEVER = 0x7FFFFFFFFFFFFFFF
+_FILETIME_EPOCH = datetime(1601, 1, 1, tzinfo=timezone.utc)
+# ACCOUNTDISABLE flag in userAccountControl
+UAC_ACCOUNT_DISABLE = 0x0002
+DISPLAY_FORMAT = "%Y-%m-%d %H:%M:%S"
+NEVER = "Never"
+
+
+def decode_str(raw):
+    return raw.decode("utf-8", "replace")
+
+
+def decode_filetime(raw):
+    """FILETIME (100ns intervals since 1601-01-01 UTC, as a decimal string) -> aware datetime or None."""
+    value = int(raw)
+    if value <= 0 or value >= FILETIME_NEVER:
+        return None
+    return _FILETIME_EPOCH + timedelta(microseconds=value // 10)
+
+
+def decode_generalized_time(raw):
+    """GeneralizedTime as AD sends it ('20240101120000.0Z') -> aware UTC datetime."""
+    text = raw.decode("ascii")
+    return datetime(int(text[0:4]), int(text[4:6]), int(text[6:8]),
+                    int(text[8:10]), int(text[10:12]), int(text[12:14]), tzinfo=timezone.utc)
+
+
+def decode_enabled(raw):
+    """userAccountControl -> True unless ACCOUNTDISABLE is set."""
+    return not int(raw) & UAC_ACCOUNT_DISABLE
+
+
+def _display(dt):
+    return dt.astimezone().strftime(DISPLAY_FORMAT)
+
+
+def filetime_epoch(raw):
+    """FILETIME -> Unix epoch seconds, or None for "never"; sortable where the display string is not."""
+    dt = decode_filetime(raw)
+    return int(dt.timestamp()) if dt else None
+
+
+def filetime_display(raw):
+    dt = decode_filetime(raw)
+    return _display(dt) if dt else NEVER
+
+
+def generalized_time_display(raw):
+    return _display(decode_generalized_time(raw))
+
+
+class RecordDecoder:
+    """
+    Turns the raw_attributes of a search result entry into a record dict using a
+    precomputed list of (output key, attribute name, converter, default).
+    Only the first value of each attribute is decoded; a missing or undecodable
+    attribute yields the default.
+    """
+    __slots__ = ("fields", "attributes")
+
+    def __init__(self, fields):
+        self.fields = tuple(fields)
+        self.attributes = list(dict.fromkeys(attribute for _, attribute, _, _ in self.fields))
+
+    def decode(self, raw_attributes):
+        record = {}
+        get = raw_attributes.get
+        for key, attribute, converter, default in self.fields:
+            values = get(attribute)
+            if values:
+                try:
+                    record[key] = converter(values[0])
+                    continue
+                except (ValueError, TypeError, IndexError):
+                    pass
+            record[key] = default
+        return record
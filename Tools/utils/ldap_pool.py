@@ -0,0 +1,190 @@
+# تجميع اتصالات LDAP وإعادة استخدامها لكل مستخدم
+import time
+import hashlib
+import threading
+from Tools.utils.logger import logger
+from Tools.utils.dc_locator import dc_locator, LDAP_PORT, LDAPS_PORT
+
+# Idle connections kept per (domain, user)
+POOL_MAX_IDLE_PER_USER = 4
+# Connections idle for longer than this are probed with a rootDSE read before reuse
+IDLE_HEALTH_CHECK_SECONDS = 30
+# Connections idle for longer than this are closed instead of reused
+MAX_IDLE_SECONDS = 600
+LDAP_CONNECT_TIMEOUT = 5
+LDAP_RECEIVE_TIMEOUT = 60
+# Seconds a DC that failed to answer is skipped by the server pool
+DEAD_SERVER_SECONDS = 60
+# Page size for the simple paged results control. AD's MaxPageSize defaults to 1000,
+# so anything larger would be silently truncated.
+LDAP_PAGE_SIZE = 500
+
+
+def paged_search(conn, search_base, search_filter, attributes, page_size=LDAP_PAGE_SIZE, controls=None):
+    """
+    Runs a search with the simple paged results control and yields result entries
+    (dicts with 'dn', 'attributes' and 'raw_attributes') one page at a time,
+    so results are complete beyond MaxPageSize and memory use stays flat.
+    """
+    for entry in conn.extend.standard.paged_search(search_base=search_base,
+                                                   search_filter=search_filter,
+                                                   attributes=attributes,
+                                                   paged_size=page_size,
+                                                   controls=controls,
+                                                   generator=True):
+        if entry.get("type") == "searchResEntry":
+            yield entry
+
+
+class LdapConnectionPool:
+    """
+    Keeps bound ldap3 connections per (domain, user) for reuse across requests.
+    Binds go through an ldap3 ServerPool (FIRST strategy, active checks) built
+    from the DCs ranked by dc_locator, so they stick to the fastest healthy DC
+    and fail over in ranking order. Each Server object is shared: the first
+    bind downloads the DSA info and schema, later binds reuse them instead of
+    fetching them again. The transport (LDAPS or LDAP) that worked last for a
+    domain is tried first, and LDAPS is skipped when no DC listens on 636.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._idle = {}
+        self._servers = {}
+        self._server_orders = {}
+        self._transport = {}
+
+    @staticmethod
+    def _key(domain, user, password):
+        password_digest = hashlib.sha256((password or "").encode("utf-8")).hexdigest()
+        return (domain.lower(), user.lower(), password_digest)
+
+    def _get_server_pool(self, domain, use_ssl, dcs):
+        from ldap3 import Server, ServerPool, ALL, FIRST
+        server_key = (domain.lower(), use_ssl)
+        order = tuple(dc["host"].lower() for dc in dcs)
+        with self._lock:
+            pool = self._servers.get(server_key)
+            if pool is None or self._server_orders.get(server_key) != order:
+                port = LDAPS_PORT if use_ssl else LDAP_PORT
+                # Reuse existing Server objects so their cached schema survives a re-rank
+                existing = {server.host.lower(): server for server in pool.servers} if pool is not None else {}
+                servers = [
+                    existing.get(dc["host"].lower()) or Server(dc["host"], port=port, get_info=ALL, use_ssl=use_ssl, connect_timeout=LDAP_CONNECT_TIMEOUT)
+                    for dc in dcs if not use_ssl or dc["ldaps"] or not dc["healthy"]
+                ]
+                pool = ServerPool(servers, FIRST, active=1, exhaust=DEAD_SERVER_SECONDS)
+                self._servers[server_key] = pool
+                self._server_orders[server_key] = order
+            return pool
+
+    @staticmethod
+    def _keep_server_info(server):
+        """Stops later binds from re-reading DSA info and schema once the server has them."""
+        from ldap3 import NONE
+        if server.info is not None and server.get_info != NONE:
+            server.get_info = NONE
+
+    def _bind(self, domain, user, password):
+        from ldap3 import Connection, SIMPLE
+        dcs = dc_locator.get_ranking(domain)
+        preferred = self._transport.get(domain.lower())
+        transports = [preferred, not preferred] if preferred is not None else [True, False]
+        if not any(dc["ldaps"] for dc in dcs):
+            # Nobody listens on 636, do not pay for a failing SSL attempt
+            transports = [False]
+        last_error = None
+
+        for use_ssl in transports:
+            pool = self._get_server_pool(domain, use_ssl, dcs)
+            try:
+                conn = Connection(pool, user=user, password=password, authentication=SIMPLE,
+                                  auto_bind=True, receive_timeout=LDAP_RECEIVE_TIMEOUT)
+                if conn.bound:
+                    self._transport[domain.lower()] = use_ssl
+                    self._keep_server_info(conn.server)
+                    logger.info(f"LDAP connection {'with' if use_ssl else 'without'} SSL successful to {conn.server.host}.")
+                    return conn, None
+                last_error = f"Bind to {conn.server.host} returned without being bound."
+            except Exception as e:
+                last_error = str(e)
+                logger.warning(f"LDAP connection {'with' if use_ssl else 'without'} SSL to '{domain}' failed: {e}")
+        dc_locator.report_failure(domain)
+        return None, last_error
+
+    @staticmethod
+    def _is_healthy(conn, idle_for):
+        if conn.closed or not conn.bound:
+            return False
+        if idle_for < IDLE_HEALTH_CHECK_SECONDS:
+            return True
+        from ldap3 import BASE
+        try:
+            return bool(conn.search("", "(objectClass=*)", search_scope=BASE, attributes=["1.1"]))
+        except Exception as e:
+            logger.info(f"Discarding stale pooled LDAP connection: {e}")
+            return False
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.unbind()
+        except Exception:
+            pass
+
+    def acquire(self, domain, user, password):
+        """
+        Returns (connection, error_message). Reuses a healthy idle connection when
+        possible and binds a new one otherwise.
+        """
+        key = self._key(domain, user, password)
+        while True:
+            with self._lock:
+                idle = self._idle.get(key)
+                item = idle.pop() if idle else None
+            if item is None:
+                break
+            conn, released_at = item
+            if self._is_healthy(conn, time.time() - released_at):
+                return conn, None
+            self._close(conn)
+
+        conn, error = self._bind(domain, user, password)
+        if conn is not None:
+            conn.atlas_pool_key = key
+        return conn, error
+
+    def release(self, conn, discard=False):
+        """Returns a connection to the pool, or closes it if it is broken or the pool is full."""
+        if conn is None:
+            return
+        key = getattr(conn, "atlas_pool_key", None)
+        if discard or key is None or conn.closed or not conn.bound:
+            self._close(conn)
+            return
+
+        now = time.time()
+        expired = []
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            expired = [c for c, released_at in idle if now - released_at > MAX_IDLE_SECONDS]
+            idle[:] = [(c, released_at) for c, released_at in idle if now - released_at <= MAX_IDLE_SECONDS]
+            if len(idle) < POOL_MAX_IDLE_PER_USER:
+                idle.append((conn, now))
+                conn = None
+        for stale in expired:
+            self._close(stale)
+        if conn is not None:
+            self._close(conn)
+
+    def invalidate_user(self, domain, user):
+        """Closes every idle connection of a user (e.g. on logout)."""
+        with self._lock:
+            keys = [key for key in self._idle if key[0] == domain.lower() and key[1] == user.lower()]
+            connections = [conn for key in keys for conn, _ in self._idle.pop(key)]
+        for conn in connections:
+            self._close(conn)
+
+
+# A single pool shared across the app
+ldap_pool = LdapConnectionPool()
@@ -0,0 +1,375 @@
+# قاعدة بيانات SQLite (WAL) لتاريخ أداء الأجهزة مع كاتب واحد في الخلفية
+import os
+import re
+import json
+import time
+import queue
+import struct
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from Tools.utils.logger import logger
+from Tools.utils.settings_manager import get_setting
+
+LOGS_DIR = os.path.join(os.path.dirname(__file__), '..', 'monitoring_logs')
+DB_FILE = os.path.join(LOGS_DIR, 'metrics.db')
+# The writer commits after this many queued samples or this many seconds, whichever comes first
+WRITE_BATCH_SIZE = 500
+WRITE_FLUSH_SECONDS = 1.0
+# How often the writer deletes samples older than the retention setting
+RETENTION_CHECK_SECONDS = 600
+# Largest number of points a single range query returns
+MAX_RANGE_POINTS = 100000
+# Rollup resolutions in seconds, finest first; each bucket keeps min/max/avg/last per metric
+ROLLUP_RESOLUTIONS = (60, 300, 3600)
+# Points a history query aims for when the caller does not ask for a number
+DEFAULT_TARGET_POINTS = 600
+# Fixed-width records of the previous segment store (timestamp, cpu, mem)
+LEGACY_SEGMENT_RECORD = struct.Struct("<dff")
+LEGACY_SEGMENT_SUFFIX = ".seg"
+IMPORTED_SUFFIX = ".imported"
+
+_UNSAFE_NAME = re.compile(r"[^A-Za-z0-9._-]")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS samples (
+    device TEXT NOT NULL,
+    ts REAL NOT NULL,
+    cpu REAL,
+    mem REAL,
+    PRIMARY KEY (device, ts)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS rollups (
+    device TEXT NOT NULL,
+    resolution INTEGER NOT NULL,
+    bucket REAL NOT NULL,
+    samples INTEGER NOT NULL,
+    cpu_min REAL, cpu_max REAL, cpu_avg REAL, cpu_last REAL,
+    mem_min REAL, mem_max REAL, mem_avg REAL, mem_last REAL,
+    PRIMARY KEY (device, resolution, bucket)
+) WITHOUT ROWID;
+"""
+
+# Recomputes the buckets of one resolution from the raw samples in [:start, :end).
+# Rebuilding a bucket from scratch keeps it correct when a late or duplicate sample arrives.
+ROLLUP_SQL = """
+INSERT OR REPLACE INTO rollups
+SELECT g.device, :resolution, g.bucket, COUNT(*), MIN(g.cpu), MAX(g.cpu), AVG(g.cpu),
+       (SELECT s.cpu FROM samples s WHERE s.device = g.device AND s.ts >= g.bucket AND s.ts < g.bucket + :resolution ORDER BY s.ts DESC LIMIT 1),
+       MIN(g.mem), MAX(g.mem), AVG(g.mem),
+       (SELECT s.mem FROM samples s WHERE s.device = g.device AND s.ts >= g.bucket AND s.ts < g.bucket + :resolution ORDER BY s.ts DESC LIMIT 1)
+FROM (SELECT device, CAST(ts / :resolution AS INTEGER) * :resolution AS bucket, cpu, mem
+      FROM samples WHERE (:device IS NULL OR device = :device) AND ts >= :start AND ts < :end) g
+GROUP BY g.device, g.bucket
+"""
+
+
+def parse_timestamp(value):
+    """ISO-8601 string as written by the agent ('...Z' or '+00:00') -> epoch seconds."""
+    dt = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def format_timestamp(ts):
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat().replace('+00:00', 'Z')
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _from_nan(value):
+    return None if value != value else value
+
+
+def device_key(name):
+    return _UNSAFE_NAME.sub("_", name or "").upper()
+
+
+class MetricsDatabase:
+    """
+    CPU / memory history of every device in one SQLite database in WAL mode.
+    Samples are keyed by (device, ts), so re-reading an unchanged agent file is
+    a no-op and range reads are index scans. Next to the raw samples the writer
+    keeps 1 min / 5 min / 1 h rollups (min, max, avg and last of each metric),
+    updated with every batch, so long windows are served from a few hundred
+    pre-aggregated rows.
+
+    Request threads never write: append() queues the sample and a single writer
+    thread commits queued samples in batches, which avoids lost updates between
+    concurrent requests for the same device and keeps write transactions short.
+    Readers use their own per-thread connections and, thanks to WAL, are never
+    blocked by the writer. On first start the writer imports the older JSON
+    history files and segment directories found in monitoring_logs.
+    """
+
+    def __init__(self, path=DB_FILE):
+        self.path = path
+        self._queue = queue.Queue()
+        self._local = threading.local()
+        self._start_lock = threading.Lock()
+        self._writer = None
+        self._ready = threading.Event()
+        # Set when the writer could not open the database; every later call fails right away
+        self._start_error = None
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _reader(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def start(self):
+        """
+        Starts the writer thread (idempotent) and waits until the schema exists.
+        Raises sqlite3.OperationalError if the database could not be opened.
+        """
+        with self._start_lock:
+            if self._start_error is None and (self._writer is None or not self._writer.is_alive()):
+                self._writer = threading.Thread(target=self._run_writer, name="metrics_writer", daemon=True)
+                self._writer.start()
+        self._ready.wait(timeout=30)
+        if self._start_error is not None:
+            raise sqlite3.OperationalError(f"The monitoring database is unavailable: {self._start_error}")
+
+    # --- Writing -------------------------------------------------------------
+
+    def append(self, name, ts, cpu, mem):
+        """Queues one sample for the writer thread."""
+        self.start()
+        self._queue.put((device_key(name), float(ts), _to_float(cpu), _to_float(mem)))
+
+    def append_many(self, name, samples):
+        """Queues [(ts, cpu, mem), ...] of one device."""
+        self.start()
+        device = device_key(name)
+        for ts, cpu, mem in samples:
+            self._queue.put((device, float(ts), _to_float(cpu), _to_float(mem)))
+
+    def flush(self, timeout=10):
+        """Blocks until everything queued so far has been committed."""
+        self.start()
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def _run_writer(self):
+        try:
+            conn = self._connect()
+            conn.executescript(SCHEMA)
+            conn.commit()
+        except Exception as e:
+            self._start_error = e
+            logger.error(f"Could not open the monitoring database {self.path}: {e}", exc_info=True)
+            return
+        finally:
+            # Waiting callers are released either way; they check _start_error
+            self._ready.set()
+        try:
+            self._import_legacy(conn)
+            # Databases written before rollups existed (or just imported) are aggregated once
+            if conn.execute("SELECT 1 FROM samples LIMIT 1").fetchone() and not conn.execute("SELECT 1 FROM rollups LIMIT 1").fetchone():
+                with conn:
+                    self._update_rollups(conn, None, 0, 1e12)
+                logger.info("Built monitoring rollups for the existing history.")
+        except Exception as e:
+            logger.error(f"Importing legacy monitoring history failed: {e}", exc_info=True)
+
+        last_retention_check = 0
+        while True:
+            batch, waiters = [], []
+            item = self._queue.get()
+            deadline = time.monotonic() + WRITE_FLUSH_SECONDS
+            while True:
+                if isinstance(item, threading.Event):
+                    waiters.append(item)
+                    # A flush request commits right away
+                    deadline = 0
+                elif item is not None:
+                    batch.append(item)
+                if len(batch) >= WRITE_BATCH_SIZE:
+                    break
+                try:
+                    item = self._queue.get(timeout=max(0, deadline - time.monotonic())) if deadline \
+                        else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            try:
+                if batch:
+                    with conn:
+                        conn.executemany("INSERT OR IGNORE INTO samples (device, ts, cpu, mem) VALUES (?, ?, ?, ?)", batch)
+                        touched = {}
+                        for device, ts, _, _ in batch:
+                            low, high = touched.get(device, (ts, ts))
+                            touched[device] = (min(low, ts), max(high, ts))
+                        for device, (low, high) in touched.items():
+                            self._update_rollups(conn, device, low, high)
+                if time.time() - last_retention_check > RETENTION_CHECK_SECONDS:
+                    last_retention_check = time.time()
+                    self._apply_retention(conn)
+            except sqlite3.Error as e:
+                logger.error(f"Failed to write {len(batch)} monitoring samples: {e}")
+            for waiter in waiters:
+                waiter.set()
+
+    @staticmethod
+    def _update_rollups(conn, device, low, high):
+        """Rebuilds every rollup bucket of a device (or all devices) overlapping [low, high]."""
+        for resolution in ROLLUP_RESOLUTIONS:
+            conn.execute(ROLLUP_SQL, {
+                "resolution": resolution, "device": device,
+                "start": low // resolution * resolution, "end": high // resolution * resolution + resolution,
+            })
+
+    def _apply_retention(self, conn):
+        cutoff = time.time() - get_setting('log_retention_hours') * 3600
+        with conn:
+            deleted = conn.execute("DELETE FROM samples WHERE ts < ?", (cutoff,)).rowcount
+            conn.execute("DELETE FROM rollups WHERE bucket + resolution <= ?", (cutoff,))
+        if deleted:
+            logger.info(f"Deleted {deleted} monitoring samples older than the retention period.")
+
+    def _import_legacy(self, conn):
+        """
+        One-time import of history written before this database existed:
+        monitoring_logs/<name>.json files and monitoring_logs/<DEVICE>/*.seg segment
+        directories. Imported files are renamed with an '.imported' suffix.
+        """
+        root = os.path.dirname(self.path)
+        for entry in sorted(os.listdir(root)):
+            path = os.path.join(root, entry)
+            rows = []
+            try:
+                if entry.endswith(".json") and os.path.isfile(path):
+                    device = device_key(entry[:-len(".json")])
+                    with open(path, 'r', encoding='utf-8') as f:
+                        points = json.load(f)
+                    # Other JSON files kept here (e.g. the agent registry) are not history
+                    if not isinstance(points, list) or not any(isinstance(point, dict) and "timestamp" in point for point in points):
+                        continue
+                    for point in points:
+                        try:
+                            rows.append((device, parse_timestamp(point["timestamp"]),
+                                         _to_float(point.get("cpuUsage")), _to_float(point.get("usedMemoryGB"))))
+                        except (KeyError, TypeError, ValueError, AttributeError):
+                            continue
+                elif os.path.isdir(path) and not entry.endswith(IMPORTED_SUFFIX):
+                    segments = [name for name in os.listdir(path) if name.endswith(LEGACY_SEGMENT_SUFFIX)]
+                    if not segments:
+                        continue
+                    for segment in segments:
+                        with open(os.path.join(path, segment), 'rb') as f:
+                            buf = f.read()
+                        usable = len(buf) - len(buf) % LEGACY_SEGMENT_RECORD.size
+                        rows.extend((entry, ts, _from_nan(cpu), _from_nan(mem))
+                                    for ts, cpu, mem in LEGACY_SEGMENT_RECORD.iter_unpack(buf[:usable]))
+                else:
+                    continue
+                with conn:
+                    conn.executemany("INSERT OR IGNORE INTO samples (device, ts, cpu, mem) VALUES (?, ?, ?, ?)", rows)
+                    if rows:
+                        self._update_rollups(conn, rows[0][0], min(row[1] for row in rows), max(row[1] for row in rows))
+                os.replace(path, path + IMPORTED_SUFFIX)
+                logger.info(f"Imported {len(rows)} history points from {entry} into the metrics database.")
+            except (OSError, ValueError, sqlite3.Error) as e:
+                logger.error(f"Failed to import legacy history {entry}: {e}")
+
+    # --- Reading -------------------------------------------------------------
+
+    def range(self, name, start_ts=None, end_ts=None, limit=None):
+        """
+        Returns [(ts, cpu, mem)] of a device with start_ts <= ts <= end_ts, oldest first.
+        With limit, only the newest `limit` points of the window are returned.
+        """
+        self.start()
+        limit = min(int(limit), MAX_RANGE_POINTS) if limit else MAX_RANGE_POINTS
+        rows = self._reader().execute(
+            "SELECT ts, cpu, mem FROM samples WHERE device = ? AND ts >= ? AND ts <= ? ORDER BY ts DESC LIMIT ?",
+            (device_key(name), start_ts if start_ts is not None else 0, end_ts if end_ts is not None else 1e12, limit),
+        ).fetchall()
+        rows.reverse()
+        return [(ts, round(cpu, 2) if cpu is not None else None, round(mem, 2) if mem is not None else None)
+                for ts, cpu, mem in rows]
+
+    def last_timestamp(self, name):
+        self.start()
+        row = self._reader().execute("SELECT MAX(ts) FROM samples WHERE device = ?", (device_key(name),)).fetchone()
+        return row[0] if row else None
+
+    def rollups(self, name, resolution, start_ts, end_ts, limit=None):
+        """
+        Returns the rollup rows of one resolution whose bucket starts within [start_ts, end_ts], oldest first.
+        With limit, only the newest `limit` buckets of the window are returned.
+        """
+        self.start()
+        limit = min(int(limit), MAX_RANGE_POINTS) if limit else MAX_RANGE_POINTS
+        rows = self._reader().execute(
+            "SELECT bucket, samples, cpu_min, cpu_max, cpu_avg, cpu_last, mem_min, mem_max, mem_avg, mem_last FROM rollups "
+            "WHERE device = ? AND resolution = ? AND bucket >= ? AND bucket <= ? ORDER BY bucket DESC LIMIT ?",
+            (device_key(name), resolution, start_ts // resolution * resolution, end_ts, limit),
+        ).fetchall()
+        rows.reverse()
+        keys = ("bucket", "samples", "cpu_min", "cpu_max", "cpu_avg", "cpu_last", "mem_min", "mem_max", "mem_avg", "mem_last")
+        return [dict(zip(keys, row)) for row in rows]
+
+    def pick_resolution(self, name, start_ts, end_ts, target_points=DEFAULT_TARGET_POINTS):
+        """
+        Returns 0 (raw samples) if the window holds at most target_points samples,
+        otherwise the finest rollup resolution that yields at most target_points buckets
+        (the coarsest one if none does).
+        """
+        self.start()
+        raw_count = self._reader().execute(
+            "SELECT COUNT(*) FROM samples WHERE device = ? AND ts >= ? AND ts <= ?",
+            (device_key(name), start_ts, end_ts),
+        ).fetchone()[0]
+        if raw_count <= target_points:
+            return 0
+        span = max(end_ts - start_ts, 1)
+        return next((resolution for resolution in ROLLUP_RESOLUTIONS if span / resolution <= target_points),
+                    ROLLUP_RESOLUTIONS[-1])
+
+    def history(self, name, start_ts, end_ts=None, target_points=DEFAULT_TARGET_POINTS, limit=None):
+        """
+        History of a device in the shape the monitoring page expects, at the resolution
+        chosen by pick_resolution(). Returns (points, resolution). Rolled-up points carry
+        the bucket average as cpuUsage / usedMemoryGB plus the min/max of the bucket.
+        With limit, only the newest `limit` points are returned at that resolution.
+        """
+        end_ts = time.time() if end_ts is None else end_ts
+        target_points = max(1, min(int(target_points or DEFAULT_TARGET_POINTS), MAX_RANGE_POINTS))
+        resolution = self.pick_resolution(name, start_ts, end_ts, target_points)
+        if not resolution:
+            points = [
+                {"timestamp": format_timestamp(ts), "cpuUsage": cpu, "usedMemoryGB": mem}
+                for ts, cpu, mem in self.range(name, start_ts=start_ts, end_ts=end_ts, limit=limit)
+            ]
+            return points, 0
+
+        def rounded(value):
+            return round(value, 2) if value is not None else None
+
+        points = [
+            {"timestamp": format_timestamp(row["bucket"]), "cpuUsage": rounded(row["cpu_avg"]), "usedMemoryGB": rounded(row["mem_avg"]),
+             "cpuMin": rounded(row["cpu_min"]), "cpuMax": rounded(row["cpu_max"]), "cpuLast": rounded(row["cpu_last"]),
+             "usedMemoryGBMin": rounded(row["mem_min"]), "usedMemoryGBMax": rounded(row["mem_max"]),
+             "usedMemoryGBLast": rounded(row["mem_last"]), "samples": row["samples"]}
+            for row in self.rollups(name, resolution, start_ts, end_ts, limit=limit)
+        ]
+        return points, resolution
+
+
+# A single database shared across the app
+metrics_store = MetricsDatabase()
@@ -0,0 +1,158 @@
+# استعلام NetBIOS Node Status دفعة واحدة لعدة أجهزة (UDP 137)
+import time
+import random
+import socket
+import struct
+import select
+from Tools.utils.logger import logger
+
+NETBIOS_PORT = 137
+# Seconds to keep collecting replies after the last query was sent
+NETBIOS_TIMEOUT = 1.5
+# Small pause every N queries so we do not overflow the socket send buffer
+NETBIOS_SEND_BATCH = 64
+
+# NetBIOS name flags (RFC 1002, section 4.2.18)
+NAME_FLAG_GROUP = 0x8000
+
+# Suffixes of interest in the node status name table
+SUFFIX_WORKSTATION = 0x00
+SUFFIX_FILE_SERVER = 0x20
+
+
+def _encode_wildcard_name():
+    """First-level encoding of the '*' wildcard name used by node status queries."""
+    raw = b"*" + b"\x00" * 15
+    encoded = bytearray()
+    for byte in raw:
+        encoded.append(ord("A") + (byte >> 4))
+        encoded.append(ord("A") + (byte & 0x0F))
+    return bytes([32]) + bytes(encoded) + b"\x00"
+
+
+_WILDCARD_NAME = _encode_wildcard_name()
+
+
+def build_node_status_query(transaction_id):
+    """Builds an NBSTAT (node status) request packet."""
+    header = struct.pack(">HHHHHH", transaction_id, 0x0000, 1, 0, 0, 0)
+    # QUESTION_TYPE = NBSTAT (0x21), QUESTION_CLASS = IN (0x01)
+    return header + _WILDCARD_NAME + struct.pack(">HH", 0x0021, 0x0001)
+
+
+def parse_node_status_response(data):
+    """
+    Parses an NBSTAT response.
+    Returns {"transaction_id", "names": [(name, suffix, is_group)], "mac"} or None if malformed.
+    """
+    try:
+        transaction_id, flags, _, answer_count, _, _ = struct.unpack(">HHHHHH", data[:12])
+        if not flags & 0x8000 or answer_count < 1:
+            return None
+
+        offset = 12
+        # Skip the (possibly compressed) RR_NAME
+        if data[offset] & 0xC0 == 0xC0:
+            offset += 2
+        else:
+            while data[offset] != 0:
+                offset += data[offset] + 1
+            offset += 1
+
+        rr_type, _, _, rd_length = struct.unpack(">HHIH", data[offset:offset + 10])
+        offset += 10
+        if rr_type != 0x0021:
+            return None
+
+        name_count = data[offset]
+        offset += 1
+        names = []
+        for _ in range(name_count):
+            entry = data[offset:offset + 18]
+            if len(entry) < 18:
+                break
+            name = entry[:15].decode("latin-1").rstrip(" \x00")
+            suffix = entry[15]
+            name_flags = struct.unpack(">H", entry[16:18])[0]
+            names.append((name, suffix, bool(name_flags & NAME_FLAG_GROUP)))
+            offset += 18
+
+        mac_bytes = data[offset:offset + 6]
+        mac = None
+        if len(mac_bytes) == 6 and mac_bytes != b"\x00" * 6:
+            mac = ":".join(f"{b:02X}" for b in mac_bytes)
+
+        return {"transaction_id": transaction_id, "names": names, "mac": mac}
+    except (struct.error, IndexError):
+        return None
+
+
+def _summarize_names(names):
+    """Picks the computer name and workgroup/domain out of a node status name table."""
+    hostname = None
+    workgroup = None
+    for name, suffix, is_group in names:
+        if suffix == SUFFIX_WORKSTATION and not is_group and not hostname:
+            hostname = name
+        elif suffix == SUFFIX_WORKSTATION and is_group and not workgroup:
+            workgroup = name
+    if not hostname:
+        hostname = next((name for name, suffix, is_group in names if suffix == SUFFIX_FILE_SERVER and not is_group), None)
+    return hostname, workgroup
+
+
+def query_node_status(ips, timeout=NETBIOS_TIMEOUT):
+    """
+    Sends NetBIOS node status queries to all IPs from one UDP socket and collects
+    the replies within a single timeout window.
+    Returns {ip: {"netbios_name", "workgroup", "mac"}} for the hosts that answered.
+    """
+    ips = list(dict.fromkeys(ips))
+    if not ips:
+        return {}
+
+    results = {}
+    base_id = random.randint(0, 0xFFFF)
+    expected = {ip: (base_id + i) & 0xFFFF for i, ip in enumerate(ips)}
+
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.setblocking(False)
+        logger.info(f"Sending NetBIOS node status queries to {len(ips)} hosts.")
+
+        def drain():
+            while True:
+                try:
+                    data, (source_ip, _) = sock.recvfrom(2048)
+                except (BlockingIOError, InterruptedError):
+                    return
+                except OSError:
+                    # Windows reports ICMP port-unreachable as a reset on the next recv
+                    continue
+                if source_ip in results or source_ip not in expected:
+                    continue
+                parsed = parse_node_status_response(data)
+                if not parsed or parsed["transaction_id"] != expected[source_ip]:
+                    continue
+                hostname, workgroup = _summarize_names(parsed["names"])
+                results[source_ip] = {"netbios_name": hostname, "workgroup": workgroup, "mac": parsed["mac"]}
+
+        for i, ip in enumerate(ips):
+            try:
+                sock.sendto(build_node_status_query(expected[ip]), (ip, NETBIOS_PORT))
+            except OSError as e:
+                logger.debug(f"NetBIOS query to {ip} could not be sent: {e}")
+            if (i + 1) % NETBIOS_SEND_BATCH == 0:
+                # Collect early replies while we are still sending
+                drain()
+
+        deadline = time.monotonic() + timeout
+        while len(results) < len(ips):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            readable, _, _ = select.select([sock], [], [], remaining)
+            if readable:
+                drain()
+
+    logger.info(f"NetBIOS node status: {len(results)} of {len(ips)} hosts answered.")
+    return results
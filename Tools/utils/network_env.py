@@ -0,0 +1,294 @@
+# قراءة بيئة الشبكة المحلية (الواجهات، الشبكات الفرعية، البوابات)
+import os
+import sys
+import json
+import time
+import socket
+import struct
+import hashlib
+import ipaddress
+import threading
+import subprocess
+from Tools.utils.logger import logger
+
+# A snapshot is re-used while the cheap fingerprint below is unchanged,
+# but never for longer than this many seconds (gateway MACs can change
+# without any routing change, e.g. after a router swap).
+CACHE_MAX_AGE_SECONDS = 300
+
+# Linux ioctl request codes for reading an interface's IPv4 address and netmask.
+SIOCGIFADDR = 0x8915
+SIOCGIFNETMASK = 0x891b
+
+_cache_lock = threading.Lock()
+_cached_env = {"interfaces": None, "fingerprint": None, "loaded_at": 0.0}
+
+
+def _is_windows():
+    return sys.platform.startswith("win")
+
+
+def _hex_to_ip(hex_str):
+    """Converts a little-endian hex address from /proc/net/route to dotted notation."""
+    return socket.inet_ntoa(struct.pack("<L", int(hex_str, 16)))
+
+
+def _read_proc_file(path):
+    try:
+        with open(path, "r") as f:
+            return f.read()
+    except OSError:
+        return ""
+
+
+def _read_linux_default_gateways():
+    """Returns {interface_name: (gateway_ip, metric)} for default routes, preferring the lowest metric."""
+    gateways = {}
+    for line in _read_proc_file("/proc/net/route").splitlines()[1:]:
+        fields = line.split()
+        if len(fields) < 8:
+            continue
+        iface, destination, gateway, flags, metric, mask = fields[0], fields[1], fields[2], int(fields[3], 16), int(fields[6]), fields[7]
+        # RTF_UP (0x1) and RTF_GATEWAY (0x2) must both be set for a usable default route
+        if destination != "00000000" or mask != "00000000" or (flags & 0x3) != 0x3:
+            continue
+        if iface not in gateways or metric < gateways[iface][1]:
+            gateways[iface] = (_hex_to_ip(gateway), metric)
+    return gateways
+
+
+def _read_linux_arp_table():
+    """Returns {ip: mac} from /proc/net/arp, skipping incomplete entries."""
+    arp_table = {}
+    for line in _read_proc_file("/proc/net/arp").splitlines()[1:]:
+        fields = line.split()
+        if len(fields) < 4:
+            continue
+        ip, flags, mac = fields[0], int(fields[2], 16), fields[3].upper()
+        if flags == 0 or mac == "00:00:00:00:00:00":
+            continue
+        arp_table[ip] = mac
+    return arp_table
+
+
+def _read_linux_interfaces():
+    """Reads IPv4 interfaces, prefix lengths, gateways and gateway MACs from the kernel."""
+    import fcntl
+
+    gateways = _read_linux_default_gateways()
+    arp_table = _read_linux_arp_table()
+    interfaces = []
+
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        for index, name in socket.if_nameindex():
+            packed_name = struct.pack("256s", name[:15].encode("utf-8"))
+            try:
+                ip = socket.inet_ntoa(fcntl.ioctl(s.fileno(), SIOCGIFADDR, packed_name)[20:24])
+                netmask = socket.inet_ntoa(fcntl.ioctl(s.fileno(), SIOCGIFNETMASK, packed_name)[20:24])
+            except OSError:
+                # The interface has no IPv4 address assigned
+                continue
+
+            mac = _read_proc_file(f"/sys/class/net/{name}/address").strip().upper() or None
+            gateway, gateway_metric = gateways.get(name, (None, None))
+            interfaces.append(_build_interface_record(
+                name=name,
+                index=index,
+                ip=ip,
+                prefixlen=ipaddress.ip_network(f"0.0.0.0/{netmask}").prefixlen,
+                mac=mac,
+                gateway=gateway,
+                gateway_mac=arp_table.get(gateway) if gateway else None,
+                gateway_metric=gateway_metric,
+            ))
+    return interfaces
+
+
+# A single PowerShell invocation returns every IPv4 address together with its
+# default gateway, that route's effective metric (route + interface metric) and
+# the gateway's neighbor-cache MAC address.
+WINDOWS_INTERFACES_PS = (
+    "$routes = Get-NetRoute -AddressFamily IPv4 -DestinationPrefix '0.0.0.0/0' -ErrorAction SilentlyContinue; "
+    "$neighbors = Get-NetNeighbor -AddressFamily IPv4 -ErrorAction SilentlyContinue; "
+    "$adapters = Get-NetAdapter -ErrorAction SilentlyContinue; "
+    "@(Get-NetIPAddress -AddressFamily IPv4 -ErrorAction SilentlyContinue | ForEach-Object { "
+    "$idx = $_.InterfaceIndex; "
+    "$route = $routes | Where-Object { $_.InterfaceIndex -eq $idx } | Sort-Object { $_.RouteMetric + $_.InterfaceMetric } | Select-Object -First 1; "
+    "$gw = $route.NextHop; "
+    "$gwMetric = if ($route) { $route.RouteMetric + $route.InterfaceMetric } else { $null }; "
+    "$gwMac = if ($gw) { ($neighbors | Where-Object { $_.InterfaceIndex -eq $idx -and $_.IPAddress -eq $gw } | Select-Object -First 1).LinkLayerAddress } else { $null }; "
+    "[pscustomobject]@{ name = $_.InterfaceAlias; index = $idx; ip = $_.IPAddress; prefixlen = $_.PrefixLength; "
+    "mac = ($adapters | Where-Object { $_.ifIndex -eq $idx } | Select-Object -First 1).MacAddress; gateway = $gw; gateway_mac = $gwMac; gateway_metric = $gwMetric } "
+    "}) | ConvertTo-Json -Compress"
+)
+
+
+def _normalize_mac(mac):
+    if not mac:
+        return None
+    mac = str(mac).strip().upper().replace("-", ":")
+    if mac in ("", "00:00:00:00:00:00", "FF:FF:FF:FF:FF:FF"):
+        return None
+    return mac
+
+
+def _read_windows_interfaces():
+    """Reads IPv4 interfaces and default gateways using the NetTCPIP PowerShell module."""
+    proc = subprocess.run(
+        ["powershell.exe", "-NoProfile", "-NonInteractive", "-Command", WINDOWS_INTERFACES_PS],
+        capture_output=True, text=True, timeout=30, creationflags=subprocess.CREATE_NO_WINDOW
+    )
+    if proc.returncode != 0 or not proc.stdout.strip():
+        logger.warning(f"Failed to enumerate network interfaces via PowerShell. RC: {proc.returncode}, Stderr: {proc.stderr.strip()}")
+        return []
+
+    raw = json.loads(proc.stdout)
+    if isinstance(raw, dict):
+        raw = [raw]
+
+    interfaces = []
+    for item in raw:
+        gateway = item.get("gateway")
+        if gateway in ("0.0.0.0", ""):
+            gateway = None
+        try:
+            interfaces.append(_build_interface_record(
+                name=item.get("name"),
+                index=item.get("index"),
+                ip=item.get("ip"),
+                prefixlen=int(item.get("prefixlen")),
+                mac=item.get("mac"),
+                gateway=gateway,
+                gateway_mac=item.get("gateway_mac"),
+                gateway_metric=item.get("gateway_metric") if gateway else None,
+            ))
+        except (TypeError, ValueError) as e:
+            logger.warning(f"Skipping malformed interface entry {item}: {e}")
+    return interfaces
+
+
+def _build_interface_record(name, index, ip, prefixlen, mac, gateway, gateway_mac, gateway_metric=None):
+    iface = ipaddress.ip_interface(f"{ip}/{prefixlen}")
+    return {
+        "name": name,
+        "index": index,
+        "ip": ip,
+        "prefixlen": iface.network.prefixlen,
+        "netmask": str(iface.netmask),
+        "cidr": str(iface.network),
+        "mac": _normalize_mac(mac),
+        "gateway": gateway,
+        "gateway_mac": _normalize_mac(gateway_mac),
+        "gateway_metric": gateway_metric,
+        "is_loopback": iface.ip.is_loopback,
+        "is_link_local": iface.ip.is_link_local,
+    }
+
+
+def _compute_fingerprint():
+    """
+    A cheap digest of the OS network state, used to detect changes without a full re-read.
+    On Linux the routing table covers address/prefix changes (connected routes) and gateway changes.
+    On Windows the set of host addresses is the cheapest reliable signal.
+    """
+    digest = hashlib.sha1()
+    if _is_windows():
+        try:
+            addrs = sorted({item[4][0] for item in socket.getaddrinfo(socket.gethostname(), None, socket.AF_INET)})
+        except socket.gaierror:
+            addrs = []
+        digest.update(",".join(addrs).encode("utf-8"))
+    else:
+        digest.update(_read_proc_file("/proc/net/route").encode("utf-8"))
+        digest.update(",".join(name for _, name in socket.if_nameindex()).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _read_interfaces():
+    if _is_windows():
+        return _read_windows_interfaces()
+    if os.path.exists("/proc/net/route"):
+        return _read_linux_interfaces()
+    logger.warning(f"Network interface enumeration is not supported on platform '{sys.platform}'.")
+    return []
+
+
+def get_interfaces(force_refresh=False):
+    """
+    Returns the list of local IPv4 interfaces (as dicts), served from a cache that is
+    invalidated when the OS network configuration changes or the snapshot gets too old.
+    """
+    fingerprint = _compute_fingerprint()
+    with _cache_lock:
+        age = time.time() - _cached_env["loaded_at"]
+        if (not force_refresh
+                and _cached_env["interfaces"] is not None
+                and _cached_env["fingerprint"] == fingerprint
+                and age < CACHE_MAX_AGE_SECONDS):
+            return [dict(iface) for iface in _cached_env["interfaces"]]
+
+        try:
+            interfaces = _read_interfaces()
+        except Exception as e:
+            logger.error(f"Error reading network interfaces: {e}", exc_info=True)
+            # Keep serving the last good snapshot rather than failing scan planning
+            return [dict(iface) for iface in (_cached_env["interfaces"] or [])]
+
+        if _cached_env["fingerprint"] != fingerprint:
+            logger.info(f"Network environment loaded: {len(interfaces)} IPv4 interfaces.")
+        _cached_env.update({"interfaces": interfaces, "fingerprint": fingerprint, "loaded_at": time.time()})
+        return [dict(iface) for iface in interfaces]
+
+
+def find_interface_for_network(cidr_str):
+    """
+    Returns the local interface attached to the given network, or None if the network is routed.
+    When several interfaces overlap the target, the most specific prefix wins.
+    """
+    target_network = ipaddress.ip_network(cidr_str, strict=False)
+    candidates = []
+    for iface in get_interfaces():
+        if iface["is_loopback"]:
+            continue
+        local_network = ipaddress.ip_network(iface["cidr"])
+        if target_network.version == local_network.version and target_network.overlaps(local_network):
+            candidates.append(iface)
+    if not candidates:
+        return None
+    return max(candidates, key=lambda iface: iface["prefixlen"])
+
+
+def get_default_interface():
+    """Returns the interface holding the default route (the one with the lowest metric), or None."""
+    with_gateway = [iface for iface in get_interfaces() if iface["gateway"] and not iface["is_loopback"]]
+    if not with_gateway:
+        return None
+    return min(with_gateway, key=lambda iface: (iface["gateway_metric"] is None, iface["gateway_metric"] or 0))
+
+
+def plan_scan(cidr_str):
+    """
+    Decides how a CIDR should be scanned from this host.
+    Returns a dict with the outgoing interface, the source IP, the router MAC to
+    use for routed targets, and whether the target is directly attached (L2 reachable).
+    """
+    local_iface = find_interface_for_network(cidr_str)
+    if local_iface:
+        target_network = ipaddress.ip_network(cidr_str, strict=False)
+        return {
+            "cidr": str(target_network),
+            "interface": local_iface,
+            "source_ip": local_iface["ip"],
+            "router_mac": local_iface["gateway_mac"],
+            # Only treat the scan as local if the whole target fits inside the attached subnet
+            "is_local": target_network.subnet_of(ipaddress.ip_network(local_iface["cidr"])),
+        }
+
+    default_iface = get_default_interface()
+    return {
+        "cidr": str(ipaddress.ip_network(cidr_str, strict=False)),
+        "interface": default_iface,
+        "source_ip": default_iface["ip"] if default_iface else None,
+        "router_mac": default_iface["gateway_mac"] if default_iface else None,
+        "is_local": False,
+    }
@@ -0,0 +1,86 @@
+# بناء شجرة الوحدات التنظيمية (OU) مع عدد الأجهزة والمستخدمين في كل فرع
+import threading
+
+# Object kinds counted per container
+COUNTED_KINDS = ("computers", "users")
+
+
+def parent_dn(dn):
+    """Returns the DN of the parent container, honouring escaped commas ('CN=Doe\\, John,OU=...')."""
+    escaped = False
+    for i, char in enumerate(dn):
+        if escaped:
+            escaped = False
+        elif char == "\\":
+            escaped = True
+        elif char == ",":
+            return dn[i + 1:]
+    return ""
+
+
+def _ancestors(dn):
+    """Yields the lower-cased parent, grandparent, ... DNs of an object."""
+    current = parent_dn(dn)
+    while current:
+        yield current.lower()
+        current = parent_dn(current)
+
+
+class OuCounts:
+    """
+    Direct and subtree object counts per container DN, updated one object at a time
+    so they can follow incremental directory changes without a recount.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # container dn (lower) -> {kind: count}
+        self.direct = {}
+        self.subtree = {}
+
+    def add(self, kind, dn, delta=1):
+        if kind not in COUNTED_KINDS or not dn:
+            return
+        with self._lock:
+            for depth, container in enumerate(_ancestors(dn)):
+                if depth == 0:
+                    counts = self.direct.setdefault(container, dict.fromkeys(COUNTED_KINDS, 0))
+                    counts[kind] += delta
+                counts = self.subtree.setdefault(container, dict.fromkeys(COUNTED_KINDS, 0))
+                counts[kind] += delta
+
+    def remove(self, kind, dn):
+        self.add(kind, dn, -1)
+
+    def counts_for(self, dn):
+        key = dn.lower()
+        with self._lock:
+            return (dict(self.direct.get(key) or dict.fromkeys(COUNTED_KINDS, 0)),
+                    dict(self.subtree.get(key) or dict.fromkeys(COUNTED_KINDS, 0)))
+
+
+def build_ou_tree(base_dn, ous, counts, root=None):
+    """
+    Builds the OU hierarchy in one pass over the OU records ({"name", "path", ...}).
+    Every node carries its direct and subtree computer/user counts. With root, only
+    that node's subtree is returned. Returns None if root is unknown.
+    """
+    direct, subtree = counts.counts_for(base_dn)
+    nodes = {base_dn.lower(): {"name": base_dn, "path": base_dn, "direct": direct, "subtree": subtree, "children": []}}
+    for ou in ous:
+        path = ou.get("path") or ""
+        if not path:
+            continue
+        direct, subtree = counts.counts_for(path)
+        nodes[path.lower()] = {"name": ou.get("name") or path, "path": path, "direct": direct, "subtree": subtree, "children": []}
+
+    for key, node in nodes.items():
+        if key == base_dn.lower():
+            continue
+        parent = nodes.get(parent_dn(node["path"]).lower())
+        # OUs below a non-OU container (rare) are attached to the domain root
+        (parent or nodes[base_dn.lower()])["children"].append(node)
+
+    for node in nodes.values():
+        node["children"].sort(key=lambda child: child["name"].lower())
+    return nodes.get((root or base_dn).lower())
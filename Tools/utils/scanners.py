@@ -0,0 +1,221 @@
+# محركات الفحص داخل العملية باستخدام scapy (ARP Sweep, SYN Scan)
+import time
+import importlib
+import queue
+import random
+import ipaddress
+import threading
+from Tools.utils.logger import logger
+
+# We import scapy lazily inside the functions so that the rest of the
+# application keeps working on hosts where scapy (or Npcap) is not available.
+
+ARP_BATCH_SIZE = 256
+ARP_INTER_BATCH_DELAY = 0.01
+
+# Packets are sent in slices of this many seconds to keep the configured rate smooth
+SYN_SEND_SLICE_SECONDS = 0.1
+# How long to keep listening for late SYN-ACKs after the last probe was sent
+SYN_SCAN_WAIT_SECONDS = 2.0
+
+
+def check_scapy_availability():
+    """Checks if scapy can be imported and has a usable packet capture backend."""
+    try:
+        importlib.import_module("scapy.all")
+        return True, None
+    except ImportError as e:
+        logger.error(f"scapy library is missing: {e}")
+        return False, f"The scapy library is missing. Please install it using 'pip install scapy'. Details: {str(e)}"
+    except Exception as e:
+        logger.error(f"Unexpected error during scapy initialization: {e}")
+        return False, f"An unexpected error occurred during scapy initialization. Details: {str(e)}"
+
+
+def _batched(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def arp_sweep(cidr, iface=None, source_ip=None, timeout=2.0, retries=1):
+    """
+    Discovers hosts on a directly attached subnet with batched ARP requests.
+    A single sniffer collects replies asynchronously while the requests are sent,
+    so every host is resolved to IP + MAC in one pass.
+    Returns a list of {"ip": ..., "mac": ..., "macs": [...]} dicts sorted by IP, where
+    "mac" is the first MAC that answered and "macs" every MAC that claimed the IP.
+    Raises RuntimeError if scapy is unavailable or the capture cannot be started.
+    """
+    scapy_ok, scapy_error = check_scapy_availability()
+    if not scapy_ok:
+        raise RuntimeError("ARP sweep is unavailable.", scapy_error)
+
+    from scapy.all import AsyncSniffer, sendp, Ether, ARP
+
+    network = ipaddress.ip_network(cidr, strict=False)
+    targets = [str(ip) for ip in network.hosts()]
+    target_set = set(targets)
+    # ip -> {mac: None}, in the order the MACs answered; several MACs mean an IP conflict
+    found = {}
+
+    def handle_reply(pkt):
+        if ARP in pkt and pkt[ARP].op == 2:
+            ip = pkt[ARP].psrc
+            if ip in target_set:
+                found.setdefault(ip, {})[pkt[ARP].hwsrc.upper()] = None
+
+    logger.info(f"Starting ARP sweep of {len(targets)} addresses in {network} on interface {iface or 'default'}.")
+    try:
+        sniffer = AsyncSniffer(iface=iface, filter="arp and arp[6:2] = 2", prn=handle_reply, store=False)
+        sniffer.start()
+    except Exception as e:
+        logger.error(f"Could not start ARP capture on {iface or 'default interface'}: {e}")
+        raise RuntimeError("Could not start packet capture. Administrator/root privileges (and Npcap on Windows) are required.", str(e))
+
+    try:
+        # Give the capture a moment to attach before the first replies come back
+        time.sleep(0.2)
+        pending = targets
+        for attempt in range(retries + 1):
+            for batch in _batched(pending, ARP_BATCH_SIZE):
+                arp_fields = {"pdst": batch}
+                if source_ip:
+                    arp_fields["psrc"] = source_ip
+                sendp(Ether(dst="ff:ff:ff:ff:ff:ff") / ARP(**arp_fields), iface=iface, verbose=False)
+                time.sleep(ARP_INTER_BATCH_DELAY)
+            time.sleep(timeout)
+            # Only re-ask hosts that have not answered yet
+            pending = [ip for ip in targets if ip not in found]
+            if not pending:
+                break
+    finally:
+        try:
+            sniffer.stop()
+        except Exception:
+            pass
+
+    results = sorted(({"ip": ip, "mac": next(iter(macs)), "macs": list(macs)} for ip, macs in found.items()),
+                     key=lambda x: ipaddress.ip_address(x["ip"]))
+    logger.info(f"ARP sweep found {len(results)} hosts in {network}.")
+    return results
+
+
+def _network_targets(target_range):
+    network = ipaddress.ip_network(target_range, strict=False)
+    targets = [str(ip) for ip in network.hosts()]
+    return network, targets or [str(network.network_address)]
+
+
+def iter_syn_scan(target_range, source_ip=None, router_mac=None, iface=None, port=445, rate=1000, wait=SYN_SCAN_WAIT_SECONDS):
+    """
+    Stateless batched SYN scan, the in-process counterpart of masscan.
+    Probes are sent at `rate` packets/second with a per-target sequence cookie,
+    and a sniffer matches SYN-ACK replies against it. Setup errors are raised
+    immediately (RuntimeError, like run_masscan); the returned generator then
+    yields responding IPs as soon as their SYN-ACK arrives, and raises
+    RuntimeError once sending is over if the probes could not be sent.
+    When both router_mac and iface are given, probes are framed directly to
+    the router so scapy does not have to resolve the next hop.
+    """
+    scapy_ok, scapy_error = check_scapy_availability()
+    if not scapy_ok:
+        raise RuntimeError("SYN scan is unavailable.", scapy_error)
+
+    from scapy.all import AsyncSniffer, send, sendp, Ether, IP, TCP
+
+    network, targets = _network_targets(target_range)
+    rate = max(1, int(rate))
+    sport = random.randint(40000, 60000)
+    secret = random.getrandbits(32)
+
+    def cookie(ip):
+        return (int(ipaddress.ip_address(ip)) ^ secret) & 0xFFFFFFFF
+
+    replies = queue.Queue()
+    seen = set()
+
+    def handle_reply(pkt):
+        if IP not in pkt or TCP not in pkt:
+            return
+        tcp = pkt[TCP]
+        ip = pkt[IP].src
+        # SYN+ACK whose acknowledgement number proves it answers one of our probes
+        if tcp.dport == sport and (int(tcp.flags) & 0x12) == 0x12 and tcp.ack == (cookie(ip) + 1) & 0xFFFFFFFF:
+            if ip not in seen:
+                seen.add(ip)
+                replies.put(ip)
+
+    bpf = f"tcp and src port {port} and dst port {sport} and tcp[tcpflags] & (tcp-syn|tcp-ack) == (tcp-syn|tcp-ack)"
+    try:
+        sniffer = AsyncSniffer(iface=iface, filter=bpf, prn=handle_reply, store=False)
+        sniffer.start()
+    except Exception as e:
+        logger.error(f"Could not start SYN-ACK capture on {iface or 'default interface'}: {e}")
+        raise RuntimeError("Could not start packet capture. Administrator/root privileges (and Npcap on Windows) are required.", str(e))
+
+    stop_sending = threading.Event()
+    sending_done = threading.Event()
+    use_l2 = bool(router_mac and iface)
+    # Raised in the caller's thread, so a failed send is not mistaken for an empty network
+    sender_errors = []
+
+    def sender():
+        try:
+            per_slice = max(1, int(rate * SYN_SEND_SLICE_SECONDS))
+            next_slice = time.monotonic()
+            for batch in _batched(targets, per_slice):
+                if stop_sending.is_set():
+                    break
+                probes = []
+                for ip in batch:
+                    probe = IP(dst=ip) / TCP(sport=sport, dport=port, flags="S", seq=cookie(ip))
+                    if source_ip:
+                        probe[IP].src = source_ip
+                    probes.append(Ether(dst=router_mac) / probe if use_l2 else probe)
+                if use_l2:
+                    sendp(probes, iface=iface, verbose=False)
+                else:
+                    send(probes, verbose=False)
+                next_slice += SYN_SEND_SLICE_SECONDS
+                delay = next_slice - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+        except Exception as e:
+            logger.error(f"SYN scan sender failed: {e}", exc_info=True)
+            sender_errors.append(e)
+        finally:
+            sending_done.set()
+
+    logger.info(f"Starting SYN scan of {len(targets)} addresses in {network} on port {port} at {rate} pps.")
+    time.sleep(0.2)
+    sender_thread = threading.Thread(target=sender, name="syn_scan_sender", daemon=True)
+    sender_thread.start()
+
+    def results():
+        found = 0
+        listen_until = None
+        try:
+            while True:
+                if listen_until is None and sending_done.is_set():
+                    sender_thread.join()
+                    if sender_errors:
+                        raise RuntimeError("SYN scan failed while sending probes. Administrator/root privileges (and Npcap on Windows) and a valid interface are required.",
+                                           str(sender_errors[0]))
+                    listen_until = time.monotonic() + wait
+                if listen_until is not None and time.monotonic() >= listen_until and replies.empty():
+                    break
+                try:
+                    ip = replies.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                found += 1
+                yield ip
+        finally:
+            stop_sending.set()
+            try:
+                sniffer.stop()
+            except Exception:
+                pass
+            logger.info(f"SYN scan found {found} hosts in {network}.")
+
+    return results()
@@ -0,0 +1,246 @@
+# فهرس بحث فوري في الذاكرة (بادئات وثلاثيات أحرف) للأجهزة والمستخدمين والمجموعات
+import re
+import time
+import heapq
+import bisect
+import threading
+
+# Results returned when the caller does not ask for a limit
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 200
+# Length of the character n-grams used for substring matches
+NGRAM_SIZE = 3
+# New tokens go to a small sorted side list that is merged into the main one once it
+# grows past this size or a quarter of the main list, keeping inserts cheap
+PENDING_MERGE_THRESHOLD = 2048
+# Small preference between types when scores tie (people and machines first)
+TYPE_BOOST = {"user": 3, "computer": 2, "device": 1, "group": 0, "ou": 0}
+
+_TOKEN_SPLIT = re.compile(r"[^0-9a-z]+")
+
+# Scores of the ways a query term can match a document
+SCORE_EXACT_TITLE = 100
+SCORE_EXACT_TOKEN = 60
+SCORE_TITLE_PREFIX = 50
+SCORE_TOKEN_PREFIX = 30
+SCORE_SUBSTRING = 10
+
+
+def tokenize(text):
+    """Lower-cased tokens of a value, plus the whole value ('pc-01.corp.local' -> pc, 01, corp, local, pc-01.corp.local)."""
+    text = (text or "").lower().strip()
+    if not text:
+        return set()
+    tokens = {token for token in _TOKEN_SPLIT.split(text) if token}
+    tokens.add(text)
+    return tokens
+
+
+def _ngrams(token):
+    return {token[i:i + NGRAM_SIZE] for i in range(len(token) - NGRAM_SIZE + 1)}
+
+
+class SearchIndex:
+    """
+    Type-ahead index over heterogeneous documents (AD users, computers, groups,
+    discovered devices). Documents are dicts with "type", "id", "title", optional
+    "subtitle", "terms" (the searchable strings) and "data" (returned as-is).
+
+    Tokens are kept in a sorted list so a prefix lookup is a bisect plus a short
+    scan, and every token is also indexed by its character trigrams so infix
+    queries ("prn" in "hq-prn-02") are answered without scanning all tokens.
+    Every candidate of the requested types is ranked, so a strong title match is
+    never cut off by weaker ones collected before it. Sources (the AD replica,
+    network discovery) push upserts and removals as their data changes.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        # (type, id) -> document
+        self._docs = {}
+        # (type, id) -> set of tokens
+        self._doc_tokens = {}
+        # token -> set of (type, id)
+        self._postings = {}
+        self._sorted_tokens = []
+        # Sorted tokens added since the last merge; removed tokens are dropped lazily at merge time
+        self._pending_tokens = []
+        # trigram -> set of tokens
+        self._ngrams = {}
+
+    def _add_token(self, token, key):
+        postings = self._postings.get(token)
+        if postings is None:
+            postings = self._postings[token] = set()
+            bisect.insort(self._pending_tokens, token)
+            if len(self._pending_tokens) > max(PENDING_MERGE_THRESHOLD, len(self._sorted_tokens) // 4):
+                self._merge_pending()
+            for gram in _ngrams(token):
+                self._ngrams.setdefault(gram, set()).add(token)
+        postings.add(key)
+
+    def _drop_token(self, token, key):
+        postings = self._postings.get(token)
+        if postings is None:
+            return
+        postings.discard(key)
+        if not postings:
+            del self._postings[token]
+            for gram in _ngrams(token):
+                tokens = self._ngrams.get(gram)
+                if tokens is not None:
+                    tokens.discard(token)
+                    if not tokens:
+                        del self._ngrams[gram]
+
+    def upsert(self, doc):
+        key = (doc["type"], str(doc["id"]))
+        tokens = set()
+        for term in doc.get("terms") or ():
+            tokens |= tokenize(term)
+        tokens |= tokenize(doc.get("title"))
+        with self._lock:
+            old_tokens = self._doc_tokens.get(key, set())
+            for token in old_tokens - tokens:
+                self._drop_token(token, key)
+            for token in tokens - old_tokens:
+                self._add_token(token, key)
+            self._doc_tokens[key] = tokens
+            self._docs[key] = {**doc, "id": str(doc["id"]), "_title": (doc.get("title") or "").lower(), "indexed_at": time.time()}
+
+    def remove(self, doc_type, doc_id):
+        key = (doc_type, str(doc_id))
+        with self._lock:
+            for token in self._doc_tokens.pop(key, ()):
+                self._drop_token(token, key)
+            self._docs.pop(key, None)
+
+    def documents(self, doc_type):
+        """Returns [(id, indexed_at)] of every document of one type."""
+        with self._lock:
+            return [(key[1], doc["indexed_at"]) for key, doc in self._docs.items() if key[0] == doc_type]
+
+    def _merge_pending(self):
+        merged = []
+        for token in heapq.merge(self._sorted_tokens, self._pending_tokens):
+            if token in self._postings and (not merged or merged[-1] != token):
+                merged.append(token)
+        self._sorted_tokens = merged
+        self._pending_tokens = []
+
+    @staticmethod
+    def _prefix_range(tokens, prefix):
+        return bisect.bisect_left(tokens, prefix), bisect.bisect_left(tokens, prefix + "\uffff")
+
+    def _prefix_tokens(self, prefix):
+        for tokens in (self._sorted_tokens, self._pending_tokens):
+            start, end = self._prefix_range(tokens, prefix)
+            for position in range(start, end):
+                if tokens[position] in self._postings:
+                    yield tokens[position]
+
+    def _estimated_matches(self, term):
+        """Cheap selectivity estimate: documents with the exact token plus tokens starting with it."""
+        estimate = len(self._postings.get(term, ()))
+        for tokens in (self._sorted_tokens, self._pending_tokens):
+            start, end = self._prefix_range(tokens, term)
+            estimate += end - start
+        return estimate
+
+    def _substring_tokens(self, term):
+        grams = _ngrams(term)
+        if not grams:
+            return set()
+        candidates = None
+        for gram in sorted(grams, key=lambda g: len(self._ngrams.get(g, ()))):
+            tokens = self._ngrams.get(gram)
+            if not tokens:
+                return set()
+            candidates = set(tokens) if candidates is None else candidates & tokens
+            if not candidates:
+                return set()
+        return {token for token in candidates if term in token}
+
+    def _term_candidates(self, term, types=None):
+        """
+        Returns {doc key: score} for one query term: exact token matches, then prefix
+        matches, then substring matches, each document keeping its best score.
+        Documents of other types than `types` are skipped while collecting.
+        """
+        found = {}
+
+        def collect(keys, score):
+            for key in keys:
+                if key not in found and (not types or key[0] in types):
+                    found[key] = score
+
+        collect(self._postings.get(term, ()), SCORE_EXACT_TOKEN)
+        for token in self._prefix_tokens(term):
+            if token != term:
+                collect(self._postings[token], SCORE_TOKEN_PREFIX)
+        if len(term) >= NGRAM_SIZE:
+            for token in self._substring_tokens(term):
+                if not token.startswith(term):
+                    collect(self._postings[token], SCORE_SUBSTRING)
+        return found
+
+    @staticmethod
+    def _term_score(tokens, term):
+        """Scores one query term against the tokens of a single document."""
+        if term in tokens:
+            return SCORE_EXACT_TOKEN
+        if any(token.startswith(term) for token in tokens):
+            return SCORE_TOKEN_PREFIX
+        if len(term) >= NGRAM_SIZE and any(term in token for token in tokens):
+            return SCORE_SUBSTRING
+        return 0
+
+    def search(self, query, limit=DEFAULT_LIMIT, types=None):
+        """
+        Returns up to `limit` documents matching every term of the query, best first.
+        Candidates come from the most selective term; the other terms are checked
+        against each candidate's tokens. Scores add up per term,
+        and exact or prefix matches on the title rank highest.
+        """
+        query = (query or "").lower().strip()
+        terms = list({term for term in _TOKEN_SPLIT.split(query) if term})
+        if not terms:
+            return []
+        limit = max(1, min(int(limit or DEFAULT_LIMIT), MAX_LIMIT))
+
+        with self._lock:
+            terms.sort(key=self._estimated_matches)
+            ranked = []
+            for key, score in self._term_candidates(terms[0], types).items():
+                tokens = self._doc_tokens[key]
+                for term in terms[1:]:
+                    term_score = self._term_score(tokens, term)
+                    if not term_score:
+                        break
+                    score += term_score
+                else:
+                    title = self._docs[key]["_title"]
+                    if title == query:
+                        score += SCORE_EXACT_TITLE
+                    elif title.startswith(query):
+                        score += SCORE_TITLE_PREFIX
+                    score += TYPE_BOOST.get(key[0], 0)
+                    ranked.append((-score, len(title), title, key))
+
+            return [
+                {"type": key[0], "id": key[1], "title": self._docs[key].get("title"),
+                 "subtitle": self._docs[key].get("subtitle"), "score": -negative_score,
+                 "data": self._docs[key].get("data")}
+                for negative_score, _, _, key in heapq.nsmallest(limit, ranked)
+            ]
+
+    def stats(self):
+        with self._lock:
+            counts = {}
+            for doc_type, _ in self._docs:
+                counts[doc_type] = counts.get(doc_type, 0) + 1
+            return {"documents": len(self._docs), "tokens": len(self._postings), "by_type": counts}
+
+
+# A single index shared across the app
+search_index = SearchIndex()
@@ -1,13 +1,19 @@
 import json
 import os
 from Tools.utils.logger import logger
+from Tools.utils.fingerprint import DEFAULT_FINGERPRINT_PORTS
 
 # --- Configuration File ---
 CONFIG_FILE = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'config.json'))
 
 # --- Default Settings ---
 DEFAULT_SETTINGS = {
-    'log_retention_hours': 168  # Default to 7 days
+    'log_retention_hours': 168,  # Default to 7 days
+    'scan_rate_pps': 1000,  # Packets per second for masscan and the built-in SYN scanner
+    'fingerprint_ports': DEFAULT_FINGERPRINT_PORTS,  # TCP ports probed when fingerprinting discovered hosts
+    'ad_sync_interval_seconds': 300,  # How often the local AD replica pulls changes from the domain controller
+    'agent_poll_interval_seconds': 60,  # How often the background collector reads every Atlas agent
+    'agent_ingest_url': ''  # Base URL agents push metrics to (e.g. http://atlas-server:5000); empty = the address the browser uses
 }
 
 def _ensure_config_file():